@@ -27,7 +27,8 @@ def login():
         # Info host local
         host_info = obtener_ip_hostname()
         ip_local = host_info.get("ip_local", "")
-        hostname_local = host_info.get("hostname_local", "")
+        # None: el DNS inverso sigue pendiente y lo completa log_login_attempt
+        hostname_local = None if host_info.get("hostname_pendiente") else host_info.get("hostname_local", "")
 
         ip = get_client_ip()
         user_agent = request.headers.get("User-Agent", "")
@@ -1,8 +1,8 @@
 # routes/balizas.py
 from flask import Blueprint, jsonify
-from flask import render_template, request, redirect, url_for, abort, send_file, send_from_directory
+from flask import render_template, request, redirect, url_for, abort, send_from_directory
 from datetime import datetime
-import os, csv, uuid, shutil
+import os, uuid
 
 from utils.balizas import *
 from utils.tipos_y_eventos import *
@@ -11,10 +11,12 @@ from utils.servidores import *
 from utils.eventos import *
 from utils.auth import requiere_login
 from utils.balizas import cargar_baliza, guardar_evento_baliza
-from . import BALIZAS_EVENTOS_CSV
 from utils.utils import obtener_ip_real, obtener_ip_hostname, parse_user_agent
-from utils.geoip import geo_lookup
 from utils.tor_y_vpn import analyze_ip
+from utils.enriquecimiento import geo_inmediata, encolar_enriquecimiento
+from utils.dns_inverso import encolar_hostname
+from utils.pixel import responder_pixel
+from utils.html_baliza import responder_html
 
 #from utils.eventos import guardar_evento, cargar_eventos, siguiente_id
 #from utils.balizas import guardar_evento_baliza
@@ -108,15 +110,7 @@ def baliza_nueva():
         "servidor_url": servidor_obj["ruta"] if servidor_obj else ""   #    "servidor_url": servidor_url
     }
 
-    save_baliza(row)
-
-    try:
-        # target_png = os.path.join(BALIZAS_FOLDER, f"{baliza_id}.png")
-        target_png = os.path.join(BALIZAS_FOLDER, f"{origen}.png")
-        if os.path.exists(ORIGIN_PNG):
-            shutil.copyfile(ORIGIN_PNG, target_png)
-    except Exception as e:
-        app.logger.warning(f"No se pudo copiar origin.png para baliza {baliza_id}: {e}")
+    save_baliza(row)  # el píxel se sirve desde memoria: sin copiar origin.png
 
     return redirect(url_for("balizas.balizas"))
 
@@ -173,14 +167,6 @@ def baliza_eliminar(baliza_id):
     balizas_list = [b for b in balizas_list if b.get("id") != baliza_id]
     update_balizas_csv(balizas_list)
 
-    # borrar png asociado
-    png_path = os.path.join(BALIZAS_FOLDER, f"{baliza_id}.png")
-    try:
-        if os.path.exists(png_path):
-            os.remove(png_path)
-    except Exception as e:
-        app.logger.warning(f"No se pudo borrar {png_path}: {e}")
-
     return redirect(url_for("balizas.balizas"))
 
 
@@ -212,20 +198,15 @@ def baliza_stats(baliza_id):
 
     visitas = []
 
-    # Leer eventos de balizas y hacer matching por 'origen'
-    if os.path.exists(BALIZAS_EVENTOS_CSV):
-        with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for r in reader:
-                evento_uuid = str(r.get("origen", "")).strip().replace('"', '')
-                if evento_uuid == uuid_real:
-                    # opcional: limpiar campos para la plantilla
-                    r["timestamp"] = r.get("timestamp", "")
-                    r["ip"] = r.get("ip", "")
-                    r["country"] = r.get("country", "") or r.get("country_code", "") or "Desconocido"
-                    r["so"] = r.get("so", "")
-                    r["navegador"] = r.get("navegador", "")
-                    visitas.append(r)
+    # Leer eventos de balizas filtrando por 'origen' (indexado en el backend)
+    for r in iterar_eventos_baliza(origen=uuid_real):
+        # opcional: limpiar campos para la plantilla
+        r["timestamp"] = r.get("timestamp", "")
+        r["ip"] = r.get("ip", "")
+        r["country"] = r.get("country", "") or r.get("country_code", "") or "Desconocido"
+        r["so"] = r.get("so", "")
+        r["navegador"] = r.get("navegador", "")
+        visitas.append(r)
 
     # Ordenar visitas por timestamp descendente (siempre que el timestamp sea comparable como string ISO)
     try:
@@ -251,25 +232,36 @@ def baliza_stats(baliza_id):
 # ---------- RUTA: servir PNG y registrar visita ----------
 @balizas_bp.route("/balizas/png/<baliza_id>.png")
 def baliza_image(baliza_id):
-    png_path = os.path.join(BALIZAS_FOLDER, f"{baliza_id}.png")
-    if not os.path.exists(png_path):
+    if not existe_baliza(baliza_id):
         abort(404)
 
     # registrar evento
-    ensure_balizas_eventos_header()
-    ip = request.headers.get("X-Forwarded-For", request.remote_addr)
-    ua = request.headers.get("User-Agent", "")
-
-    with open(BALIZAS_EVENTOS_CSV, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([datetime.utcnow().replace(microsecond=0).isoformat() + "Z", baliza_id, ip, ua])
+    guardar_evento_baliza({
+        "id_num": siguiente_id(),
+        "timestamp": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        "origen": baliza_id,
+        "ip": request.headers.get("X-Forwarded-For", request.remote_addr),
+        "user_agent": request.headers.get("User-Agent", "")
+    })
 
-    return send_file(png_path, mimetype="image/png")
+    return responder_pixel(baliza_id)
 
 
 # --------- Ruta en Flask para servir archivos de baliza
 @balizas_bp.route("/balizas/files/<filename>")
 def baliza_files(filename):
+    # PNG y HTML ya no existen como ficheros por baliza: se sirven desde memoria
+    origen, extension = os.path.splitext(filename)
+    if extension == ".png":
+        if not existe_baliza(origen):
+            abort(404)
+        return responder_pixel(origen, adjunto=filename)
+    if extension == ".html":
+        respuesta = responder_html(origen, request.args.get("perfil"), adjunto=filename) \
+            if existe_baliza(origen) else None
+        if respuesta is None:
+            abort(404)
+        return respuesta
     return send_from_directory(BALIZAS_FOLDER, filename, as_attachment=True)
 
 
@@ -334,9 +326,9 @@ def baliza_png(baliza_id):
         abort(404)
 
 
-    # IP y entorno
+    # IP y entorno (geolocalización de caché; si falta, se rellena en segundo plano)
     ip_real = obtener_ip_real(request) or request.remote_addr
-    geo = geo_lookup(ip_real)
+    geo, geo_pendiente = geo_inmediata(ip_real)
 
     host = obtener_ip_hostname()
     ua_str = request.user_agent.string or ""
@@ -358,12 +350,10 @@ def baliza_png(baliza_id):
     #             else "INFO" if ev_upper in ("INFO","CHECK","OK")
     #             else "EVENT")
 
-    ip_intel = analyze_ip(ip_real.strip())
-
-    eventos = cargar_eventos()
+    ip_intel = analyze_ip(ip_real.strip(), geo=geo)
 
     evento = {
-        "id_num": siguiente_id(eventos),
+        "id_num": siguiente_id(),
         "timestamp": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
         "ip": ip_real.strip(),
         "tipo": tipo_val,
@@ -380,6 +370,7 @@ def baliza_png(baliza_id):
         "lat": geo.get("lat", "") or "",
         "lon": geo.get("lon", "") or "",
         "isp": (geo.get("isp") or "").strip().upper(),
+        "asn": geo.get("asn", "") or "",
         "ip_local": host.get("ip_local", ""),
         "hostname_local": host.get("hostname_local", ""),
         "fingerprint_id": request.cookies.get("fingerprint_id", "").strip(),
@@ -390,12 +381,11 @@ def baliza_png(baliza_id):
         # "flag_vpn": analyze_ip(ip_real.strip())["VPN"]
     }
 
-    guardar_evento(evento)
     guardar_evento_baliza(evento)
+    if geo_pendiente:
+        encolar_enriquecimiento(evento)
+    if host.get("hostname_pendiente"):
+        encolar_hostname(evento, host["ip_local"])
 
-    # Servir el PNG real
-    return send_from_directory(
-        directory="balizas",
-        path=f"{baliza_id}.png",
-        mimetype="image/png"
-    )
+    # Servir el píxel (buffer en memoria, 304 si el navegador ya lo tiene)
+    return responder_pixel(baliza_id)
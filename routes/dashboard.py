@@ -2,7 +2,9 @@ from flask import Blueprint, render_template, request, redirect, url_for
 from math import ceil
 
 from utils.auth import requiere_login
-from utils.eventos import cargar_eventos, guardar_eventos
+from utils.eventos import paginar_eventos, guardar_eventos, borrar_evento
+from utils.storage import get_backend
+from utils.utils import parametros_paginacion, enlaces_paginacion
 
 dashboard_bp = Blueprint("dashboard", __name__)
 
@@ -14,25 +16,16 @@ def dashboard():
     if not requiere_login():
         return redirect(url_for("auth.login"))
 
-    eventos = cargar_eventos()
-    eventos_ordenados = sorted(eventos, key=lambda x: x["timestamp"], reverse=True)
-
-    # Paginación
+    # Paginación por cursor (coste independiente de la página)
     PAG_SIZE = 25
-    pagina = int(request.args.get("page", 1))
-    total_paginas = max(1, ceil(len(eventos_ordenados)/PAG_SIZE))
-    inicio = (pagina-1)*PAG_SIZE
-    fin = inicio + PAG_SIZE
-    dashboard_rows = eventos_ordenados[inicio:fin]
-
-    paginas = list(range(1, total_paginas+1))
-    base_url = "/?"
+    cursores, pagina = parametros_paginacion()
+    dashboard_rows, total, cursor_antes, cursor_despues = paginar_eventos(tam_pagina=PAG_SIZE, **cursores)
+    total_paginas = max(1, ceil(total/PAG_SIZE))
+    pagina = min(max(1, pagina), total_paginas) if cursor_despues else 1
+    nav = enlaces_paginacion({}, pagina, total_paginas, cursor_antes, cursor_despues)
 
     # Conteo por tipo de evento (ASCII)
-    counts = {}
-    for e in eventos:
-        tipo = e.get("evento", "unknown")
-        counts[tipo] = counts.get(tipo, 0) + 1
+    counts = {(k or "unknown"): v for k, v in get_backend().contar_por("eventos", "evento").items()}
 
     labels = sorted(counts.keys())
     values = [counts[k] for k in labels]
@@ -50,9 +43,9 @@ def dashboard():
         "dashboard.html",
         dashboard_rows=dashboard_rows,
         ascii_chart=ascii_chart,
-        paginas=paginas,
         pagina=pagina,
-        base_url=base_url,
+        total_paginas=total_paginas,
+        nav=nav,
         current_page="dashboard"
     )
 
@@ -64,44 +57,41 @@ def admin():
     if not requiere_login():
         return redirect(url_for("auth.login"))
 
-    eventos = cargar_eventos()
-
     f_ip = request.args.get("ip", "all")
     f_evento = request.args.get("evento", "all")
     f_origen = request.args.get("origen", "all")
 
-    filtrados = [e for e in eventos
-                 if (f_ip=="all" or e["ip"]==f_ip) and
-                    (f_evento=="all" or e["evento"]==f_evento) and
-                    (f_origen=="all" or e["origen"]==f_origen)]
-
-    filtrados = sorted(filtrados, key=lambda x: x["timestamp"], reverse=True)
+    filtros = {campo: valor for campo, valor in
+               (("ip", f_ip), ("evento", f_evento), ("origen", f_origen))
+               if valor != "all"}
 
     PAG_SIZE = 25
-    pagina = int(request.args.get("page", 1))
-    total_paginas = max(1, ceil(len(filtrados)/PAG_SIZE))
-    inicio = (pagina-1)*PAG_SIZE
-    fin = inicio+PAG_SIZE
-    eventos_pagina = filtrados[inicio:fin]
-
-    ips = sorted({e["ip"] for e in eventos})
-    eventos_unicos = sorted({e["evento"] for e in eventos})
-    origenes = sorted({e["origen"] for e in eventos})
-    base_url = f"/admin?ip={f_ip}&evento={f_evento}&origen={f_origen}"
+    cursores, pagina = parametros_paginacion()
+    eventos_pagina, total, cursor_antes, cursor_despues = paginar_eventos(filtros, tam_pagina=PAG_SIZE, **cursores)
+    total_paginas = max(1, ceil(total/PAG_SIZE))
+    pagina = min(max(1, pagina), total_paginas) if cursor_despues else 1
+    nav = enlaces_paginacion({"ip": f_ip, "evento": f_evento, "origen": f_origen},
+                             pagina, total_paginas, cursor_antes, cursor_despues)
+
+    # Valores distintos precalculados (se mantienen al escribir)
+    backend = get_backend()
+    ips = backend.distintos("eventos", "ip")
+    eventos_unicos = backend.distintos("eventos", "evento")
+    origenes = backend.distintos("eventos", "origen")
 
     return render_template(
         "admin.html",
         current_page="admin",
         eventos_pagina=eventos_pagina,
         pagina=pagina,
-        paginas=list(range(1,total_paginas+1)),
+        total_paginas=total_paginas,
+        nav=nav,
         ips=ips,
         eventos=eventos_unicos,
         origenes=origenes,
         f_ip=f_ip,
         f_evento=f_evento,
-        f_origen=f_origen,
-        base_url=base_url
+        f_origen=f_origen
     )
 
 # ---------------------------
@@ -111,9 +101,7 @@ def admin():
 def delete_event(id_num):
     if not requiere_login():
         return redirect(url_for("auth.login"))
-    eventos = cargar_eventos()
-    eventos = [e for e in eventos if e["id_num"] != id_num]
-    guardar_eventos(eventos)
+    borrar_evento(id_num)
     return redirect(request.referrer or "/admin")
 
 # ---------------------------
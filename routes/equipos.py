@@ -1,12 +1,11 @@
 # routes/equipos.py
 from flask import Blueprint, render_template, jsonify, request, abort, redirect, url_for
-import os, json
 from utils.fingerprint_registry import (
-    listar_fingerprints,
     cargar_fingerprint,
     eventos_por_fingerprint,
-    correlacionar_fingerprints_balizas_desde_fps
 )
+from utils.manifiesto_fp import leer_manifiesto
+from utils.similitud_fp import INDICE_SIMILITUD
 #     correlacionar_fingerprints_balizas,
 #     correlacionar_fingerprints_balizas,
 from utils.auth import requiere_login
@@ -23,23 +22,22 @@ def equipos_dashboard():
     if not requiere_login():
         return redirect(url_for("login"))
 
-    fps = listar_fingerprints()
-    stats = correlacionar_fingerprints_balizas_desde_fps(fps)
+    # Resumen mantenido al capturar y al registrar visitas: no abre los
+    # JSON de los fingerprints ni recorre los eventos
+    manifiesto = leer_manifiesto()
+    INDICE_SIMILITUD.sincronizar(manifiesto)
 
     equipos = []
-    for fp_id, fp_data in fps.items():
-        latest = fp_data.get("latest", {})
-        s = stats.get(fp_id, {})
-
+    for fp_id, m in manifiesto.items():
         equipos.append({
             "id": fp_id,
-            "hash": latest.get("hash", {}).get("stable"),
-            "timestamp": formatear_timestamp_muestreo(latest.get("timestamp")),
-            "total_visitas": s.get("total_visitas", 0),
-            "balizas": s.get("balizas", {}),
-            "ultima_visita": s.get("ultima_visita"),
-            "source": latest.get("source", {}),
-            "score_vs_others": []
+            "hash": m.get("hash"),
+            "timestamp": formatear_timestamp_muestreo(m.get("last_seen")),
+            "total_visitas": m.get("visitas", 0),
+            "balizas": m.get("balizas", {}),
+            "ultima_visita": _a_datetime(m.get("ultima_visita")),
+            "source": m.get("source") or {},
+            "score_vs_others": INDICE_SIMILITUD.similares(fp_id)
         })
 
     return render_template(
@@ -53,13 +51,10 @@ def equipos_dashboard():
 # -----------------------------
 @equipos_bp.route("/equipos/<fingerprint_id>/json")
 def equipo_fingerprint_json(fingerprint_id):
-    path = os.path.join(FINGERPRINT_DIR, f"{fingerprint_id}.json")
-    if not os.path.exists(path):
+    data = cargar_fingerprint(fingerprint_id)
+    if not data:
         abort(404)
 
-    with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
     return jsonify(data)
 
 # -----------------------------
@@ -73,13 +68,27 @@ def equipo_detalle(fingerprint_id):
 
     eventos = eventos_por_fingerprint(fingerprint_id)
 
+    INDICE_SIMILITUD.sincronizar(leer_manifiesto())
+    similares = INDICE_SIMILITUD.similares(fingerprint_id)
+
     return render_template(
         "equipo_detalle.html",
         equipo=fp,
-        eventos=eventos
+        eventos=eventos,
+        similares=similares
     )
 
 
+def _a_datetime(ts: str):
+    """Timestamp ISO del manifiesto a datetime (None si falta o no es válido)."""
+    if not ts:
+        return None
+    try:
+        return datetime.fromisoformat(ts.replace("Z", ""))
+    except Exception:
+        return None
+
+
 def formatear_timestamp_muestreo(valor_utc: str) -> str:
     """
     Convierte un timestamp UTC ISO-8601 (con microsegundos) a formato
@@ -5,9 +5,11 @@ from datetime import datetime
 import uuid
 import json
 from utils.fingerprint import guardar_fingerprint
-from utils.eventos import cargar_eventos, guardar_evento, siguiente_id
+from utils.eventos import siguiente_id
 from utils.utils import obtener_ip_hostname, obtener_ip_real, parse_user_agent
-from utils.geoip import geo_lookup
+from utils.enriquecimiento import geo_inmediata, encolar_enriquecimiento
+from utils.dns_inverso import encolar_hostname
+from utils.tor_y_vpn import analyze_ip
 
 fingerprint_bp = Blueprint("fingerprint", __name__)
 
@@ -87,7 +89,8 @@ def collect_fingerprint_baliza():
 
     # 7. IP real y geolocalización
     ip_real = obtener_ip_real(request) or "N/A"
-    geo = geo_lookup(ip_real)
+    geo, geo_pendiente = geo_inmediata(ip_real)
+    ip_intel = analyze_ip(ip_real.strip(), geo=geo)
 
     origen = data.get("origen")
     baliza_id = data.get("baliza_id") or "N/A"  # <- capturamos el UUID real
@@ -98,7 +101,6 @@ def collect_fingerprint_baliza():
         return {"status": "error", "msg": "missing origen or fingerprint"}, 400
 
     from utils.fingerprint import guardar_fingerprint
-    from utils.eventos import guardar_evento
     from utils.balizas import guardar_evento_baliza
 
     # -------------------------------------------------------------
@@ -113,13 +115,12 @@ def collect_fingerprint_baliza():
         payload=fingerprint,
         source=source
     )
-    eventos = cargar_eventos()
 
     # -------------------------------------------------------------
     # 2. Crear evento de visita
     # -------------------------------------------------------------
     evento = {
-        "id_num": siguiente_id(eventos),
+        "id_num": siguiente_id(),
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "ip": request.remote_addr,
         "tipo": tipo_val,
@@ -136,13 +137,19 @@ def collect_fingerprint_baliza():
         "lat": geo.get("lat", ""),
         "lon": geo.get("lon", ""),
         "isp": geo.get("isp", ""),
+        "asn": geo.get("asn", ""),
         "ip_local": ip_local,
         "hostname_local": hostname_local,
-        "fingerprint_id": fingerprint_id
+        "fingerprint_id": fingerprint_id,
+        "flag_tor": bool(ip_intel.get("TOR", False)),
+        "flag_vpn": bool(ip_intel.get("VPN", False))
     }
 
-    guardar_evento(evento)         # eventos.csv
-    guardar_evento_baliza(evento)  # balizas_eventos.csv
+    guardar_evento_baliza(evento)  # una fila en eventos, marcada como de baliza
+    if geo_pendiente:
+        encolar_enriquecimiento(evento, ip=ip_real)
+    if host_info.get("hostname_pendiente"):
+        encolar_hostname(evento, ip_local)
 
     print(f"[BALIZA] Evento VIEW registrado para {origen} con fingerprint {fingerprint_id}")
 
@@ -1,10 +1,13 @@
 # routes/fingerprint_engines.py
 from flask import Blueprint, request, jsonify
 import csv, json
-import uuid
 from datetime import datetime
 
-FINGERPRINT_EVENTS_CSV = "data/fingerprint_events.csv"  # define ruta
+from utils.fingerprint_normalizer import normalize_engines, calculate_confidence
+from utils.motores_fp import identificar, registrar_motores
+from utils.bloqueo import bloqueo_fichero
+
+from . import FINGERPRINT_EVENTS_CSV
 
 fingerprint_engines_bp = Blueprint("fingerprint_engines", __name__)
 
@@ -12,7 +15,9 @@ fingerprint_engines_bp = Blueprint("fingerprint_engines", __name__)
 # Helpers internos
 # -----------------------
 def save_fingerprint_event(fp_id, baliza_id, timestamp, confidence, engines, metadata):
-    with open(FINGERPRINT_EVENTS_CSV, "a", encoding="utf-8", newline="") as f:
+    # Una fila con los motores puede superar el buffer: sin flock, dos workers la intercalarían
+    with bloqueo_fichero(FINGERPRINT_EVENTS_CSV), \
+            open(FINGERPRINT_EVENTS_CSV, "a", encoding="utf-8", newline="") as f:
         writer = csv.writer(f)
         writer.writerow([
             timestamp,
@@ -26,18 +31,6 @@ def save_fingerprint_event(fp_id, baliza_id, timestamp, confidence, engines, met
             metadata.get("platform")
         ])
 
-def normalize_engines(engines_raw):
-    # tu lógica aquí
-    return engines_raw
-
-def calculate_fp_id(engines, metadata):
-    # tu lógica aquí
-    return str(uuid.uuid4())
-
-def calculate_confidence(engines):
-    # tu lógica aquí
-    return 0.95
-
 # -----------------------
 # Endpoint
 # -----------------------
@@ -53,7 +46,9 @@ def collect_fingerprint_webhook():
     engines_raw = fingerprint.get("engines", {})
 
     engines = normalize_engines(engines_raw)
-    fp_id = calculate_fp_id(engines, metadata)
+    # Fingerprint conocido si algún motor coincide (búsquedas por motor)
+    fp_id, candidatos = identificar(engines_raw, metadata)
+    registrar_motores(fp_id, engines_raw)
     confidence = calculate_confidence(engines)
 
     save_fingerprint_event(
@@ -68,7 +63,8 @@ def collect_fingerprint_webhook():
     return jsonify({
         "status": "ok",
         "fp_id": fp_id,
-        "confidence": confidence
+        "confidence": confidence,
+        "candidatos": candidatos[:5]
     })
 
 
@@ -3,10 +3,8 @@
 # Blueprint SOC
 # =====================================
 
-import os
-import csv
 import json
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, request
 
 from datetime import datetime, timezone, timedelta
 
@@ -14,8 +12,18 @@ from utils.auth import requiere_login
 from utils.utils import formatear_timestamp_es
 from soc.behavior import soc_behavior_handler
 from utils.fingerprint_behavior import calculate_behavior
+from utils.identidad_fp import calculate_behavior_equipos, reconstruir as reconstruir_identidad
+from utils.balizas import iterar_eventos_baliza
+from utils.ip_intel import enrich_ip
+from utils.geoip import estadisticas_cache
+from utils.escritor_eventos import ESCRITOR_EVENTOS
 
-from . import BALIZAS_EVENTOS_CSV, FINGERPRINT_EVENTS_CSV
+from . import FINGERPRINT_EVENTS_CSV
+
+# Campos de balizas_eventos que usa la vista de fingerprint
+COLUMNAS_FINGERPRINT_VIEW = [
+    "timestamp", "ip", "isp", "asn", "payload", "origen", "user_agent", "flag_tor", "flag_vpn"
+]
 
 soc_bp = Blueprint("soc", __name__)
 
@@ -31,20 +39,25 @@ def soc_behavior():
 
 
 # -------------------------------------------------
-# Vista SOC Behavior
+# Vista SOC Behavior (?agrupar=equipo: una fila por equipo)
 # -------------------------------------------------
 @soc_bp.route("/soc/behavior/view", methods=["GET"])
 def soc_behavior_view():
     if not requiere_login():
         return "", 401
 
-    data, last_calc = calculate_behavior()
+    por_equipo = request.args.get("agrupar") == "equipo"
+    if por_equipo:
+        data, last_calc = calculate_behavior_equipos()
+    else:
+        data, last_calc = calculate_behavior()
     last_calc_str = last_calc.strftime("%Y-%m-%d %H:%M:%S UTC")
 
     return render_template(
         "soc_behavior.html",
         data=data,
         last_calc=last_calc_str,
+        por_equipo=por_equipo,
         current_page="soc"
     )
 
@@ -58,6 +71,7 @@ def soc_behavior_refresh():
         return "", 401
 
     _, last_calc = calculate_behavior(force=True)
+    reconstruir_identidad()
     last_calc_str = last_calc.strftime("%Y-%m-%d %H:%M:%S UTC")
 
     return jsonify({
@@ -67,6 +81,28 @@ def soc_behavior_refresh():
 
 
 
+# -------------------------------------------------
+# Estado de la caché GeoIP (aciertos / fallos / desalojos)
+# -------------------------------------------------
+@soc_bp.route("/soc/geoip/cache", methods=["GET"])
+def soc_geoip_cache():
+    if not requiere_login():
+        return "", 401
+
+    return jsonify(estadisticas_cache())
+
+
+# -------------------------------------------------
+# Escritor de eventos por lotes (cola, lotes y latencia de volcado)
+# -------------------------------------------------
+@soc_bp.route("/soc/escritor", methods=["GET"])
+def soc_escritor():
+    if not requiere_login():
+        return "", 401
+
+    return jsonify(ESCRITOR_EVENTOS.estadisticas())
+
+
 @soc_bp.route("/soc/fingerprint/<fp_id>", methods=["GET"])
 def soc_fingerprint_view(fp_id):
     if not requiere_login():
@@ -78,51 +114,46 @@ def soc_fingerprint_view(fp_id):
     vpn = False
     dt_list = []  # Para calcular ventana en segundos correctamente
 
-    if os.path.exists(BALIZAS_EVENTOS_CSV):
-        with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                if row.get("fingerprint_id") != fp_id:
-                    continue
-
-                ip = row.get("ip", "").strip()
-                isp = (row.get("isp") or "").strip().upper()
-                tor_flag = _to_bool(row.get("flag_tor"))
-                vpn_flag = _to_bool(row.get("flag_vpn"))
-
-                tor |= tor_flag
-                vpn |= vpn_flag
-
-                ip_stats.setdefault(ip, {
-                    "count": 0,
-                    "asn": row.get("asn"),
-                    "org": isp,
-                    "TOR": False,
-                    "VPN": False
-                })
-                ip_stats[ip]["count"] += 1
-                ip_stats[ip]["TOR"] |= tor_flag
-                ip_stats[ip]["VPN"] |= vpn_flag
-
-                # Parse timestamp UTC para cálculo
+    for row in iterar_eventos_baliza(COLUMNAS_FINGERPRINT_VIEW, fingerprint_id=fp_id):
+        ip = row.get("ip", "").strip()
+        isp = (row.get("isp") or "").strip().upper()
+        tor_flag = _to_bool(row.get("flag_tor"))
+        vpn_flag = _to_bool(row.get("flag_vpn"))
+
+        tor |= tor_flag
+        vpn |= vpn_flag
+
+        ip_stats.setdefault(ip, {
+            "count": 0,
+            "asn": row.get("asn"),
+            "org": isp,
+            "TOR": False,
+            "VPN": False
+        })
+        ip_stats[ip]["count"] += 1
+        ip_stats[ip]["TOR"] |= tor_flag
+        ip_stats[ip]["VPN"] |= vpn_flag
+
+        # Parse timestamp UTC para cálculo
+        ts_obj = None
+        if row.get("timestamp"):
+            try:
+                ts_obj = datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00"))
+                dt_list.append(ts_obj)
+            except Exception:
                 ts_obj = None
-                if row.get("timestamp"):
-                    try:
-                        ts_obj = datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00"))
-                        dt_list.append(ts_obj)
-                    except Exception:
-                        ts_obj = None
-
-                timeline.append({
-                    "timestamp": formatear_timestamp_es(row.get("timestamp")) if row.get("timestamp") else "N/A",
-                    "ts_obj": ts_obj,  # Guardamos datetime para cálculo
-                    "baliza": row.get("payload") or row.get("origen"),
-                    "ip": ip,
-                    "asn": row.get("asn"),
-                    "org": isp,
-                    "TOR": tor_flag,
-                    "VPN": vpn_flag,
-                    "user_agent": row.get("user_agent")
-                })
+
+        timeline.append({
+            "timestamp": formatear_timestamp_es(row.get("timestamp")) if row.get("timestamp") else "N/A",
+            "ts_obj": ts_obj,  # Guardamos datetime para cálculo
+            "baliza": row.get("payload") or row.get("origen"),
+            "ip": ip,
+            "asn": row.get("asn"),
+            "org": isp,
+            "TOR": tor_flag,
+            "VPN": vpn_flag,
+            "user_agent": row.get("user_agent")
+        })
 
     timeline.sort(key=lambda x: x["ts_obj"] or datetime.min, reverse=True)
 
@@ -330,12 +361,7 @@ def soc_fingerprint_view(fp_id):
 
 @soc_bp.route("/soc/fingerprint/<fp_id>/timeline")
 def soc_fingerprint_timeline(fp_id):
-    events = []
-    with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("fingerprint_id") == fp_id:
-                events.append(row)
+    events = list(iterar_eventos_baliza(fingerprint_id=fp_id))
 
     events.sort(key=lambda x: x["timestamp"])
 
@@ -350,12 +376,9 @@ def soc_fingerprint_timeline(fp_id):
 def soc_fingerprint_network(fp_id):
     ips = set()
 
-    with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("fingerprint_id") == fp_id:
-                if row.get("ip"):
-                    ips.add(row["ip"])
+    for row in iterar_eventos_baliza(["ip"], fingerprint_id=fp_id):
+        if row.get("ip"):
+            ips.add(row["ip"])
 
     enriched = [enrich_ip(ip) for ip in ips]
 
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# Las pruebas importan los paquetes del proyecto (utils, routes) como la app
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import storage
+from utils.storage import CsvBackend, TABLAS_FISICAS
+
+
+@pytest.fixture
+def backend_activo():
+    """Permite sustituir el backend en una prueba y lo restaura al terminar."""
+    anterior = storage._BACKEND
+    yield storage.set_backend
+    storage.set_backend(anterior)
+
+
+class CsvContado(CsvBackend):
+    """CsvBackend que cuenta las reescrituras de actualizar_muchos()."""
+
+    def __init__(self, rutas):
+        super().__init__(rutas)
+        self.reescrituras = 0
+
+    def actualizar_muchos(self, tabla, cambios_por_id):
+        self.reescrituras += 1
+        return super().actualizar_muchos(tabla, cambios_por_id)
+
+
+@pytest.fixture
+def csv_contado(tmp_path, backend_activo):
+    """Backend CSV activo en tmp_path que cuenta sus reescrituras."""
+    backend = CsvContado({t: str(tmp_path / f"{t}.csv") for t in TABLAS_FISICAS})
+    backend_activo(backend)
+    return backend
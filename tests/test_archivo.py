@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.parquet as pq
+
+from utils import archivo
+from utils.storage import CsvBackend, SqliteBackend, TABLAS_FISICAS, EVENTO_FIELDS
+
+
+@pytest.fixture(params=["sqlite", "csv"])
+def backend(request, tmp_path, monkeypatch, backend_activo):
+    monkeypatch.setattr(archivo, "ARCHIVO_DIR", str(tmp_path / "archivo"))
+    if request.param == "sqlite":
+        nuevo = SqliteBackend(str(tmp_path / "faro.db"), importar_csv=False)
+    else:
+        nuevo = CsvBackend({t: str(tmp_path / f"{t}.csv") for t in TABLAS_FISICAS})
+    backend_activo(nuevo)
+    return nuevo
+
+
+def _evento(i: int) -> dict:
+    return {"id_num": i, "timestamp": f"2020-01-{i % 28 + 1:02d} 10:00:00",
+            "evento": "VIEW", "origen": "o", "fingerprint_id": f"fp{i % 5}"}
+
+
+def _poblar(backend, n: int = 150):
+    """n eventos; uno de cada tres es una visita a baliza."""
+    for i in range(1, n + 1):
+        backend.append("balizas_eventos" if i % 3 == 0 else "eventos", _evento(i))
+
+
+def test_compactar_vista_y_tabla_fisica_archiva_cada_evento_una_vez(backend):
+    _poblar(backend)
+
+    r = archivo.compactar("balizas_eventos", dias=0, backend=backend)
+    assert (r["archivadas"], r["borradas"]) == (50, 50)
+    assert backend.contar("eventos") == 100
+    assert backend.contar("balizas_eventos") == 0
+
+    r = archivo.compactar("eventos", dias=0, backend=backend)
+    assert (r["archivadas"], r["borradas"]) == (100, 100)
+    assert backend.contar("eventos") == 0
+
+    assert sum(p["filas"] for p in archivo.estado("eventos")) == 150
+    assert not os.path.exists(os.path.join(archivo.ARCHIVO_DIR, "balizas_eventos"))
+    assert archivo.contar_por("balizas_eventos", "origen") == {"o": 50}
+    assert archivo.contar_por("eventos", "origen") == {"o": 150}
+    # Visitas con fp0: múltiplos de 15, a través del índice lateral
+    assert len(list(archivo.iterar("balizas_eventos", {"fingerprint_id": "fp0"}))) == 10
+
+
+def test_archivo_antiguo_de_la_vista_se_fusiona_con_su_marca(backend):
+    # La copia de eventos de la visita 1 ya estaba archivada (sin marca)
+    archivo._escribir_particion("eventos", "2020-01-02", [_evento(1)])
+    # Archivo anterior a la unificación: data/archivo/balizas_eventos sin la columna baliza
+    antiguo = [c for c in EVENTO_FIELDS if c != "baliza"]
+    esquema = pa.schema([(c, pa.string()) for c in antiguo])
+    ruta = os.path.join(archivo.ARCHIVO_DIR, "balizas_eventos", "fecha=2020-01-02")
+    os.makedirs(ruta)
+    filas = [{c: str(_evento(i).get(c, "")) for c in antiguo} for i in (1, 29)]
+    pq.write_table(pa.Table.from_pylist(filas, schema=esquema), os.path.join(ruta, archivo.FICHERO_PARTICION))
+
+    visitas = sorted(f["id_num"] for f in archivo.iterar("balizas_eventos"))
+    assert visitas == ["1", "29"]
+    assert sum(p["filas"] for p in archivo.estado("eventos")) == 2
+    assert os.path.isdir(os.path.join(archivo.ARCHIVO_DIR, "balizas_eventos.fusionado"))
@@ -0,0 +1,21 @@
+import time
+
+from utils.actualizaciones import ActualizacionesDiferidas
+from utils.dns_inverso import ResolvedorDns
+
+
+def test_csv_agrupa_los_hostnames_en_una_reescritura(csv_contado):
+    resolvedor = ResolvedorDns(buscar=lambda ip: f"host-{ip.rsplit('.', 1)[1]}.example",
+                               espera_lote=0.01,
+                               actualizaciones=ActualizacionesDiferidas(intervalo=3600))
+    for i in range(1, 13):
+        evento = {"id_num": i, "timestamp": "2020-01-01 10:00:00", "evento": "VIEW"}
+        csv_contado.append("eventos", evento)
+        resolvedor.rellenar(evento, f"198.51.100.{i}")
+        if i % 4 == 0:
+            time.sleep(0.1)  # cada tanda forma su propio lote de escritura
+
+    assert resolvedor.esperar(timeout=10)
+    assert csv_contado.reescrituras == 1
+    filas = sorted(csv_contado.iterar("eventos"), key=lambda f: int(f["id_num"]))
+    assert [f["hostname_local"] for f in filas] == [f"host-{i}.example" for i in range(1, 13)]
@@ -0,0 +1,31 @@
+from utils import enriquecimiento
+from utils.actualizaciones import ActualizacionesDiferidas
+from utils.enriquecimiento import Enriquecedor
+
+
+def _geo(ips):
+    return {ip: {"country": "Spain", "country_code": "ES", "city": "Madrid", "isp": "acme"} for ip in ips}
+
+
+def test_geo_inmediata_no_consulta_la_api_en_la_ingesta(csv_contado, monkeypatch):
+    monkeypatch.setattr(enriquecimiento, "geo_sin_red", lambda ip: None)
+    assert enriquecimiento.geo_inmediata("203.0.113.7") == ({}, True)
+
+
+def test_csv_agrupa_los_lotes_en_una_reescritura(csv_contado):
+    enriquecedor = Enriquecedor(resolver=_geo, hilos=2, lote=3, espera=0.01,
+                                actualizaciones=ActualizacionesDiferidas(intervalo=3600))
+    for i in range(1, 13):
+        evento = {"id_num": i, "timestamp": "2020-01-01 10:00:00", "evento": "VIEW",
+                  "ip": f"203.0.113.{i}"}
+        csv_contado.append("eventos", evento)
+        enriquecedor.encolar(evento)
+
+    enriquecedor._cola.join()
+    assert csv_contado.reescrituras == 0  # lotes resueltos, pendientes de escribir
+
+    enriquecedor.esperar()
+    assert csv_contado.reescrituras == 1
+    filas = list(csv_contado.iterar("eventos"))
+    assert len(filas) == 12
+    assert all(f["country_code"] == "ES" and f["isp"] == "ACME" for f in filas)
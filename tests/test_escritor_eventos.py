@@ -0,0 +1,63 @@
+import threading
+import time
+
+from utils.escritor_eventos import EscritorLotes
+
+
+class BackendLento:
+    """Backend mínimo: guarda los id_num escritos y tarda un poco por lote."""
+
+    def __init__(self, espera: float = 0.002):
+        self.espera = espera
+        self.escritos = set()
+        self._lock = threading.Lock()
+
+    def append_tablas(self, filas_por_tabla: dict, durable: bool = False):
+        time.sleep(self.espera)
+        with self._lock:
+            for filas in filas_por_tabla.values():
+                self.escritos.update(f["id_num"] for f in filas)
+
+
+def test_vaciar_vuelve_con_productores_constantes(backend_activo):
+    backend = BackendLento()
+    backend_activo(backend)
+    escritor = EscritorLotes(lote=8, espera_ms=5, profundidad=10000)
+    parar = threading.Event()
+
+    def producir(n):
+        i = 0
+        while not parar.is_set():
+            escritor.escribir("eventos", {"id_num": f"{n}-{i}"}, esperar=False)
+            i += 1
+            time.sleep(0.0005)
+
+    productores = [threading.Thread(target=producir, args=(n,), daemon=True) for n in range(4)]
+    for hilo in productores:
+        hilo.start()
+    try:
+        time.sleep(0.05)
+        escritor.escribir("eventos", {"id_num": "objetivo"}, esperar=False)
+        t0 = time.monotonic()
+        escritor.vaciar()
+        duracion = time.monotonic() - t0
+        escrito = "objetivo" in backend.escritos
+    finally:
+        parar.set()
+        for hilo in productores:
+            hilo.join()
+        escritor.vaciar()  # nada pendiente para el backend de la siguiente prueba
+
+    assert escrito
+    assert duracion < 2
+
+
+def test_vaciar_sin_filas_pendientes(backend_activo):
+    backend = BackendLento()
+    backend_activo(backend)
+    escritor = EscritorLotes(lote=8, espera_ms=5)
+    escritor.escribir("eventos", {"id_num": 1}, esperar=True)
+    escritor.vaciar()
+    escritor.vaciar()
+    assert backend.escritos == {1}
+    assert escritor.estadisticas()["filas"] == 1
@@ -0,0 +1,70 @@
+"""
+Compacta los eventos de baliza antiguos en el archivo Parquet (data/archivo).
+
+Pensado para ejecutarse periódicamente (cron / systemd timer):
+    python tools/archivar_eventos.py compactar             # > FARO_ARCHIVO_DIAS (30)
+    python tools/archivar_eventos.py compactar --dias 7
+    python tools/archivar_eventos.py estado
+    python tools/archivar_eventos.py reindexar             # regenera el índice fingerprint_id -> fechas
+
+Requiere pyarrow (pip install pyarrow).
+"""
+import os
+import sys
+import time
+import argparse
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import archivo, ARCHIVO_DIAS
+from utils.storage import TABLAS
+
+
+def cmd_compactar(tabla, dias):
+    t0 = time.perf_counter()
+    r = archivo.compactar(tabla, dias)
+    print(f"[+] {tabla}: eventos anteriores a {r['hasta']}")
+    print(f"    leídos {r['leidas']}, archivados {r['archivadas']}, borrados del backend {r['borradas']}")
+    print(f"    particiones: {len(r['particiones'])} en {time.perf_counter() - t0:.1f}s")
+
+
+def cmd_estado(tabla):
+    particiones = archivo.estado(tabla)
+    if not particiones:
+        print(f"[=] {tabla}: archivo vacío")
+        return
+    for p in particiones:
+        print(f"{p['fecha']}  {p['filas'] or '?':>10} filas  {p['bytes'] / 1024:10.1f} KiB")
+    total = sum(p["bytes"] for p in particiones)
+    print(f"[=] {tabla}: {len(particiones)} particiones, {total / 1024 / 1024:.1f} MiB")
+
+
+def cmd_reindexar(tabla):
+    t0 = time.perf_counter()
+    for campo, pares in archivo.reindexar(tabla).items():
+        print(f"[+] {tabla}: índice {campo} -> fechas con {pares} pares")
+    print(f"    en {time.perf_counter() - t0:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("accion", choices=["compactar", "estado", "reindexar"])
+    parser.add_argument("--tabla", default="balizas_eventos", choices=list(TABLAS))
+    parser.add_argument("--dias", type=int, default=ARCHIVO_DIAS,
+                        help="Antigüedad mínima (días) de los eventos a archivar")
+    args = parser.parse_args()
+
+    if not archivo.disponible():
+        parser.error("pyarrow no está instalado (pip install pyarrow)")
+
+    if args.accion == "compactar":
+        cmd_compactar(args.tabla, args.dias)
+    elif args.accion == "reindexar":
+        cmd_reindexar(args.tabla)
+    else:
+        cmd_estado(args.tabla)
+
+
+if __name__ == "__main__":
+    main()
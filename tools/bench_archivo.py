@@ -0,0 +1,128 @@
+"""
+Benchmark del archivo Parquet de balizas_eventos.
+
+Genera N eventos sintéticos repartidos en varios meses y compara:
+- tamaño en disco: CSV frente a Parquet (zstd + diccionario)
+- recálculo completo de calculate_behavior(force=True):
+    csv      -> CsvBackend (relectura del CSV como texto)
+    sqlite   -> todo el histórico en SQLite
+    archivo  -> histórico compactado en Parquet (lectura columnar)
+
+Uso:
+    python tools/bench_archivo.py
+    python tools/bench_archivo.py --filas 2000000
+"""
+import os
+import sys
+import csv
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import archivo
+import utils.fingerprint_behavior as behavior
+from utils.storage import EVENTO_FIELDS, CsvBackend, SqliteBackend, importar_csv, set_backend
+
+UAS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+    "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+]
+GEO = [
+    ("Spain", "ES", "Madrid", "Madrid", 40.4, -3.7, "TELEFONICA DE ESPANA"),
+    ("Spain", "ES", "Catalonia", "Barcelona", 41.4, 2.2, "VODAFONE SPAIN"),
+    ("France", "FR", "Ile-de-France", "Paris", 48.9, 2.3, "ORANGE S.A."),
+    ("Germany", "DE", "Hesse", "Frankfurt", 50.1, 8.7, "DEUTSCHE TELEKOM AG"),
+]
+
+
+def generar_csv(path: str, filas: int, dias: int = 180):
+    random.seed(1)
+    origenes = [f"baliza-{i:04d}" for i in range(300)]
+    fps = [f"fp_{i:016x}" for i in range(20000)]
+    inicio = datetime.utcnow() - timedelta(days=dias)
+    paso = dias * 86400 / filas
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=EVENTO_FIELDS)
+        writer.writeheader()
+        for i in range(1, filas + 1):
+            country, cc, region, city, lat, lon, isp = random.choice(GEO)
+            ua = random.choice(UAS)
+            ip = f"198.51.{random.randrange(256)}.{random.randrange(256)}"
+            writer.writerow({
+                "id_num": i,
+                "timestamp": (inicio + timedelta(seconds=i * paso)).isoformat() + "Z",
+                "ip": ip, "tipo": "INFO", "evento": "VIEW",
+                "origen": random.choice(origenes), "payload": "PNG",
+                "so": "Windows 10", "navegador": "Chrome 120.0", "user_agent": ua,
+                "country": country, "country_code": cc, "region": region, "city": city,
+                "lat": lat, "lon": lon, "isp": isp,
+                "ip_local": ip, "hostname_local": "No disponible",
+                "fingerprint_id": random.choice(fps) if i % 2 == 0 else "",
+                "flag_tor": random.random() < 0.01, "flag_vpn": random.random() < 0.05,
+            })
+
+
+def tamano_dir(ruta: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(ruta) for f in fs)
+
+
+def medir_behavior(nombre: str, repeticiones: int = 3) -> float:
+    mejor = None
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        resultados, _ = behavior.calculate_behavior(force=True)
+        s = time.perf_counter() - t0
+        mejor = s if mejor is None else min(mejor, s)
+    print(f"{nombre:<40} {mejor:8.2f} s   ({len(resultados)} fingerprints)")
+    return mejor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1000000)
+    args = parser.parse_args()
+
+    if not archivo.disponible():
+        parser.error("pyarrow no está instalado (pip install pyarrow)")
+
+    tmpdir = tempfile.mkdtemp(prefix="faro_bench_")
+    try:
+        # Redirigir el archivo a una ruta temporal
+        archivo.ARCHIVO_DIR = os.path.join(tmpdir, "archivo")
+
+        csv_path = os.path.join(tmpdir, "balizas_eventos.csv")
+        generar_csv(csv_path, args.filas)
+        print(f"[*] {args.filas} eventos generados\n")
+
+        set_backend(CsvBackend({"balizas_eventos": csv_path}))
+        t_csv = medir_behavior("calculate_behavior (CSV)", repeticiones=1)
+
+        backend = SqliteBackend(os.path.join(tmpdir, "faro.db"), importar_csv=False)
+        importar_csv(backend, "balizas_eventos", csv_path)
+        set_backend(backend)
+        t_sqlite = medir_behavior("calculate_behavior (SQLite)")
+
+        r = archivo.compactar("balizas_eventos", dias=0, backend=backend)
+        print(f"[*] compactados {r['archivadas']} eventos en {len(r['particiones'])} particiones\n")
+        t_archivo = medir_behavior("calculate_behavior (archivo Parquet)")
+
+        csv_bytes = os.path.getsize(csv_path)
+        pq_bytes = tamano_dir(archivo.ARCHIVO_DIR)
+        print(f"\n{'disco CSV':<40} {csv_bytes / 1024 / 1024:8.1f} MiB")
+        print(f"{'disco Parquet':<40} {pq_bytes / 1024 / 1024:8.1f} MiB   ({csv_bytes / pq_bytes:.1f}x menos)")
+        print(f"{'recálculo frente a CSV':<40} {t_csv / t_archivo:8.1f}x")
+        print(f"{'recálculo frente a SQLite':<40} {t_sqlite / t_archivo:8.1f}x")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark de consultas paginadas (offset frente a cursor) sobre el backend SQLite.
+
+Genera una base de datos temporal con N eventos sintéticos y mide
+las consultas que usan el dashboard, /admin y la vista SOC.
+
+Uso:
+    python tools/bench_consultas.py
+    python tools/bench_consultas.py --filas 10000000
+"""
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.storage import SqliteBackend, _cursor
+
+EVENTOS = ["VIEW", "OPEN", "CLICK", "ERROR", "CHECK"]
+
+
+def generar(backend: SqliteBackend, filas: int, lote: int = 50000):
+    random.seed(1)
+    origenes = [f"baliza-{i:04d}" for i in range(500)]
+    fps = [f"fp_{i:016x}" for i in range(20000)]
+    inicio = datetime(2024, 1, 1)
+
+    def fila(i):
+        ts = (inicio + timedelta(seconds=i * 3)).isoformat() + "Z"
+        return {
+            "id_num": i, "timestamp": ts,
+            "ip": f"198.51.{random.randrange(256)}.{random.randrange(256)}",
+            "tipo": "INFO", "evento": random.choice(EVENTOS),
+            "origen": random.choice(origenes), "payload": "PNG",
+            "fingerprint_id": random.choice(fps) if i % 3 == 0 else "",
+            "flag_tor": False, "flag_vpn": False,
+        }
+
+    i = 1
+    while i <= filas:
+        fin = min(filas, i + lote - 1)
+        backend.append_many("eventos", [fila(n) for n in range(i, fin + 1)])
+        i = fin + 1
+
+
+def cursor_en(backend: SqliteBackend, offset: int, filtros_sql: str = "", valores=()):
+    """Cursor de la fila en la posición `offset` (para simular una página profunda)."""
+    fila = backend._conexion().execute(
+        f'SELECT "timestamp", rowid FROM eventos{filtros_sql} '
+        f'ORDER BY "timestamp" DESC, rowid DESC LIMIT 1 OFFSET ?', (*valores, offset)
+    ).fetchone()
+    return _cursor(fila[0], fila[1])
+
+
+def medir(nombre, fn, repeticiones=20):
+    fn()  # calentamiento
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    ms = (time.perf_counter() - t0) * 1000 / repeticiones
+    print(f"{nombre:<45} {ms:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1000000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="faro_bench_")
+    try:
+        backend = SqliteBackend(os.path.join(tmpdir, "faro.db"), importar_csv=False)
+        t0 = time.perf_counter()
+        generar(backend, args.filas)
+        backend.optimizar()
+        print(f"[*] {args.filas} eventos generados en {time.perf_counter() - t0:.1f}s\n")
+
+        muestra = backend.ultimas("eventos", 1)[0]
+        profunda = (args.filas // 25 // 2) * 25
+        c_profunda = cursor_en(backend, profunda - 1)
+        medir("página 1 (sin filtros)", lambda: backend.paginar("eventos", limite=25))
+        medir("página 100 (offset)", lambda: backend.consultar("eventos", limite=25, offset=2475))
+        medir(f"página {profunda // 25 + 1} (offset)", lambda: backend.consultar("eventos", limite=25, offset=profunda))
+        medir(f"página {profunda // 25 + 1} (cursor)", lambda: backend.paginar("eventos", limite=25, antes=c_profunda))
+        medir("última página (cursor)", lambda: backend.paginar("eventos", limite=25, ultima=True))
+        medir("filtro ip, página 1", lambda: backend.paginar("eventos", {"ip": muestra["ip"]}, limite=25))
+        medir("filtro origen, página 1", lambda: backend.paginar("eventos", {"origen": muestra["origen"]}, limite=25))
+        c_origen = cursor_en(backend, 499, ' WHERE "origen" = ?', (muestra["origen"],))
+        medir("filtro origen, página 21 (cursor)",
+              lambda: backend.paginar("eventos", {"origen": muestra["origen"]}, limite=25, antes=c_origen))
+        medir("total filtrado por origen", lambda: backend.contar("eventos", {"origen": muestra["origen"]}))
+        medir("filtro origen + evento, página 1",
+              lambda: backend.paginar("eventos", {"origen": muestra["origen"], "evento": "VIEW"}, limite=25))
+        medir("listas de filtros /admin (ip, evento, origen)",
+              lambda: [backend.distintos("eventos", c) for c in ("ip", "evento", "origen")])
+        medir("eventos de un fingerprint",
+              lambda: list(backend.iterar("eventos", {"fingerprint_id": "fp_0000000000000003"})))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark de ingesta de eventos: latencia por hit frente al tamaño de eventos.csv.
+
+Compara:
+- actual:  siguiente_id() (contador persistente) + guardar_evento()
+- legacy:  cargar_eventos() + max(id_num) + guardar_evento()  (solo tamaños pequeños)
+
+Uso:
+    python tools/bench_event_store.py
+    python tools/bench_event_store.py --sizes 1000,100000,1000000,10000000 --hits 500
+    python tools/bench_event_store.py --backend csv
+"""
+import os
+import sys
+import csv
+import time
+import shutil
+import argparse
+import tempfile
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.eventos as eventos
+from utils.event_store import IdCounter
+from utils.storage import EVENTO_FIELDS, CsvBackend, SqliteBackend, importar_csv, set_backend
+
+UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+
+def evento_demo(id_num: int) -> dict:
+    return {
+        "id_num": id_num,
+        "timestamp": "2025-01-01T00:00:00Z",
+        "ip": "203.0.113.7",
+        "tipo": "INFO",
+        "evento": "VIEW",
+        "origen": "9717a49a-3679-42b3-87f5-840c3f20d128",
+        "payload": "PNG",
+        "so": "Windows 10",
+        "navegador": "Chrome 120.0",
+        "user_agent": UA,
+        "country": "Spain",
+        "country_code": "ES",
+        "region": "Madrid",
+        "city": "Madrid",
+        "lat": 40.4,
+        "lon": -3.7,
+        "isp": "EXAMPLE ISP",
+        "ip_local": "203.0.113.7",
+        "hostname_local": "No disponible",
+        "fingerprint_id": "",
+        "flag_tor": False,
+        "flag_vpn": False,
+    }
+
+
+def generar_csv(path: str, filas: int):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=EVENTO_FIELDS)
+        writer.writeheader()
+        for i in range(1, filas + 1):
+            writer.writerow(evento_demo(i))
+
+
+def preparar_backend(tipo: str, tmpdir: str, filas: int):
+    """Crea un backend temporal con `filas` eventos precargados."""
+    csv_path = os.path.join(tmpdir, "eventos.csv")
+    generar_csv(csv_path, filas)
+    if tipo == "csv":
+        return CsvBackend({"eventos": csv_path})
+
+    db_path = os.path.join(tmpdir, "faro.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    backend = SqliteBackend(db_path, importar_csv=False)
+    importar_csv(backend, "eventos", csv_path)
+    return backend
+
+
+def medir(hits: int, legacy: bool) -> float:
+    """Devuelve la latencia media por hit en milisegundos."""
+    t0 = time.perf_counter()
+    for _ in range(hits):
+        if legacy:
+            todos = eventos.cargar_eventos()
+            id_num = max((e["id_num"] for e in todos), default=0) + 1
+        else:
+            id_num = eventos.siguiente_id()
+        eventos.guardar_evento(evento_demo(id_num))
+    return (time.perf_counter() - t0) * 1000 / hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="Tamaños de eventos.csv separados por comas")
+    parser.add_argument("--hits", type=int, default=200, help="Eventos a insertar por tamaño")
+    parser.add_argument("--backend", choices=["sqlite", "csv"], default="sqlite")
+    parser.add_argument("--legacy-max", type=int, default=100000,
+                        help="Tamaño máximo para medir el modo legacy (es O(n) por hit)")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    tmpdir = tempfile.mkdtemp(prefix="faro_bench_")
+
+    print(f"{'filas':>12} | {'actual ms/hit':>14} | {'legacy ms/hit':>14}")
+    print("-" * 48)
+    try:
+        for size in sizes:
+            seq_path = os.path.join(tmpdir, "eventos.seq")
+            if os.path.exists(seq_path):
+                os.remove(seq_path)
+
+            # Redirigir el módulo a un backend y contador temporales
+            backend = preparar_backend(args.backend, tmpdir, size)
+            set_backend(backend)
+            eventos.CONTADOR_EVENTOS = IdCounter(seq_path, lambda: backend.max_id("eventos"))
+
+            actual = medir(args.hits, legacy=False)
+            legacy = "-"
+            if size <= args.legacy_max:
+                legacy = f"{medir(max(1, args.hits // 10), legacy=True):14.3f}"
+
+            print(f"{size:>12} | {actual:14.3f} | {legacy:>14}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
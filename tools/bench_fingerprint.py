@@ -0,0 +1,98 @@
+"""
+Benchmark de la búsqueda de eventos de un fingerprint (vistas /soc/fingerprint).
+
+Genera N eventos de baliza sintéticos y mide:
+- CSV:     recorrido completo frente al índice de offsets (<csv>.fingerprint_id.idx)
+- SQLite:  índice (fingerprint_id, timestamp)
+- Parquet: todas las particiones frente al índice lateral fingerprint_id -> fechas
+
+Uso:
+    python tools/bench_fingerprint.py
+    python tools/bench_fingerprint.py --filas 5000000
+"""
+import os
+import sys
+import csv
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import archivo
+from utils.storage import TABLAS, CsvBackend, SqliteBackend, importar_csv
+
+TABLA = "balizas_eventos"
+UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+
+def generar_csv(ruta: str, filas: int, fps: int):
+    """Eventos repartidos en ~90 días; cada fingerprint aparece ~filas/fps veces."""
+    random.seed(1)
+    inicio = datetime(2024, 1, 1)
+    paso = 90 * 86400 / filas
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TABLAS[TABLA]["campos"], extrasaction="ignore")
+        writer.writeheader()
+        for i in range(1, filas + 1):
+            writer.writerow({
+                "id_num": i,
+                "timestamp": (inicio + timedelta(seconds=i * paso)).isoformat() + "Z",
+                "ip": f"198.51.{random.randrange(256)}.{random.randrange(256)}",
+                "evento": "VIEW", "origen": f"baliza-{random.randrange(200):04d}",
+                "user_agent": UA, "country": "Spain", "isp": "EXAMPLE ISP",
+                "fingerprint_id": f"fp_{random.randrange(fps):016x}",
+            })
+
+
+def medir(nombre, fn, repeticiones=5):
+    t0 = time.perf_counter()
+    n = len(list(fn()))  # primera ejecución (incluye carga / construcción del índice)
+    primera = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    for _ in range(repeticiones):
+        list(fn())
+    ms = (time.perf_counter() - t0) * 1000 / repeticiones
+    print(f"{nombre:<42} {ms:10.2f} ms  (primera {primera:9.1f} ms, {n} filas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=1000000)
+    parser.add_argument("--fingerprints", type=int, default=50000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="faro_bench_")
+    try:
+        ruta = os.path.join(tmpdir, "balizas_eventos.csv")
+        t0 = time.perf_counter()
+        generar_csv(ruta, args.filas, args.fingerprints)
+        print(f"[*] {args.filas} eventos generados en {time.perf_counter() - t0:.1f}s\n")
+        fp = "fp_" + f"{7:016x}"
+        filtro = {"fingerprint_id": fp}
+
+        backend = CsvBackend({TABLA: ruta})
+        medir("CSV recorrido completo",
+              lambda: (f for f in backend.iterar(TABLA) if f["fingerprint_id"] == fp), repeticiones=1)
+        medir("CSV índice de offsets", lambda: backend.iterar(TABLA, filtro))
+
+        sqlite = SqliteBackend(os.path.join(tmpdir, "faro.db"), importar_csv=False)
+        importar_csv(sqlite, TABLA, ruta)
+        medir("SQLite índice (fingerprint_id, timestamp)", lambda: sqlite.iterar(TABLA, filtro))
+
+        if archivo.disponible():
+            archivo.ARCHIVO_DIR = os.path.join(tmpdir, "archivo")
+            archivo.compactar(TABLA, dias=-1, backend=sqlite)
+            medir("Parquet índice lateral (fechas)", lambda: archivo.iterar(TABLA, filtro))
+            os.remove(archivo._ruta_indice(TABLA, "fingerprint_id"))
+            medir("Parquet todas las particiones", lambda: archivo.iterar(TABLA, filtro))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark de la puntuación por lotes de fingerprints (utils/puntuacion_fp.py).
+
+Genera N fingerprints sintéticos con las señales de la política y mide:
+- uno contra N (vectorizado con NumPy si está instalado);
+- una matriz muchos contra muchos (--matriz filas x columnas);
+- comparar_fingerprints pareja a pareja, como referencia.
+
+Antes comprueba sobre --verificar parejas aleatorias que score y
+confianza coinciden exactamente con comparar_fingerprints.
+
+Uso:
+    python tools/bench_puntuacion.py
+    python tools/bench_puntuacion.py --fingerprints 1000000 --matriz 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.puntuacion_fp import MatrizFingerprints, politica_compilada, disponible, NIVELES
+from utils.fingerprint_registry import comparar_fingerprints
+
+VALORES = {
+    "platform": ["Win32"] * 6 + ["MacIntel"] * 2 + ["Linux x86_64", "iPhone"],
+    "browser": ["Chrome"] * 6 + ["Firefox", "Safari", "Edge", None],
+    "timezone": ["Europe/Madrid"] * 5 + ["Europe/London", "America/New_York", "Asia/Tokyo", None],
+    "deviceMemory": ["8", "8", "4", "16", "2", None],
+    "screenResolution": ["1920x1080", "1920x1080", "1366x768", "2560x1440", "390x844", None],
+}
+
+
+def generar(n: int, equipos: int) -> list:
+    """Señales de n fingerprints; visitorId repartido entre `equipos` valores."""
+    random.seed(1)
+    fps = []
+    for _ in range(n):
+        senales = {clave: random.choice(valores) for clave, valores in VALORES.items()}
+        senales["visitorId"] = f"v{random.randrange(equipos):x}"
+        fps.append({c: v for c, v in senales.items() if v is not None})
+    return fps
+
+
+def documento(senales: dict) -> dict:
+    return {"signals": {"core": senales}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fingerprints", type=int, default=1000000)
+    parser.add_argument("--matriz", type=int, default=1000, help="Filas y columnas de la matriz muchos-contra-muchos")
+    parser.add_argument("--verificar", type=int, default=20000)
+    args = parser.parse_args()
+
+    politica = politica_compilada()
+    print(f"[*] NumPy: {'sí' if disponible() else 'no (bucles de Python)'}; política {politica.politica}")
+
+    t0 = time.perf_counter()
+    fps = generar(args.fingerprints, max(1, args.fingerprints // 3))
+    matriz = MatrizFingerprints(politica, capacidad=len(fps))
+    for i, senales in enumerate(fps):
+        matriz.anadir(f"fp_{i}", senales)
+    print(f"[*] {len(matriz)} fingerprints codificados en {time.perf_counter() - t0:.1f}s\n")
+
+    # Verificación frente a comparar_fingerprints
+    random.seed(3)
+    muestra = min(len(fps), 1000)
+    parcial = MatrizFingerprints(politica)
+    for i in range(muestra):
+        parcial.anadir(f"fp_{i}", fps[i])
+    scores = parcial.todos_contra_todos()
+    niveles = politica.niveles(scores)
+    diferencias = 0
+    for _ in range(args.verificar):
+        i, j = random.randrange(muestra), random.randrange(muestra)
+        esperado = comparar_fingerprints(documento(fps[i]), documento(fps[j]))
+        if int(scores[i][j]) != esperado["score"] or NIVELES[int(niveles[i][j])] != esperado["confidence"]:
+            diferencias += 1
+    print(f"[=] {args.verificar} parejas comparadas con comparar_fingerprints: {diferencias} diferencias\n")
+
+    consulta = fps[0]
+    t0 = time.perf_counter()
+    repeticiones = 5
+    for _ in range(repeticiones):
+        scores = matriz.uno_contra_todos(consulta)
+        politica.niveles(scores)
+    t_uno = (time.perf_counter() - t0) / repeticiones
+    print(f"{'uno contra ' + str(len(matriz)):<32} {t_uno * 1e3:10.1f} ms")
+
+    filas = matriz.copiar_vacia()
+    for i in range(min(args.matriz, len(fps))):
+        filas.anadir(f"fp_{i}", fps[i])
+    columnas = filas.copiar_vacia()
+    for i in range(min(args.matriz, len(fps)), min(2 * args.matriz, len(fps))):
+        columnas.anadir(f"fp_{i}", fps[i])
+    t0 = time.perf_counter()
+    filas.todos_contra_todos(columnas)
+    t_matriz = time.perf_counter() - t0
+    parejas = len(filas) * len(columnas)
+    print(f"{f'matriz {len(filas)} x {len(columnas)}':<32} {t_matriz * 1e3:10.1f} ms "
+          f"({parejas / t_matriz:,.0f} parejas/s)")
+
+    n = 2000
+    t0 = time.perf_counter()
+    doc = documento(consulta)
+    for i in range(n):
+        comparar_fingerprints(doc, documento(fps[i]))
+    t_pareja = (time.perf_counter() - t0) / n
+    print(f"{'comparar_fingerprints (pareja)':<32} {t_pareja * 1e6:10.1f} µs "
+          f"(~{t_pareja * len(matriz):.1f}s para uno contra {len(matriz)})")
+
+
+if __name__ == "__main__":
+    main()
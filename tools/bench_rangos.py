@@ -0,0 +1,111 @@
+"""
+Benchmark de la clasificación de IPs cloud / hosting / VPN.
+
+Genera ficheros de rangos sintéticos con el formato de los proveedores
+(AWS ip-ranges.json, Azure ServiceTags, GCP cloud.json, CSV de hosting)
+y compara, para N IPs:
+- trie de prefijos (utils/rangos_ip.py), sin red;
+- palabras clave sobre el ISP (isp_es_vpn), que además necesita el ISP
+  de cada IP (geolocalización, aquí ya resuelta);
+- comprobación lineal con ipaddress, como referencia de resultados.
+
+Uso:
+    python tools/bench_rangos.py
+    python tools/bench_rangos.py --ips 100000 --prefijos 60000
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import ipaddress
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.rangos_ip import ClasificadorRangos, leer_rangos
+from utils.tor_y_vpn import isp_es_vpn
+
+ISPS = ["TELEFONICA DE ESPANA", "VODAFONE SPAIN", "AMAZON.COM, INC.", "DIGITALOCEAN, LLC",
+        "ORANGE ESPAGNE", "MICROSOFT CORPORATION", "HETZNER ONLINE GMBH", "COMCAST CABLE"]
+
+
+def red_aleatoria(longitudes=(16, 18, 20, 22, 24, 24, 24)):
+    longitud = random.choice(longitudes)
+    direccion = random.getrandbits(32) >> (32 - longitud) << (32 - longitud)
+    return ipaddress.ip_network((direccion, longitud))
+
+
+def generar(directorio: str, prefijos: int):
+    random.seed(1)
+    n = prefijos // 4
+    aws = {"prefixes": [{"ip_prefix": str(red_aleatoria()), "region": "eu-west-1", "service": "EC2"} for _ in range(n)],
+           "ipv6_prefixes": [{"ipv6_prefix": f"2600:1f{random.randrange(16):x}{random.randrange(16):x}::/36", "service": "EC2"}
+                             for _ in range(200)]}
+    azure = {"values": [{"name": f"AzureCloud.region{i}", "properties": {
+        "addressPrefixes": [str(red_aleatoria()) for _ in range(n // 100)]}} for i in range(100)]}
+    gcp = {"prefixes": [{"ipv4Prefix": str(red_aleatoria()), "scope": "europe-west1"} for _ in range(n)]}
+    with open(os.path.join(directorio, "aws.json"), "w") as f:
+        json.dump(aws, f)
+    with open(os.path.join(directorio, "azure.json"), "w") as f:
+        json.dump(azure, f)
+    with open(os.path.join(directorio, "gcp.json"), "w") as f:
+        json.dump(gcp, f)
+    with open(os.path.join(directorio, "hetzner.csv"), "w") as f:
+        f.write("cidr,categoria\n")
+        for _ in range(n):
+            f.write(f"{red_aleatoria((24, 26, 28))},hosting\n")
+
+
+def medir(nombre, fn, ips):
+    t0 = time.perf_counter()
+    positivos = sum(1 for ip in ips if fn(ip))
+    s = time.perf_counter() - t0
+    print(f"{nombre:<40} {len(ips) / s:12,.0f} IPs/s  {s / len(ips) * 1e6:7.2f} µs/IP  ({positivos} marcadas)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ips", type=int, default=100000)
+    parser.add_argument("--prefijos", type=int, default=40000)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="faro_bench_")
+    try:
+        generar(tmpdir, args.prefijos)
+        clasificador = ClasificadorRangos(tmpdir)
+        t0 = time.perf_counter()
+        estado = clasificador.estado()
+        print(f"[*] {estado['prefijos_ipv4']} prefijos IPv4 / {estado['prefijos_ipv6']} IPv6 "
+              f"cargados en {time.perf_counter() - t0:.2f}s\n")
+
+        random.seed(2)
+        ips = [str(ipaddress.IPv4Address(random.getrandbits(32))) for _ in range(args.ips)]
+        isp = {ip: random.choice(ISPS) for ip in ips}
+
+        medir("trie de prefijos (rangos_ip)", clasificador.clasificar, ips)
+        medir("palabras clave isp_es_vpn (ISP ya conocido)", lambda ip: isp_es_vpn(isp[ip]), ips)
+
+        # Comprobación de resultados frente a una búsqueda lineal
+        redes = []
+        for nombre in os.listdir(tmpdir):
+            redes += [red for red, _, _ in leer_rangos(os.path.join(tmpdir, nombre)) if red.version == 4]
+        muestra = ips[:100]
+        t0 = time.perf_counter()
+        esperado = [max((r for r in redes if ipaddress.ip_address(ip) in r), key=lambda r: r.prefixlen, default=None)
+                    for ip in muestra]
+        lineal = (time.perf_counter() - t0) / len(muestra)
+        obtenido = [clasificador.clasificar(ip) for ip in muestra]
+        errores = sum(1 for e, o in zip(esperado, obtenido) if (e is None) != (o is None)
+                      or (e is not None and e.prefixlen != ipaddress.ip_network(o["red"]).prefixlen))
+        print(f"{'búsqueda lineal (ipaddress)':<40} {1 / lineal:12,.0f} IPs/s  {lineal * 1e6:7.0f} µs/IP")
+        print(f"\n[=] {len(muestra)} IPs comprobadas contra la búsqueda lineal: {errores} diferencias")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
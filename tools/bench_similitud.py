@@ -0,0 +1,109 @@
+"""
+Benchmark del índice de similitud entre fingerprints (utils/similitud_fp.py).
+
+Genera N fingerprints sintéticos (señales de la política con
+distribuciones realistas: muchos Win32 / Chrome / Europe/Madrid) en
+grupos de capturas del mismo equipo con alguna señal cambiada, y compara
+para una muestra de consultas:
+- índice por bloques: candidatos que comparten bloque y top-k;
+- fuerza bruta (todas las parejas), como referencia de resultados.
+
+Uso:
+    python tools/bench_similitud.py
+    python tools/bench_similitud.py --fingerprints 100000 --consultas 500
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.similitud_fp import IndiceSimilitud, puntuar
+from utils.fingerprint_policy import load_fingerprint_policy
+
+VALORES = {
+    "platform": [("Win32", 60), ("MacIntel", 20), ("Linux x86_64", 10), ("iPhone", 6), ("Linux armv8l", 4)],
+    "browser": [("Chrome", 65), ("Firefox", 12), ("Safari", 12), ("Edge", 9), ("Opera", 2)],
+    "timezone": [("Europe/Madrid", 55), ("Europe/London", 10), ("America/New_York", 10),
+                 ("Europe/Berlin", 10), ("America/Mexico_City", 10), ("Asia/Tokyo", 5)],
+    "deviceMemory": [("8", 50), ("4", 25), ("16", 15), ("2", 10)],
+    "screenResolution": [("1920x1080", 40), ("1366x768", 15), ("2560x1440", 10), ("1536x864", 10),
+                         ("390x844", 10), ("1440x900", 10), ("3840x2160", 5)],
+}
+
+
+def elegir(clave):
+    valores, pesos = zip(*VALORES[clave])
+    return random.choices(valores, pesos)[0]
+
+
+def generar(n: int) -> dict:
+    """{fp_id: señales}: equipos con 1-4 capturas, cada una con una señal cambiada."""
+    random.seed(1)
+    fps = {}
+    equipo = 0
+    while len(fps) < n:
+        equipo += 1
+        base = {clave: elegir(clave) for clave in VALORES}
+        base["visitorId"] = f"v{equipo:08x}"
+        fps[f"fp_{equipo:08x}_0"] = base
+        for j in range(1, random.choice((1, 1, 2, 3, 4))):
+            variante = dict(base)
+            clave = random.choice(list(VALORES) + ["visitorId"])
+            variante[clave] = f"v{equipo:08x}_{j}" if clave == "visitorId" else elegir(clave)
+            fps[f"fp_{equipo:08x}_{j}"] = variante
+    return dict(list(fps.items())[:n])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fingerprints", type=int, default=20000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    politica = load_fingerprint_policy()
+    medio = politica["confidence_levels"]["MEDIUM"]
+    fps = generar(args.fingerprints)
+
+    indice = IndiceSimilitud()
+    manifiesto = {fp: {"senales": s} for fp, s in fps.items()}
+    t0 = time.perf_counter()
+    indice.sincronizar(manifiesto, politica)
+    t_indice = time.perf_counter() - t0
+    print(f"[*] {len(fps)} fingerprints indexados en {t_indice:.2f}s "
+          f"({t_indice / len(fps) * 1e6:.0f} µs/fingerprint)")
+    print(f"[*] {indice.estadisticas()}\n")
+
+    random.seed(2)
+    consultas = random.sample(list(fps), min(args.consultas, len(fps)))
+
+    t0 = time.perf_counter()
+    candidatos = 0
+    resultados = {}
+    for fp in consultas:
+        candidatos += len(indice.candidatos(fp))
+        resultados[fp] = indice.similares(fp, args.k)
+    t_indice_consulta = (time.perf_counter() - t0) / len(consultas)
+
+    t0 = time.perf_counter()
+    relevantes = encontrados = 0
+    for fp in consultas:
+        exactos = {otro for otro, s in fps.items()
+                   if otro != fp and puntuar(fps[fp], s, politica)["score"] >= medio}
+        relevantes += len(exactos)
+        encontrados += len(exactos & indice.candidatos(fp))
+    t_bruta = (time.perf_counter() - t0) / len(consultas)
+
+    print(f"{'bloques (candidatos + top-k)':<30} {t_indice_consulta * 1e3:9.2f} ms/consulta  "
+          f"({candidatos / len(consultas):.0f} candidatos de media)")
+    print(f"{'fuerza bruta':<30} {t_bruta * 1e3:9.2f} ms/consulta")
+    print(f"\n[=] Recall de parejas con score >= {medio} (MEDIUM): "
+          f"{encontrados}/{relevantes} ({encontrados / max(relevantes, 1):.1%})")
+
+
+if __name__ == "__main__":
+    main()
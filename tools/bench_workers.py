@@ -0,0 +1,139 @@
+"""
+Benchmark de ingesta con varios procesos (como los workers de gunicorn).
+
+Cada worker es un proceso con --hilos hilos que simulan visitas a una
+baliza: siguiente_id() + la fila de balizas_eventos (vista de eventos)
+esperando a que su lote sea durable. Todos comparten el mismo contador
+(eventos.seq) y el mismo almacenamiento temporal.
+
+Para cada número de workers mide visitas/s y comprueba al final que los
+id_num escritos son únicos y consecutivos (1..total) en eventos y en la
+vista de balizas.
+
+Uso:
+    python tools/bench_workers.py
+    python tools/bench_workers.py --workers 1,2,4,8 --hits 2000 --backend csv
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import utils.eventos as eventos
+from utils.event_store import IdCounter
+from utils.escritor_eventos import ESCRITOR_EVENTOS, escribir_evento
+from utils.storage import CsvBackend, SqliteBackend, set_backend
+
+TABLAS = ("eventos", "balizas_eventos")
+
+
+def crear_backend(tipo: str, tmpdir: str):
+    if tipo == "csv":
+        return CsvBackend({"eventos": os.path.join(tmpdir, "eventos.csv")})
+    return SqliteBackend(os.path.join(tmpdir, "faro.db"), importar_csv=False)
+
+
+def preparar_proceso(tipo: str, tmpdir: str):
+    """Backend y contador del proceso, sobre el almacenamiento compartido."""
+    backend = crear_backend(tipo, tmpdir)
+    set_backend(backend)
+    eventos.CONTADOR_EVENTOS = IdCounter(os.path.join(tmpdir, "eventos.seq"),
+                                         lambda: backend.max_id("eventos"))
+    return backend
+
+
+def visita(id_num: int):
+    evento = {
+        "id_num": id_num,
+        "timestamp": "2025-01-01T00:00:00Z",
+        "ip": "203.0.113.7",
+        "tipo": "INFO",
+        "evento": "VIEW",
+        "origen": "9717a49a-3679-42b3-87f5-840c3f20d128",
+        "payload": "PNG",
+    }
+    escribir_evento("balizas_eventos", eventos.preparar_evento(evento), esperar=True)
+
+
+def worker(tipo: str, tmpdir: str, hilos: int, hits: int, barrera):
+    preparar_proceso(tipo, tmpdir)
+    # Calentar conexión, hilo escritor y contador antes de medir
+    eventos.CONTADOR_EVENTOS.actual()
+
+    def hilo(n):
+        for _ in range(n):
+            visita(eventos.siguiente_id())
+
+    reparto = [hits // hilos + (1 if i < hits % hilos else 0) for i in range(hilos)]
+    barrera.wait()
+    ts = [threading.Thread(target=hilo, args=(n,)) for n in reparto]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    ESCRITOR_EVENTOS.vaciar()
+    barrera.wait()
+
+
+def medir(tipo: str, workers: int, hilos: int, hits: int) -> tuple:
+    """(visitas/s, errores de verificación) con `workers` procesos."""
+    tmpdir = tempfile.mkdtemp(prefix="faro_workers_")
+    try:
+        preparar_proceso(tipo, tmpdir).contar("eventos")  # crea el esquema antes del fork
+        contexto = multiprocessing.get_context("fork")
+        barrera = contexto.Barrier(workers + 1)
+        procesos = [contexto.Process(target=worker, args=(tipo, tmpdir, hilos, hits, barrera))
+                    for _ in range(workers)]
+        for p in procesos:
+            p.start()
+        barrera.wait()
+        t0 = time.perf_counter()
+        barrera.wait()
+        segundos = time.perf_counter() - t0
+        for p in procesos:
+            p.join()
+
+        backend = crear_backend(tipo, tmpdir)
+        total = workers * hits
+        errores = []
+        for tabla in TABLAS:
+            ids = [int(f["id_num"]) for f in backend.iterar(tabla)]
+            if len(ids) != total:
+                errores.append(f"{tabla}: {len(ids)} filas (esperadas {total})")
+            if len(set(ids)) != len(ids):
+                errores.append(f"{tabla}: {len(ids) - len(set(ids))} id_num duplicados")
+            if set(ids) != set(range(1, total + 1)):
+                errores.append(f"{tabla}: los id_num no son 1..{total}")
+        return total / segundos, errores
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,2,4,8", help="Números de procesos separados por comas")
+    parser.add_argument("--hilos", type=int, default=4, help="Hilos por worker")
+    parser.add_argument("--hits", type=int, default=1000, help="Visitas por worker")
+    parser.add_argument("--backend", choices=["sqlite", "csv"], default="sqlite")
+    args = parser.parse_args()
+
+    print(f"[*] backend {args.backend}, {args.hilos} hilos y {args.hits} visitas por worker, "
+          f"{os.cpu_count()} CPU\n")
+    print(f"{'workers':>8} | {'visitas/s':>10} | {'x 1 worker':>10} | verificación")
+    print("-" * 60)
+    base = None
+    for n in [int(w) for w in args.workers.split(",") if w.strip()]:
+        tasa, errores = medir(args.backend, n, args.hilos, args.hits)
+        base = base or tasa
+        print(f"{n:>8} | {tasa:10.0f} | {tasa / base:10.2f} | {'; '.join(errores) or 'OK'}")
+
+
+if __name__ == "__main__":
+    main()
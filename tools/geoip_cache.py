@@ -0,0 +1,45 @@
+"""
+Mantenimiento de la caché GeoIP (data/geoip_cache.db).
+
+    python tools/geoip_cache.py estado     # entradas, negativas y caducadas en disco
+    python tools/geoip_cache.py purgar     # borra las entradas caducadas
+    python tools/geoip_cache.py vaciar     # borra toda la caché
+
+Los contadores de aciertos / fallos / desalojos son de cada proceso:
+los de la aplicación se consultan en /soc/geoip/cache.
+"""
+import os
+import sys
+import argparse
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.geoip import CACHE_GEO
+
+
+def cmd_estado():
+    stats = CACHE_GEO.estadisticas()
+    print(f"[=] {CACHE_GEO.db_path}")
+    print(f"    {stats['disco']} entradas ({stats['disco_negativas']} negativas, "
+          f"{stats['disco_caducadas']} caducadas)")
+    print(f"    LRU en memoria: hasta {stats['maximo']} IPs por proceso")
+    print(f"    caducidad: {stats['ttl']}s, negativas {stats['ttl_negativo']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("accion", choices=["estado", "purgar", "vaciar"])
+    args = parser.parse_args()
+
+    if args.accion == "purgar":
+        print(f"[+] {CACHE_GEO.purgar()} entradas caducadas borradas")
+    elif args.accion == "vaciar":
+        CACHE_GEO.vaciar()
+        print("[+] Caché vaciada")
+    else:
+        cmd_estado()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Copia local de los nodos de salida TOR (data/tor_exit_addresses.txt).
+
+La aplicación la carga al arrancar y la refresca en segundo plano; esta
+herramienta sirve para crearla antes del primer arranque o desde cron en
+despliegues sin salida a internet desde los workers (FARO_TOR_EXITS_URL="").
+
+    python tools/lista_tor.py actualizar
+    python tools/lista_tor.py actualizar --url https://check.torproject.org/exit-addresses
+    python tools/lista_tor.py estado
+    python tools/lista_tor.py comprobar 185.220.101.1
+"""
+import os
+import sys
+import time
+import argparse
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils import TOR_EXITS_URL
+from utils.tor_y_vpn import LISTA_TOR
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("accion", choices=["actualizar", "estado", "comprobar"])
+    parser.add_argument("ips", nargs="*")
+    parser.add_argument("--url", default=TOR_EXITS_URL or "https://check.torproject.org/exit-addresses")
+    args = parser.parse_args()
+
+    if args.accion == "actualizar":
+        LISTA_TOR.url = args.url
+        t0 = time.perf_counter()
+        n = LISTA_TOR.descargar()
+        print(f"[+] {n} nodos de salida guardados en {LISTA_TOR.ruta} ({time.perf_counter() - t0:.1f}s)")
+        return
+
+    LISTA_TOR.refresco = 0  # sin hilo de refresco: solo la copia local
+    LISTA_TOR.cargar()
+    if args.accion == "comprobar":
+        for ip in args.ips:
+            print(f"{ip:<40} {'TOR' if LISTA_TOR.contiene(ip) else '-'}")
+        return
+
+    antiguedad = LISTA_TOR.antiguedad()
+    if antiguedad == float("inf"):
+        print(f"[=] {LISTA_TOR.ruta}: no existe")
+    else:
+        print(f"[=] {LISTA_TOR.ruta}: {len(LISTA_TOR)} IPs, actualizada hace {antiguedad / 60:.0f} min")
+
+
+if __name__ == "__main__":
+    main()
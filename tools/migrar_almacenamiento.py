@@ -0,0 +1,78 @@
+"""
+Migración entre los CSV históricos y el backend SQLite (data/faro.db).
+
+Uso:
+    python tools/migrar_almacenamiento.py importar            # CSV -> SQLite (tablas vacías)
+    python tools/migrar_almacenamiento.py importar --reemplazar
+    python tools/migrar_almacenamiento.py exportar            # SQLite -> CSV (sobrescribe los CSV)
+    python tools/migrar_almacenamiento.py exportar --destino /tmp/export
+    python tools/migrar_almacenamiento.py estado
+
+Tablas: eventos, login_attempts (por defecto, ambas) y balizas_eventos
+(vista de eventos: importarla fusiona un CSV antiguo de visitas a balizas
+en eventos; exportarla vuelca solo esas filas).
+"""
+import os
+import sys
+import time
+import argparse
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.storage import TABLAS, TABLAS_FISICAS, SqliteBackend, importar_csv, exportar_csv
+
+
+def cmd_importar(backend, tablas, reemplazar):
+    for tabla in tablas:
+        existentes = backend.contar(tabla)
+        if existentes and not reemplazar:
+            print(f"[=] {tabla}: ya contiene {existentes} filas (usa --reemplazar para reimportar)")
+            continue
+        t0 = time.perf_counter()
+        n = importar_csv(backend, tabla, reemplazar=reemplazar)
+        print(f"[+] {tabla}: {n} filas importadas desde {TABLAS[tabla]['csv']} en {time.perf_counter() - t0:.1f}s")
+
+
+def cmd_exportar(backend, tablas, destino):
+    for tabla in tablas:
+        ruta = TABLAS[tabla]["csv"]
+        if destino:
+            os.makedirs(destino, exist_ok=True)
+            ruta = os.path.join(destino, os.path.basename(ruta))
+        t0 = time.perf_counter()
+        n = exportar_csv(backend, tabla, ruta)
+        print(f"[+] {tabla}: {n} filas exportadas a {ruta} en {time.perf_counter() - t0:.1f}s")
+
+
+def cmd_estado(backend, tablas):
+    for tabla in tablas:
+        print(f"{tabla:>16}: {backend.contar(tabla)} filas (max id_num {backend.max_id(tabla)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("accion", choices=["importar", "exportar", "estado"])
+    parser.add_argument("--tablas", default=",".join(TABLAS_FISICAS), help="Tablas separadas por comas")
+    parser.add_argument("--reemplazar", action="store_true", help="Vaciar la tabla SQLite antes de importar")
+    parser.add_argument("--destino", help="Directorio de exportación (por defecto, los CSV originales)")
+    args = parser.parse_args()
+
+    tablas = [t.strip() for t in args.tablas.split(",") if t.strip()]
+    for tabla in tablas:
+        if tabla not in TABLAS:
+            parser.error(f"tabla desconocida: {tabla}")
+
+    # Sin importación automática: la herramienta decide qué se importa
+    backend = SqliteBackend(importar_csv=False)
+
+    if args.accion == "importar":
+        cmd_importar(backend, tablas, args.reemplazar)
+    elif args.accion == "exportar":
+        cmd_exportar(backend, tablas, args.destino)
+    else:
+        cmd_estado(backend, tablas)
+
+
+if __name__ == "__main__":
+    main()
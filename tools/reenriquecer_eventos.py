@@ -0,0 +1,168 @@
+"""
+Re-enriquecimiento histórico de los eventos: geolocalización (MaxMind /
+caché GeoIP), flag_tor (lista TOR actual) y flag_vpn (rangos de
+data/rangos + ISP). Los flags se calculan en la ingesta y no cambian
+después; esta herramienta los recalcula con las listas actuales.
+
+1. Recorre las tablas una vez y reúne las IPs distintas (con su ISP).
+2. Resuelve cada IP una sola vez en un pool de procesos.
+3. Reescribe las columnas enriquecidas en una pasada por tabla (CSV) o
+   en una transacción (SQLite); solo se tocan las filas que cambian.
+4. Reconstruye los agregados de comportamiento por fingerprint (con el
+   backend CSV la aplicación los recalcula al reiniciarse).
+
+Los eventos ya archivados en Parquet (data/archivo) no se modifican.
+
+Uso:
+    python tools/reenriquecer_eventos.py
+    python tools/reenriquecer_eventos.py --tabla balizas_eventos --procesos 8
+    python tools/reenriquecer_eventos.py --solo-flags      # sin tocar la geolocalización
+    python tools/reenriquecer_eventos.py --red             # IPs sin geo local: API por lotes
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Añadir la ruta del proyecto al path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from utils.storage import get_backend
+from utils.geoip import geo_sin_red, geo_lookup_lote, API_BATCH_MAX
+from utils.enriquecimiento import CAMPOS_GEO, TABLAS_BALIZA
+from utils.tor_y_vpn import LISTA_TOR, flags_ip
+from utils.rangos_ip import CLASIFICADOR_RANGOS
+from utils.fingerprint_behavior import reconstruir
+from utils.identidad_fp import reconstruir as reconstruir_identidad
+
+BLOQUE = 2000            # IPs por tarea del pool
+PAUSA_API = 60 / 15      # límite del endpoint batch gratuito de ip-api (15 peticiones/min)
+
+
+def _cambios_geo(geo: dict):
+    """Columnas geográficas con el formato de la ingesta, o None si geo está vacía."""
+    if not geo or not any(geo.get(c) for c in CAMPOS_GEO):
+        return None
+    cambios = {c: geo.get(c) for c in CAMPOS_GEO}
+    cambios["isp"] = (geo.get("isp") or "").strip().upper()
+    return cambios
+
+
+def _cambios_ip(ip: str, isp: str, con_geo: bool) -> dict:
+    cambios = (_cambios_geo(geo_sin_red(ip)) if con_geo else None) or {}
+    tor, vpn = flags_ip(ip, cambios.get("isp", isp))
+    cambios.update(flag_tor=tor, flag_vpn=vpn)
+    return cambios
+
+
+def _resolver_bloque(args):
+    bloque, con_geo = args
+    return [(ip, _cambios_ip(ip, isp, con_geo)) for ip, isp in bloque]
+
+
+def recoger_ips(tablas) -> dict:
+    """{ip: isp} de todas las filas de `tablas` (una pasada por tabla)."""
+    ips = {}
+    for tabla in tablas:
+        t0 = time.perf_counter()
+        n = 0
+        for fila in get_backend().iterar(tabla, columnas=["ip", "isp"]):
+            n += 1
+            ip = (fila.get("ip") or "").strip()
+            if ip and not ips.get(ip):
+                ips[ip] = fila.get("isp") or ""
+            if n % 1000000 == 0:
+                print(f"    {tabla}: {n} filas ({n / (time.perf_counter() - t0):,.0f} filas/s)")
+        s = time.perf_counter() - t0
+        print(f"[+] {tabla}: {n} filas leídas en {s:.1f}s ({n / max(s, 1e-9):,.0f} filas/s)")
+    return ips
+
+
+def resolver(ips: dict, procesos: int, con_geo: bool) -> dict:
+    """{ip: cambios} resolviendo cada IP una vez, en `procesos` procesos."""
+    pares = list(ips.items())
+    bloques = [(pares[i:i + BLOQUE], con_geo) for i in range(0, len(pares), BLOQUE)]
+    resultado = {}
+    t0 = time.perf_counter()
+
+    def progreso(hechas):
+        s = time.perf_counter() - t0
+        print(f"    {hechas}/{len(pares)} IPs ({hechas / max(s, 1e-9):,.0f} IPs/s)")
+
+    if procesos <= 1:
+        for bloque in bloques:
+            resultado.update(_resolver_bloque(bloque))
+            progreso(len(resultado))
+    else:
+        # fork: los procesos heredan la lista TOR y los rangos ya cargados
+        contexto = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+            for i, parte in enumerate(pool.map(_resolver_bloque, bloques)):
+                resultado.update(parte)
+                if i % 10 == 9 or i == len(bloques) - 1:
+                    progreso(len(resultado))
+    s = time.perf_counter() - t0
+    print(f"[+] {len(resultado)} IPs resueltas en {s:.1f}s con {procesos} procesos")
+    return resultado
+
+
+def resolver_red(cambios: dict):
+    """Geolocaliza por lotes en la API las IPs sin geo local (respetando su límite)."""
+    pendientes = [ip for ip, c in cambios.items() if "country" not in c]
+    print(f"[*] {len(pendientes)} IPs sin geolocalización local: consultando la API")
+    for i in range(0, len(pendientes), API_BATCH_MAX):
+        for ip, geo in geo_lookup_lote(pendientes[i:i + API_BATCH_MAX]).items():
+            geo_ip = _cambios_geo(geo)
+            if geo_ip:
+                tor, vpn = flags_ip(ip, geo_ip["isp"])
+                cambios[ip] = {**geo_ip, "flag_tor": tor, "flag_vpn": vpn}
+        print(f"    {min(i + API_BATCH_MAX, len(pendientes))}/{len(pendientes)} IPs")
+        if i + API_BATCH_MAX < len(pendientes):
+            time.sleep(PAUSA_API)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tabla", choices=list(TABLAS_BALIZA) + ["balizas_eventos"], action="append",
+                        help="Tabla a re-enriquecer (por defecto, eventos; balizas_eventos: solo las "
+                             "visitas a balizas)")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--solo-flags", action="store_true", help="Recalcular solo flag_tor / flag_vpn")
+    parser.add_argument("--red", action="store_true", help="Consultar la API para las IPs sin geo local")
+    args = parser.parse_args()
+    tablas = args.tabla or list(TABLAS_BALIZA)
+
+    # Listas cargadas antes del fork; sin descargas desde la herramienta
+    LISTA_TOR.refresco = 0
+    LISTA_TOR.cargar()
+    rangos = CLASIFICADOR_RANGOS.estado()
+    print(f"[*] Lista TOR: {len(LISTA_TOR)} IPs; rangos: {rangos['prefijos_ipv4']} IPv4 / "
+          f"{rangos['prefijos_ipv6']} IPv6 ({len(rangos['ficheros'])} ficheros)")
+
+    t_total = time.perf_counter()
+    ips = recoger_ips(tablas)
+    print(f"[*] {len(ips)} IPs distintas")
+    cambios = resolver(ips, args.procesos, not args.solo_flags)
+    if args.red and not args.solo_flags:
+        resolver_red(cambios)
+
+    backend = get_backend()
+    for tabla in tablas:
+        t0 = time.perf_counter()
+        n = backend.actualizar_por_valor(tabla, "ip", cambios)
+        print(f"[+] {tabla}: {n} filas actualizadas en {time.perf_counter() - t0:.1f}s")
+
+    # Las visitas a balizas son filas de eventos: siempre hay agregados que rehacer
+    t0 = time.perf_counter()
+    estados = reconstruir()
+    print(f"[+] Comportamiento de {len(estados)} fingerprints reconstruido en {time.perf_counter() - t0:.1f}s")
+    t0 = time.perf_counter()
+    reconstruir_identidad(estados)
+    print(f"[+] Agregados por equipo reconstruidos en {time.perf_counter() - t0:.1f}s")
+    print(f"[=] Total {time.perf_counter() - t_total:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
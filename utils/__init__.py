@@ -6,6 +6,7 @@ BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
 FINGERPRINTS_DIR = os.path.join(DATA_DIR, "fingerprints")
+FINGERPRINTS_CAPTURAS = os.path.join(FINGERPRINTS_DIR, "capturas.jsonl")  # registro de avistamientos
 FINGERPRINTS_OLD_DIR = os.path.join(DATA_DIR, "fingerprints_OLD")
 FINGERPRINT_BEHAVIOUR_CSV = os.path.join(DATA_DIR, "fingerprint_behavior.csv")
 FINGERPRINT_EVENTS_CSV = os.path.join(DATA_DIR, "fingerprint_events.csv")
@@ -17,8 +18,15 @@ BALIZAS_EVENTOS_CSV = os.path.join(DATA_DIR, "balizas_eventos.csv")
 BALIZAS_FOLDER = os.path.join(BASE_DIR, "balizas")
 
 EVENTOS_CSV = os.path.join(DATA_DIR, "eventos.csv")  # ruta correcta al CSV
+EVENTOS_SEQ = os.path.join(DATA_DIR, "eventos.seq")  # contador persistente de id_num
 
 ORIGIN_PNG = os.path.join(BALIZAS_FOLDER, "origin.png")
+# Píxel de las balizas en memoria: segundos entre revisiones de la carpeta
+# de balizas (PNG propios añadidos o quitados, cambios en origin.png)
+PIXEL_REFRESCO = float(os.environ.get("FARO_PIXEL_REFRESCO", "5"))
+
+# Perfiles del orquestador de fingerprint (HTML de las balizas, por perfil)
+FP_PROFILES_JSON = os.path.join(BASE_DIR, "static", "fingerprint", "profiles.json")
 
 TIPOS_TIPOS_CSV = os.path.join(DATA_DIR, "tipos_de_tipos.csv")
 TIPOS_EVENTOS_CSV = os.path.join(DATA_DIR, "tipos_de_eventos.csv")
@@ -31,7 +39,70 @@ ADMIN_FILE = os.path.join(DATA_DIR, "admin.csv")
 
 LOGINS_FILE = os.path.join(DATA_DIR, "login_attempts.csv")
 
-GEOIP_CACHE_FILE = os.path.join(os.path.dirname(__file__), "geoip_cache.json")
+GEOIP_CACHE_FILE = os.path.join(os.path.dirname(__file__), "geoip_cache.json")  # caché antigua (solo se importa)
+# Caché de resultados de la API: LRU en memoria + SQLite en disco, con caducidad.
+# Las consultas fallidas se recuerdan menos tiempo (caché negativa).
+GEOIP_CACHE_DB = os.path.join(DATA_DIR, "geoip_cache.db")
+GEOIP_CACHE_MAX = int(os.environ.get("FARO_GEOIP_CACHE_MAX", "50000"))
+GEOIP_CACHE_TTL = int(os.environ.get("FARO_GEOIP_CACHE_TTL", str(7 * 86400)))
+GEOIP_CACHE_TTL_NEGATIVO = int(os.environ.get("FARO_GEOIP_CACHE_TTL_NEGATIVO", "3600"))
+# Enriquecimiento geográfico en segundo plano: endpoint batch (ip-api o un
+# sustituto local con la misma interfaz) e hilos del pool
+GEOIP_BATCH_URL = os.environ.get("FARO_GEOIP_BATCH_URL", "http://ip-api.com/batch")
+GEOIP_HILOS = int(os.environ.get("FARO_GEOIP_HILOS", "2"))
+
+# Proveedores de geolocalización en orden de preferencia ("maxmind", "ipapi").
+# MaxMind usa las bases GeoLite2 locales si existen; sin "ipapi" no se usa la red.
+GEOIP_PROVEEDORES = [p.strip() for p in os.environ.get("FARO_GEOIP_PROVEEDORES", "maxmind,ipapi").split(",") if p.strip()]
+GEOIP_CITY_DB = os.environ.get("FARO_GEOIP_CITY_DB", os.path.join(DATA_DIR, "GeoLite2-City.mmdb"))
+GEOIP_ASN_DB = os.environ.get("FARO_GEOIP_ASN_DB", os.path.join(DATA_DIR, "GeoLite2-ASN.mmdb"))
+
+# DNS inverso (hostname_local): segundos que una petición espera al PTR
+# (0 = nunca; el hostname se rellena en segundo plano) y caché en memoria
+DNS_ESPERA = float(os.environ.get("FARO_DNS_ESPERA", "0"))
+DNS_HILOS = int(os.environ.get("FARO_DNS_HILOS", "4"))
+DNS_CACHE_MAX = int(os.environ.get("FARO_DNS_CACHE_MAX", "10000"))
+DNS_CACHE_TTL = int(os.environ.get("FARO_DNS_CACHE_TTL", "3600"))
+DNS_CACHE_TTL_NEGATIVO = int(os.environ.get("FARO_DNS_CACHE_TTL_NEGATIVO", "300"))
+
+# Lista de nodos de salida TOR: copia local (exit-addresses o una IP por línea)
+# que un hilo de cada worker recarga y, si hay URL, vuelve a descargar.
+TOR_EXITS_FILE = os.environ.get("FARO_TOR_EXITS_FILE", os.path.join(DATA_DIR, "tor_exit_addresses.txt"))
+TOR_EXITS_URL = os.environ.get("FARO_TOR_EXITS_URL", "https://check.torproject.org/exit-addresses")  # "" = solo el fichero
+TOR_REFRESCO = int(os.environ.get("FARO_TOR_REFRESCO", "3600"))
+
+# Rangos IP de proveedores cloud / hosting / VPN (JSON de AWS, GCP, Azure...
+# o CSV / TXT con un CIDR por línea) para clasificar IPs sin red
+RANGOS_DIR = os.environ.get("FARO_RANGOS_DIR", os.path.join(DATA_DIR, "rangos"))
+
+# Escritor de eventos por lotes (group commit): filas por lote, milisegundos
+# que espera a completar un lote, profundidad de la cola, segundos que un
+# productor espera con la cola llena (después escribe él mismo) y si las
+# llamadas esperan a que su lote sea durable ("1") o vuelven al encolar ("0")
+ESCRITOR_LOTE = int(os.environ.get("FARO_ESCRITOR_LOTE", "256"))
+ESCRITOR_MS = float(os.environ.get("FARO_ESCRITOR_MS", "20"))
+ESCRITOR_PROFUNDIDAD = int(os.environ.get("FARO_ESCRITOR_PROFUNDIDAD", "10000"))
+ESCRITOR_ESPERA_COLA = float(os.environ.get("FARO_ESCRITOR_ESPERA_COLA", "5"))
+ESCRITOR_ESPERAR = os.environ.get("FARO_ESCRITOR_ESPERAR", "1") == "1"
+
+# Segundos entre reescrituras de las actualizaciones diferidas (geolocalización
+# y DNS inverso en segundo plano) con un backend que no actualiza en sitio (CSV)
+ACTUALIZACION_DIFERIDA_S = float(os.environ.get("FARO_ACTUALIZACION_DIFERIDA_S", "30"))
+
+# Backend de almacenamiento de eventos / logins: "sqlite" (por defecto) o "csv"
+STORAGE_BACKEND = os.environ.get("FARO_STORAGE_BACKEND", "sqlite").lower()
+STORAGE_DB = os.path.join(DATA_DIR, "faro.db")
+LOGINS_SEQ = os.path.join(DATA_DIR, "login_attempts.seq")
 
+# Archivo columnar (Parquet) de eventos históricos de balizas
+ARCHIVO_DIR = os.path.join(DATA_DIR, "archivo")
+ARCHIVO_DIAS = int(os.environ.get("FARO_ARCHIVO_DIAS", "30"))
 
+# Similitud entre fingerprints (score_vs_others): parecidos que se muestran
+# por equipo y tamaño máximo de un bloque de candidatos
+FP_SIMILARES = int(os.environ.get("FARO_FP_SIMILARES", "5"))
+FP_BLOQUE_MAX = int(os.environ.get("FARO_FP_BLOQUE_MAX", "5000"))
 
+# Resolución multi-motor (webhook de motores): confianza ponderada
+# (ENGINE_WEIGHTS) a partir de la cual se reutiliza un fingerprint conocido
+FP_MOTORES_UMBRAL = float(os.environ.get("FARO_FP_MOTORES_UMBRAL", "0.4"))
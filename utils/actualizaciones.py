@@ -0,0 +1,104 @@
+# utils/actualizaciones.py
+"""
+Actualizaciones diferidas de filas ya guardadas (geolocalización y DNS
+inverso en segundo plano).
+
+Con un backend que actualiza en sitio (SQLite) cada lote se aplica en el
+momento con actualizar_muchos(). Con el backend CSV cada actualizar_muchos()
+reescribe el fichero completo: los cambios se acumulan en memoria
+({tabla: {id_num: cambios}}) y un hilo por proceso los aplica cada
+FARO_ACTUALIZACION_DIFERIDA_S segundos, con una sola reescritura por tabla
+para todos los lotes del intervalo.
+
+Mientras tanto las filas se leen sin esos campos. Lo pendiente se aplica
+también al salir; un proceso que muere sin pasar por atexit los pierde
+(tools/reenriquecer_eventos los rellena).
+"""
+
+import os
+import time
+import atexit
+import threading
+
+from . import ACTUALIZACION_DIFERIDA_S
+from .storage import get_backend
+
+
+class ActualizacionesDiferidas:
+    """
+    Acumula {tabla: {id_num: cambios}} y los aplica por intervalos. El hilo
+    se crea en la primera actualización diferida de cada proceso (seguro
+    con los workers de gunicorn).
+    """
+
+    def __init__(self, intervalo: float = ACTUALIZACION_DIFERIDA_S):
+        self.intervalo = max(0.1, intervalo)
+        self._lock = threading.Lock()
+        self._aplicando = threading.Lock()  # una reescritura a la vez
+        self._pid = None
+        self._pendientes = {}  # tabla -> {id_num: cambios}
+        self._avisos = []      # (al_escribir, tabla, ids)
+
+    def _arrancar(self):
+        # Con el lock tomado
+        if self._pid == os.getpid():
+            return
+        self._pendientes, self._avisos = {}, []
+        threading.Thread(target=self._periodico, name="actualizaciones-diferidas", daemon=True).start()
+        if self._pid is None:
+            atexit.register(self.vaciar)
+        self._pid = os.getpid()
+
+    def actualizar(self, cambios_por_tabla: dict, al_escribir=None):
+        """
+        Aplica {tabla: {id_num: cambios}}: ya, si el backend actualiza en
+        sitio; si no, en la próxima reescritura. al_escribir(tabla, filas)
+        recibe las filas actualizadas de cada tabla cuando se escriben.
+        """
+        backend = get_backend()
+        if backend.actualiza_en_sitio:
+            for tabla, cambios in cambios_por_tabla.items():
+                filas = backend.actualizar_muchos(tabla, cambios)
+                if al_escribir is not None:
+                    al_escribir(tabla, filas)
+            return
+        with self._lock:
+            self._arrancar()
+            for tabla, cambios in cambios_por_tabla.items():
+                pendientes = self._pendientes.setdefault(tabla, {})
+                for id_num, c in cambios.items():
+                    # Geo y DNS de una misma fila se funden en una sola reescritura
+                    pendientes.setdefault(str(id_num), {}).update(c)
+                if al_escribir is not None:
+                    self._avisos.append((al_escribir, tabla, {str(i) for i in cambios}))
+
+    def vaciar(self):
+        """Aplica ya todo lo pendiente (al salir, herramientas y pruebas)."""
+        with self._aplicando:
+            with self._lock:
+                if self._pid != os.getpid() or not self._pendientes:
+                    return
+                pendientes, avisos = self._pendientes, self._avisos
+                self._pendientes, self._avisos = {}, []
+            backend = get_backend()
+            for tabla, cambios in pendientes.items():
+                try:
+                    filas = backend.actualizar_muchos(tabla, cambios)
+                except Exception as e:
+                    print(f"[actualizaciones] Error actualizando {len(cambios)} filas de {tabla}: {e}")
+                    continue
+                for al_escribir, tabla_aviso, ids in avisos:
+                    if tabla_aviso != tabla:
+                        continue
+                    try:
+                        al_escribir(tabla, [f for f in filas if str(f.get("id_num")) in ids])
+                    except Exception as e:
+                        print(f"[actualizaciones] Error tras actualizar {tabla}: {e}")
+
+    def _periodico(self):
+        while True:
+            time.sleep(self.intervalo)
+            self.vaciar()
+
+
+ACTUALIZACIONES = ActualizacionesDiferidas()
@@ -0,0 +1,380 @@
+# utils/archivo.py
+"""
+Archivo columnar (Parquet) para eventos históricos.
+
+Los eventos con más de ARCHIVO_DIAS días se compactan desde el backend
+caliente (SQLite / CSV) a ficheros Parquet particionados por fecha:
+
+    data/archivo/eventos/fecha=2025-01-31/datos.parquet
+
+- Compresión zstd y codificación por diccionario de las columnas de texto
+  repetitivas (user_agent, isp, country, origen...).
+- Los lectores solo leen las columnas que piden y descartan particiones
+  completas cuando filtran por fecha (desde / hasta).
+- La compactación es idempotente: si se interrumpe antes de borrar las
+  filas del backend, la siguiente ejecución no duplica eventos (id_num).
+- Las vistas (balizas_eventos) se archivan en su tabla física, con su
+  marca: compactar la vista mueve solo sus filas y leerla filtra por la
+  marca, así que cada evento se archiva una sola vez. El archivo propio
+  de una vista anterior a la unificación se fusiona en el de la tabla
+  física la primera vez que se usa.
+- Los campos de "busqueda" (fingerprint_id) tienen un índice lateral
+  valor -> fechas (_indice_<campo>.parquet): buscar un valor solo abre
+  las particiones donde aparece.
+
+pyarrow es opcional: sin él, disponible() es False y el archivo se ignora
+(las lecturas devuelven solo el backend caliente).
+"""
+
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from . import ARCHIVO_DIR, ARCHIVO_DIAS
+from .storage import (
+    TABLAS, get_backend, es_vista, tabla_fisica, _filtros_vista, _fila_normalizada, _a_texto
+)
+from .bloqueo import bloqueo_fichero
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - dependencia opcional
+    pa = pc = ds = pq = None
+
+FICHERO_PARTICION = "datos.parquet"
+
+# Prefijo "_" => pyarrow.dataset no lo trata como parte de los datos
+PREFIJO_INDICE = "_indice_"
+
+# Columnas de alta cardinalidad: el diccionario no compensa
+SIN_DICCIONARIO = {"id_num", "timestamp"}
+
+# Filas acumuladas en memoria antes de escribir particiones
+LOTE_COMPACTACION = 200000
+
+_aviso_emitido = False
+
+
+def disponible() -> bool:
+    """True si pyarrow está instalado."""
+    return pa is not None
+
+
+def _avisar_sin_pyarrow(tabla: str):
+    global _aviso_emitido
+    if not _aviso_emitido and os.path.isdir(_ruta_tabla(tabla)):
+        print("[archivo] Existe archivo Parquet pero pyarrow no está instalado: se ignora")
+        _aviso_emitido = True
+
+
+# ---------------------------
+# Esquema y rutas
+# ---------------------------
+def _ruta_tabla(tabla: str) -> str:
+    return os.path.join(ARCHIVO_DIR, tabla_fisica(tabla))
+
+
+def _ruta_particion(tabla: str, fecha: str) -> str:
+    return os.path.join(_ruta_tabla(tabla), f"fecha={fecha}")
+
+
+def _ruta_indice(tabla: str, campo: str) -> str:
+    return os.path.join(_ruta_tabla(tabla), f"{PREFIJO_INDICE}{campo}.parquet")
+
+
+def _esquema(tabla: str):
+    # Todo texto: las filas vuelven idénticas a las del CSV / SQLite
+    return pa.schema([(c, pa.string()) for c in TABLAS[tabla_fisica(tabla)]["campos"]])
+
+
+def _dataset(tabla: str):
+    _migrar_archivo_vistas()
+    ruta = _ruta_tabla(tabla)
+    if not os.path.isdir(ruta):
+        return None
+    esquema = _esquema(tabla).append(pa.field("fecha", pa.string()))
+    particiones = ds.partitioning(pa.schema([("fecha", pa.string())]), flavor="hive")
+    return ds.dataset(ruta, format="parquet", schema=esquema, partitioning=particiones)
+
+
+def _expresion(filtros: dict = None, desde: str = None, hasta: str = None):
+    """Traduce filtros / rango temporal a una expresión de pyarrow.dataset."""
+    expr = None
+
+    def y(a, b):
+        return b if a is None else (a & b)
+
+    for campo, valor in (filtros or {}).items():
+        if isinstance(valor, (list, tuple, set)):
+            expr = y(expr, ds.field(campo).isin([_a_texto(v) for v in valor]))
+        else:
+            expr = y(expr, ds.field(campo) == _a_texto(valor))
+    # La condición sobre "fecha" permite descartar particiones sin abrirlas
+    if desde:
+        expr = y(expr, (ds.field("fecha") >= desde[:10]) & (ds.field("timestamp") >= desde))
+    if hasta:
+        expr = y(expr, (ds.field("fecha") <= hasta[:10]) & (ds.field("timestamp") < hasta))
+    return expr
+
+
+# ---------------------------
+# Lectura
+# ---------------------------
+def escanear(tabla: str, columnas: list = None, filtros: dict = None,
+             desde: str = None, hasta: str = None):
+    """
+    Generador de pyarrow.RecordBatch con las columnas pedidas.
+    Pensado para agregaciones columnares sin materializar filas.
+    """
+    if not disponible():
+        _avisar_sin_pyarrow(tabla)
+        return
+    dataset = _dataset(tabla)
+    if dataset is None:
+        return
+    columnas = columnas or TABLAS[tabla]["campos"]
+    tabla, filtros = _filtros_vista(tabla, filtros)
+    expr = _expresion(filtros, desde, hasta)
+    fechas = _fechas_indexadas(tabla, filtros)
+    if fechas is not None:
+        if not fechas:
+            return
+        expr = ds.field("fecha").isin(fechas) & expr
+    yield from dataset.to_batches(columns=columnas, filter=expr)
+
+
+def iterar(tabla: str, filtros: dict = None, columnas: list = None,
+           desde: str = None, hasta: str = None):
+    """Recorre las filas archivadas como dict (mismo formato que el backend)."""
+    for lote in escanear(tabla, columnas, filtros, desde, hasta):
+        yield from lote.to_pylist()
+
+
+def iterar_historico(tabla: str, filtros: dict = None, columnas: list = None, desde: str = None):
+    """
+    Recorre el histórico completo de una tabla: primero el archivo Parquet
+    (eventos antiguos) y después el backend caliente.
+    """
+    yield from iterar(tabla, filtros, columnas, desde)
+    yield from get_backend().iterar(tabla, filtros, desde, columnas=columnas)
+
+
+def contar_por(tabla: str, campo: str) -> dict:
+    """Conteo de filas archivadas por valor de `campo`."""
+    conteo = {}
+    for lote in escanear(tabla, [campo]):
+        for par in pc.value_counts(lote.column(0)).to_pylist():
+            valor = par["values"] or ""
+            conteo[valor] = conteo.get(valor, 0) + par["counts"]
+    return conteo
+
+
+def contar_historico_por(tabla: str, campo: str) -> dict:
+    """contar_por() del backend caliente más el archivo."""
+    conteo = get_backend().contar_por(tabla, campo)
+    for valor, n in contar_por(tabla, campo).items():
+        conteo[valor] = conteo.get(valor, 0) + n
+    return conteo
+
+
+# ---------------------------
+# Índice lateral (valor -> fechas)
+# ---------------------------
+def _fechas_indexadas(tabla: str, filtros: dict = None):
+    """
+    Fechas de las particiones que contienen los valores filtrados en algún
+    campo de "busqueda". None si no hay filtro indexable o falta el índice
+    (entonces se recorren todas las particiones).
+    """
+    for campo in TABLAS[tabla].get("busqueda", ()):
+        if campo not in (filtros or {}):
+            continue
+        ruta = _ruta_indice(tabla, campo)
+        if not os.path.exists(ruta):
+            return None
+        valor = filtros[campo]
+        valores = [_a_texto(v) for v in (valor if isinstance(valor, (list, tuple, set)) else [valor])]
+        # Índice ordenado por valor: las estadísticas de cada row group descartan el resto
+        indice = pq.read_table(ruta, columns=["fecha"], filters=[(campo, "in", valores)])
+        return sorted(set(indice.column(0).to_pylist()))
+    return None
+
+
+def _escribir_indice(tabla: str, campo: str, pares: set, fusionar: bool = True):
+    """Guarda los pares (valor, fecha), fusionándolos con el índice existente."""
+    ruta = _ruta_indice(tabla, campo)
+    esquema = pa.schema([(campo, pa.string()), ("fecha", pa.string())])
+    valores, fechas = zip(*pares) if pares else ((), ())
+    nuevos = pa.Table.from_arrays([pa.array(valores, pa.string()), pa.array(fechas, pa.string())], schema=esquema)
+    if fusionar and os.path.exists(ruta):
+        nuevos = pa.concat_tables([pq.read_table(ruta, schema=esquema), nuevos])
+    final = nuevos.group_by([campo, "fecha"]).aggregate([]).sort_by([(campo, "ascending"), ("fecha", "ascending")])
+    os.makedirs(_ruta_tabla(tabla), exist_ok=True)
+    tmp = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    pq.write_table(final, tmp, compression="zstd", row_group_size=65536)
+    os.replace(tmp, ruta)
+
+
+def reindexar(tabla: str = "balizas_eventos") -> dict:
+    """Regenera los índices laterales recorriendo el archivo. Devuelve {campo: pares}."""
+    if not disponible():
+        raise RuntimeError("pyarrow no está instalado: pip install pyarrow")
+    resumen = {}
+    for campo in TABLAS[tabla].get("busqueda", ()):
+        dataset = _dataset(tabla)
+        pares = set()
+        if dataset is not None:
+            for lote in dataset.to_batches(columns=[campo, "fecha"], filter=ds.field(campo) != ""):
+                agrupado = pa.Table.from_batches([lote]).group_by([campo, "fecha"]).aggregate([])
+                pares.update(zip(agrupado[campo].to_pylist(), agrupado["fecha"].to_pylist()))
+        _escribir_indice(tabla, campo, pares, fusionar=False)
+        resumen[campo] = len(pares)
+    return resumen
+
+
+# ---------------------------
+# Compactación
+# ---------------------------
+def _escribir_particion(tabla: str, fecha: str, filas: list, prevalecen: bool = False) -> int:
+    """
+    Fusiona `filas` con la partición existente y la reescribe de forma
+    atómica (tmp + os.replace). Devuelve las filas nuevas añadidas.
+    Con prevalecen=True, una fila ya archivada con el mismo id_num se
+    sustituye en vez de descartar la nueva.
+    """
+    ruta = _ruta_particion(tabla, fecha)
+    os.makedirs(ruta, exist_ok=True)
+    destino = os.path.join(ruta, FICHERO_PARTICION)
+    esquema = _esquema(tabla)
+
+    nuevas = pa.Table.from_pylist([_fila_normalizada(tabla, f) for f in filas], schema=esquema)
+    if os.path.exists(destino):
+        existente = pq.read_table(destino, schema=esquema)
+        if prevalecen:
+            ya = pc.is_in(existente["id_num"], value_set=nuevas["id_num"])
+            existente = existente.filter(pc.invert(ya))
+        # Idempotencia: descartar eventos ya archivados en una ejecución interrumpida
+        ya = pc.is_in(nuevas["id_num"], value_set=existente["id_num"])
+        nuevas = nuevas.filter(pc.invert(ya))
+        if not nuevas.num_rows:
+            return 0
+        tabla_final = pa.concat_tables([existente, nuevas])
+    else:
+        tabla_final = nuevas
+
+    tabla_final = tabla_final.sort_by("timestamp")
+    diccionario = [c for c in esquema.names if c not in SIN_DICCIONARIO]
+    # Prefijo "." => pyarrow.dataset ignora el temporal mientras se escribe
+    tmp = os.path.join(ruta, f".{FICHERO_PARTICION}.{uuid.uuid4().hex}.tmp")
+    pq.write_table(tabla_final, tmp, compression="zstd", use_dictionary=diccionario)
+    os.replace(tmp, destino)
+    return nuevas.num_rows
+
+
+def _migrar_archivo_vistas():
+    """
+    Una vez: fusiona el archivo propio de cada vista (anterior a la
+    unificación, sin la columna de la marca) en el de su tabla física, con
+    la marca puesta. Prevalece la copia de la vista si el evento ya estaba
+    archivado desde la tabla física. El directorio antiguo se conserva
+    como <vista>.fusionado.
+    """
+    for vista in (t for t in TABLAS if es_vista(t)):
+        ruta = os.path.join(ARCHIVO_DIR, vista)
+        if not os.path.isdir(ruta):
+            continue
+        with bloqueo_fichero(ruta):
+            if not os.path.isdir(ruta):
+                continue  # otro proceso ya lo ha fusionado
+            marca = TABLAS[vista]["vista"]
+            n = 0
+            for nombre in sorted(os.listdir(ruta)):
+                fichero = os.path.join(ruta, nombre, FICHERO_PARTICION)
+                if not nombre.startswith("fecha=") or not os.path.exists(fichero):
+                    continue
+                filas = pq.read_table(fichero).to_pylist()
+                for fila in filas:
+                    fila[marca["campo"]] = marca["valor"]
+                n += _escribir_particion(vista, nombre[6:], filas, prevalecen=True)
+            os.replace(ruta, f"{ruta}.fusionado")
+            reindexar(vista)
+        print(f"[archivo] {ruta}: {n} eventos fusionados en {_ruta_tabla(vista)}")
+
+
+def fecha_corte(dias: int = None) -> str:
+    """Fecha (YYYY-MM-DD, UTC) a partir de la cual los eventos siguen en caliente."""
+    dias = ARCHIVO_DIAS if dias is None else dias
+    return (datetime.now(timezone.utc) - timedelta(days=dias)).date().isoformat()
+
+
+def compactar(tabla: str = "balizas_eventos", dias: int = None, backend=None) -> dict:
+    """
+    Mueve al archivo los eventos anteriores a fecha_corte(dias) y los borra
+    del backend caliente. Solo se borran tras escribir todas las particiones.
+    En una vista se mueven solo sus filas, al archivo de su tabla física.
+
+    El histórico completo (archivo + caliente) no cambia, así que el estado
+    derivado (visitas, comportamiento, identidades, manifiesto) sigue
+    siendo válido sin recalcularlo.
+    """
+    if not disponible():
+        raise RuntimeError("pyarrow no está instalado: pip install pyarrow")
+
+    _migrar_archivo_vistas()
+    backend = backend or get_backend()
+    hasta = fecha_corte(dias)
+    pendientes = {}
+    indexados = {campo: set() for campo in TABLAS[tabla].get("busqueda", ())}
+    acumuladas = 0
+    resumen = {"hasta": hasta, "leidas": 0, "archivadas": 0, "borradas": 0, "particiones": set()}
+
+    def volcar():
+        for fecha, filas in pendientes.items():
+            resumen["archivadas"] += _escribir_particion(tabla, fecha, filas)
+            resumen["particiones"].add(fecha)
+        pendientes.clear()
+
+    for fila in backend.iterar(tabla, hasta=hasta):
+        fecha = fila["timestamp"][:10]
+        pendientes.setdefault(fecha, []).append(fila)
+        for campo, pares in indexados.items():
+            if fila.get(campo):
+                pares.add((fila[campo], fecha))
+        resumen["leidas"] += 1
+        acumuladas += 1
+        if acumuladas >= LOTE_COMPACTACION:
+            volcar()
+            acumuladas = 0
+    volcar()
+
+    # El índice se actualiza antes de borrar: si se interrumpe, la siguiente
+    # ejecución vuelve a leer las mismas filas y lo completa
+    for campo, pares in indexados.items():
+        if pares or not os.path.exists(_ruta_indice(tabla, campo)):
+            _escribir_indice(tabla, campo, pares)
+
+    if resumen["leidas"]:
+        resumen["borradas"] = backend.borrar_anteriores(tabla, hasta)
+    resumen["particiones"] = sorted(resumen["particiones"])
+    return resumen
+
+
+def estado(tabla: str = "balizas_eventos") -> list:
+    """
+    Lista de particiones: [{fecha, filas, bytes}] ordenada por fecha. En
+    una vista, las de su tabla física (filas de la vista y del resto).
+    """
+    ruta = _ruta_tabla(tabla)
+    if not os.path.isdir(ruta):
+        return []
+    particiones = []
+    for nombre in sorted(os.listdir(ruta)):
+        fichero = os.path.join(ruta, nombre, FICHERO_PARTICION)
+        if not nombre.startswith("fecha=") or not os.path.exists(fichero):
+            continue
+        filas = pq.ParquetFile(fichero).metadata.num_rows if disponible() else None
+        particiones.append({"fecha": nombre[6:], "filas": filas, "bytes": os.path.getsize(fichero)})
+    return particiones
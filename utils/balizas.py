@@ -1,15 +1,22 @@
 # utils/balizas.py
 import csv
 import os
-import shutil
+import threading
 
 from datetime import datetime
-from utils.eventos import guardar_evento, cargar_eventos, siguiente_id
-from utils.geoip import geo_lookup
+from utils.eventos import preparar_evento, siguiente_id
 from utils.utils import obtener_ip_real, obtener_ip_hostname
 from utils.utils import parse_user_agent
+from utils.storage import get_backend
+from utils.escritor_eventos import escribir_evento, ESCRITOR_EVENTOS
+from utils.archivo import iterar_historico, contar_historico_por
+from utils import fingerprint_behavior, identidad_fp
+from utils.manifiesto_fp import registrar_visita
+from utils.enriquecimiento import geo_inmediata, encolar_enriquecimiento
+from utils.dns_inverso import encolar_hostname
+from utils.bloqueo import bloqueo_fichero
 
-from . import BASE_DIR, DATA_DIR, BALIZAS_FOLDER, BALIZAS_CSV, BALIZAS_EVENTOS_CSV, ORIGIN_PNG
+from . import BASE_DIR, DATA_DIR, BALIZAS_FOLDER, BALIZAS_CSV
 
 # Asegurar carpetas
 os.makedirs(BALIZAS_FOLDER, exist_ok=True)
@@ -17,181 +24,227 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 BALIZAS_KEYS = ["id", "timestamp", "comentario", "tipo", "evento", "origen", "servidor", "servidor_url"]
 
+# Espacio del estado derivado con las visitas por baliza (origen -> n)
+ESPACIO_VISITAS = "visitas"
+
+# ------------------- REGISTRO DE BALIZAS -------------------
+
+class RegistroBalizas:
+    """
+    Balizas de balizas.csv en memoria, indexadas por origen.
+
+    El CSV solo se relee cuando cambia su firma (mtime, tamaño): las
+    escrituras de este proceso invalidan el registro y las de otros
+    workers se detectan con un stat() por consulta.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._firma = None
+        self._balizas = []
+        self._por_origen = {}
+
+    def _leer_firma(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _refrescar(self):
+        firma = self._leer_firma()
+        if firma == self._firma:
+            return
+        balizas = []
+        if firma is not None:
+            with open(self.path, newline="", encoding="utf-8") as f:
+                balizas = list(csv.DictReader(f))
+        # Ordenar por ID numérico
+        balizas.sort(key=lambda x: int(x["id"]))
+        self._balizas = balizas
+        self._por_origen = {b["origen"]: b for b in balizas}
+        self._firma = firma
+
+    def invalidar(self):
+        with self._lock:
+            self._firma = None
+
+    def todas(self) -> list:
+        """Copia de las balizas ordenadas por id (los llamantes las modifican)."""
+        with self._lock:
+            self._refrescar()
+            return [dict(b) for b in self._balizas]
+
+    def por_origen(self, origen: str):
+        """Baliza con ese origen (copia) o None."""
+        with self._lock:
+            self._refrescar()
+            baliza = self._por_origen.get(origen)
+            return dict(baliza) if baliza else None
+
+
+REGISTRO_BALIZAS = RegistroBalizas(BALIZAS_CSV)
+
 # ------------------- BALIZAS -------------------
 
 def ensure_balizas_header():
     """Crea la cabecera de CSV de balizas si no existe o está vacía."""
+    with bloqueo_fichero(BALIZAS_CSV):
+        _asegurar_cabecera_balizas()
+
+
+def _asegurar_cabecera_balizas():
     if not os.path.exists(BALIZAS_CSV) or os.path.getsize(BALIZAS_CSV) == 0:
         with open(BALIZAS_CSV, "w", newline="", encoding="utf-8") as f:
             writer = csv.writer(f)
-            writer.writerow(["id", "timestamp", "comentario", "tipo", "evento", "origen", "servidor", "servidor_url"])
+            writer.writerow(BALIZAS_KEYS)
 
 
 def load_balizas():
     """Carga todas las balizas, ordenadas por id numérico ascendente."""
-    balizas = []
-    if not os.path.exists(BALIZAS_CSV):
-        return balizas
+    return REGISTRO_BALIZAS.todas()
 
-    with open(BALIZAS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        balizas = list(reader)
 
-    # Ordenar por ID numérico
-    balizas.sort(key=lambda x: int(x["id"]))
-    return balizas
+def _fila_baliza(b: dict) -> list:
+    return [b.get(k, "") for k in BALIZAS_KEYS]
 
 
 def save_baliza(row: dict):
-    """Añade una nueva baliza y genera los archivos PNG y HTML asociados."""
-    ensure_balizas_header()
-    with open(BALIZAS_CSV, "a", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            row["id"],
-            row["timestamp"],
-            row.get("comentario", ""),
-            row.get("tipo", ""),
-            row.get("evento", ""),
-            row.get("origen", ""),
-            row.get("servidor", ""),
-            row.get("servidor_url", "")
-        ])
-    generar_png_baliza(row["origen"])
-    html_path = os.path.join(BALIZAS_FOLDER, f"{row['origen']}.html")
-    generar_html_baliza(row["origen"], html_path)
+    """
+    Añade una nueva baliza. Si otro worker ya ha usado row["id"], se le
+    asigna el siguiente libre.
+    """
+    save_balizas([row])
+
+
+def save_balizas(rows: list):
+    """
+    Añade varias balizas con una sola escritura de balizas.csv. Solo se
+    guardan sus datos: el píxel (utils/pixel.py) y el HTML
+    (utils/html_baliza.py) se sirven desde memoria, sin ficheros por baliza.
+    Los id ya usados (p.ej. por otro worker) se sustituyen por los
+    siguientes libres.
+    """
+    with bloqueo_fichero(BALIZAS_CSV):
+        _asegurar_cabecera_balizas()
+        ids = {int(b["id"]) for b in REGISTRO_BALIZAS.todas()}
+        for row in rows:
+            if int(row["id"]) in ids:
+                row["id"] = str(max(ids) + 1)
+            ids.add(int(row["id"]))
+        with open(BALIZAS_CSV, "a", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows(_fila_baliza(row) for row in rows)
+        REGISTRO_BALIZAS.invalidar()
 
 
 def update_balizas_csv(balizas_list):
-    """Sobrescribe todas las balizas en el CSV (update/delete)."""
-    with open(BALIZAS_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow(["id", "timestamp", "comentario", "tipo", "evento", "origen", "servidor", "servidor_url"])
-        for b in balizas_list:
-            writer.writerow([
-                b.get("id", ""),
-                b.get("timestamp", ""),
-                b.get("comentario", ""),
-                b.get("tipo", ""),
-                b.get("evento", ""),
-                b.get("origen", ""),
-                b.get("servidor", ""),
-                b.get("servidor_url", "")
-            ])
+    """
+    Sobrescribe todas las balizas en el CSV (update/delete).
+    tmp + os.replace: los demás workers nunca leen el fichero a medias.
+    """
+    tmp = f"{BALIZAS_CSV}.tmp"
+    with bloqueo_fichero(BALIZAS_CSV):
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(BALIZAS_KEYS)
+            for b in balizas_list:
+                writer.writerow(_fila_baliza(b))
+        os.replace(tmp, BALIZAS_CSV)
+        REGISTRO_BALIZAS.invalidar()
 
 
 def existe_baliza(origen: str) -> bool:
     """Devuelve True si existe una baliza con ese origen."""
-    return any(b["origen"] == origen for b in load_balizas())
+    return REGISTRO_BALIZAS.por_origen(origen) is not None
 
 
 # ------------------- EVENTOS DE BALIZAS -------------------
 
-def ensure_balizas_eventos_header():
-    """Crea la cabecera de CSV de eventos si no existe."""
-    if not os.path.exists(BALIZAS_EVENTOS_CSV) or os.path.getsize(BALIZAS_EVENTOS_CSV) == 0:
-        with open(BALIZAS_EVENTOS_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "id_num", "timestamp", "ip", "tipo", "evento", "origen",
-                "payload", "so", "navegador", "user_agent",
-                "country", "country_code", "region", "city", "lat", "lon", "isp",
-                "ip_local", "hostname_local", "fingerprint_id", "flag_tor", "flag_vpn"
-            ])
+def guardar_evento_baliza(evento: dict, esperar: bool = None):
+    # print(f"[DEBUG] ENTRO EN UTILS/BALIZAS.PY -> guardar_evento_baliza(evento: dict)")
+    """
+    Añade un evento de baliza al backend (escritor por lotes) y actualiza
+    los agregados derivados: visitas de la baliza y los de su fingerprint.
+    Es una sola fila de eventos, marcada como de baliza (balizas_eventos
+    es una vista sobre eventos).
+    """
+    evento = preparar_evento(evento)
+    escribir_evento("balizas_eventos", evento, esperar)
+    _sumar_visita(evento.get("origen"))
+    _registrar_en_agregados(evento)
 
 
-def guardar_evento_baliza(evento: dict):
-    # print(f"[DEBUG] ENTRO EN UTILS/BALIZAS.PY -> guardar_evento_baliza(evento: dict)")
-    """Añade un evento de baliza al CSV."""
-    ensure_balizas_eventos_header()
-    with open(BALIZAS_EVENTOS_CSV, "a", newline="", encoding="utf-8") as f:
-        fieldnames = [
-            "id_num", "timestamp", "ip", "tipo", "evento", "origen",
-            "payload", "so", "navegador", "user_agent",
-            "country", "country_code", "region", "city", "lat", "lon", "isp",
-            "ip_local", "hostname_local", "fingerprint_id", "flag_tor", "flag_vpn"
-
-        ]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writerow(evento)
+def _registrar_en_agregados(evento: dict):
+    """Comportamiento, manifiesto y equipo del fingerprint del evento."""
+    fingerprint_behavior.registrar_evento(evento)
+    registrar_visita(evento)
+    identidad_fp.registrar_evento(evento)
 
-# "fingerprint_id",
-def contar_visitas_por_baliza() -> dict:
-    """Devuelve el número de visitas por baliza (clave: origen)."""
-    visitas = {}
-    if not os.path.exists(BALIZAS_EVENTOS_CSV):
-        return visitas
-
-    with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            origen = row.get("origen")
-            if origen:
-                visitas[origen] = visitas.get(origen, 0) + 1
-    return visitas
+
+def iterar_eventos_baliza(columnas: list = None, **filtros):
+    """
+    Recorre los eventos de baliza en orden de escritura (archivo + backend).
+    Los filtros son de igualdad (origen=..., fingerprint_id=...) y usan
+    los índices del backend cuando existen. `columnas` limita los campos
+    leídos (el archivo Parquet solo lee esas columnas).
+    """
+    return iterar_historico("balizas_eventos", filtros=filtros or None, columnas=columnas)
 
 
-def registrar_fingerprint_en_evento_baliza(origen: str, fingerprint_id: str) -> bool:
-    """Añade el fingerprint_id al último evento de baliza sin valor asignado."""
-    if not os.path.exists(BALIZAS_EVENTOS_CSV):
-        return False
+def cargar_eventos_baliza(origen: str = None) -> list:
+    """Devuelve los eventos de baliza (opcionalmente de un origen concreto)."""
+    if origen:
+        return list(iterar_eventos_baliza(origen=origen))
+    return list(iterar_eventos_baliza())
 
-    filas = []
-    ultima_fila_objetivo = None
 
-    with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-        for row in reader:
-            filas.append(row)
-            if row.get("origen") == origen and not row.get("fingerprint_id"):
-                ultima_fila_objetivo = row
+def _sumar_visita(origen: str):
+    """Contador de visitas de la baliza, O(1) (no hace nada si aún no existe)."""
+    if not origen:
+        return
+    try:
+        get_backend().modificar_estado(ESPACIO_VISITAS, origen, lambda n: (n or 0) + 1)
+    except Exception as e:
+        # El contador nunca debe impedir registrar la visita
+        print(f"[balizas] Error actualizando visitas de {origen}: {e}")
 
-    if not ultima_fila_objetivo:
-        return False
 
-    ultima_fila_objetivo["fingerprint_id"] = fingerprint_id
+def reconstruir_visitas() -> dict:
+    """Recuenta las visitas por baliza desde el histórico (archivo + backend)."""
+    conteo = contar_historico_por("balizas_eventos", "origen")
+    visitas = {origen: n for origen, n in conteo.items() if origen}
+    get_backend().reemplazar_estado(ESPACIO_VISITAS, visitas)
+    return visitas
+
 
-    with open(BALIZAS_EVENTOS_PATH, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(filas)
+# "fingerprint_id",
+def contar_visitas_por_baliza() -> dict:
+    """
+    Devuelve el número de visitas por baliza (clave: origen).
+    Lee los contadores mantenidos al escribir: el coste depende del número
+    de balizas, no del de eventos. Solo recuenta el histórico la primera vez.
+    """
+    visitas = get_backend().leer_estado(ESPACIO_VISITAS)
+    if visitas is None:
+        visitas = reconstruir_visitas()
+    return visitas
 
-    return True
 
+def registrar_fingerprint_en_evento_baliza(origen: str, fingerprint_id: str) -> bool:
+    """Añade el fingerprint_id al último evento de baliza sin valor asignado."""
+    ESCRITOR_EVENTOS.vaciar()
+    filas, _ = get_backend().consultar(
+        "balizas_eventos",
+        filtros={"origen": origen, "fingerprint_id": ""},
+        limite=1
+    )
+    if not filas:
+        return False
 
-# ------------------- GENERACIÓN DE ARCHIVOS -------------------
-
-def generar_html_baliza(origen: str, target_path: str):
-    """Genera un HTML tipo formulario con la baliza integrada."""
-    plantilla = f"""<!DOCTYPE html>
-<html lang="es">
-<head><meta charset="UTF-8"><title>Baliza {origen}</title></head>
-<body>
-<script src="/static/fingerprint/orchestrator.js"></script>
-<script type="module">
-(async () => {{
-    const fpData = await window.runFingerprint();
-    await fetch("/webhook/fingerprint", {{
-        method: "POST",
-        headers: {{ "Content-Type": "application/json" }},
-        body: JSON.stringify({{ origen: "{origen}", fingerprint: fpData, tipo: "HTML", evento: "VIEW" }})
-    }});
-}})();
-</script>
-</body>
-</html>
-"""
-    with open(target_path, "w", encoding="utf-8") as f:
-        f.write(plantilla)
-
-
-def generar_png_baliza(origen: str) -> str:
-    """Copia origin.png a la baliza correspondiente."""
-    target_png = os.path.join(BALIZAS_FOLDER, f"{origen}.png")
-    if os.path.exists(ORIGIN_PNG):
-        shutil.copyfile(ORIGIN_PNG, target_png)
-    return target_png
+    get_backend().actualizar("balizas_eventos", filas[0]["id_num"], {"fingerprint_id": fingerprint_id})
+    _registrar_en_agregados({**filas[0], "fingerprint_id": fingerprint_id})
+    return True
 
 
 def enriquecer_evento_baliza(origen, fingerprint_id, fp_components, metadata):
@@ -199,26 +252,24 @@ def enriquecer_evento_baliza(origen, fingerprint_id, fp_components, metadata):
     Enriquecimiento del último evento VIEW de una baliza
     usando datos de fingerprint
     """
-    eventos = cargar_eventos_baliza(origen)
-    if not eventos:
+    ESCRITOR_EVENTOS.vaciar()
+    filas, _ = get_backend().consultar(
+        "balizas_eventos",
+        filtros={"origen": origen, "evento": "VIEW", "fingerprint_id": ""},
+        limite=1
+    )
+    if not filas:
         return False
 
-    # buscar último VIEW sin fingerprint
-    for evento in reversed(eventos):
-        if evento.get("evento") == "VIEW" and not evento.get("fingerprint_id"):
-            evento["fingerprint_id"] = fingerprint_id
-
-            evento["so"] = fp_components.get("os")
-            evento["navegador"] = fp_components.get("browserName")
-
-            evento["hostname_local"] = metadata.get("hostname")
-            evento["ip_local"] = metadata.get("localIp")
-
-            evento["enriched"] = True
-            guardar_eventos_baliza(origen, eventos)
-            return True
-
-    return False
+    get_backend().actualizar("balizas_eventos", filas[0]["id_num"], {
+        "fingerprint_id": fingerprint_id,
+        "so": fp_components.get("os"),
+        "navegador": fp_components.get("browserName"),
+        "hostname_local": metadata.get("hostname"),
+        "ip_local": metadata.get("localIp"),
+    })
+    _registrar_en_agregados({**filas[0], "fingerprint_id": fingerprint_id})
+    return True
 
 
 def registrar_visita_baliza(request, id_baliza: str, origen: str):
@@ -229,11 +280,9 @@ def registrar_visita_baliza(request, id_baliza: str, origen: str):
 
     from utils.tor_y_vpn import analyze_ip  # import aquí para evitar loops
 
-    eventos = cargar_eventos()
-
-    # IP real y geolocalización
+    # IP real y geolocalización (de caché; si falta, se rellena en segundo plano)
     ip_real = obtener_ip_real(request) or "N/A"
-    geo = geo_lookup(ip_real)
+    geo, geo_pendiente = geo_inmediata(ip_real)
 
     # Host local
     host_info = obtener_ip_hostname()
@@ -243,12 +292,12 @@ def registrar_visita_baliza(request, id_baliza: str, origen: str):
     so, nav = parse_user_agent(ua_str)
 
     # Calcular flags TOR/VPN
-    tor_vpn_flags = analyze_ip(ip_real.strip())
+    tor_vpn_flags = analyze_ip(ip_real.strip(), geo=geo)
     flag_tor = tor_vpn_flags.get("TOR", False)
     flag_vpn = tor_vpn_flags.get("VPN", False)
 
     evento = {
-        "id_num": siguiente_id(eventos),
+        "id_num": siguiente_id(),
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "ip": ip_real,
         "tipo": "HTML",
@@ -265,6 +314,7 @@ def registrar_visita_baliza(request, id_baliza: str, origen: str):
         "lat": geo.get("lat", ""),
         "lon": geo.get("lon", ""),
         "isp": (geo.get("isp") or "").strip().upper(),
+        "asn": geo.get("asn", ""),
         "ip_local": host_info.get("ip_local", ""),
         "hostname_local": host_info.get("hostname_local", ""),
         "fingerprint_id": "",
@@ -272,12 +322,14 @@ def registrar_visita_baliza(request, id_baliza: str, origen: str):
         "flag_vpn": flag_vpn
     }
 
-    # Guardar en eventos.csv
-    guardar_evento(evento)
-
-    # Guardar en eventos_baliza.csv
+    # Una sola fila: evento marcado como visita a baliza
     guardar_evento_baliza(evento)
 
+    if geo_pendiente:
+        encolar_enriquecimiento(evento)
+    if host_info.get("hostname_pendiente"):
+        encolar_hostname(evento, host_info["ip_local"])
+
 
 def cargar_baliza(baliza_id: str) -> dict:
     """
@@ -286,18 +338,13 @@ def cargar_baliza(baliza_id: str) -> dict:
     """
     print("BALIZA")
     print(baliza_id)
-    if not os.path.exists(BALIZAS_CSV):
-        return {}
     try:
-        with open(BALIZAS_CSV, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f, fieldnames=BALIZAS_KEYS)
-            next(reader)  # saltar cabecera
-            for row in reader:
-                if row["origen"] == baliza_id:
-                    return {
-                        "tipo": row.get("tipo", "INFO"),
-                        "evento": row.get("evento", "VIEW")
-                    }
+        row = REGISTRO_BALIZAS.por_origen(baliza_id)
     except Exception:
         return {}
-    return {}
\ No newline at end of file
+    if not row:
+        return {}
+    return {
+        "tipo": row.get("tipo", "INFO"),
+        "evento": row.get("evento", "VIEW")
+    }
\ No newline at end of file
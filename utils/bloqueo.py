@@ -0,0 +1,51 @@
+# utils/bloqueo.py
+"""
+Bloqueo entre procesos de los ficheros compartidos.
+
+Con varios workers de gunicorn, cada proceso tiene sus propios
+threading.Lock: no bastan para los ficheros que todos reescriben o
+amplían (contadores .seq, CSV de eventos, balizas.csv). bloqueo_fichero()
+toma además un flock exclusivo sobre "<ruta>.lock":
+
+- El bloqueo va en un fichero aparte porque muchos de estos ficheros se
+  reescriben con tmp + os.replace: un flock sobre el fichero original se
+  quedaría en el inodo sustituido.
+- El descriptor se abre en cada llamada (nunca se comparte con un
+  proceso hijo tras un fork) y el sistema libera el flock si el proceso
+  muere con él tomado.
+- Sin fcntl (Windows) solo se serializan los hilos del proceso.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def _lock_hilos(ruta: str) -> threading.Lock:
+    with _locks_lock:
+        return _locks.setdefault(ruta, threading.Lock())
+
+
+@contextmanager
+def bloqueo_fichero(ruta: str):
+    """Sección crítica sobre `ruta` entre hilos y procesos."""
+    ruta = os.path.abspath(ruta)
+    with _lock_hilos(ruta):
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        fd = os.open(f"{ruta}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # libera el flock
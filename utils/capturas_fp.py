@@ -0,0 +1,165 @@
+# utils/capturas_fp.py
+"""
+Almacén de capturas de fingerprints.
+
+Cada fingerprint se guarda una sola vez en data/fingerprints/<fp_id>.json
+(JSON compacto, direccionado por su hash estable): el documento no se
+vuelve a escribir cuando el equipo regresa. Cada avistamiento añade una
+línea al registro data/fingerprints/capturas.jsonl (solo anexado):
+
+    {"fingerprint_id": ..., "timestamp": ..., "source": {...}}
+
+first_seen / last_seen y el número de capturas se calculan a partir del
+registro. Cada proceso lo lee de forma incremental (solo los bytes nuevos
+desde la última lectura), así que también ve las capturas de los demás
+workers.
+"""
+
+import os
+import json
+import threading
+from datetime import datetime
+
+from . import FINGERPRINTS_DIR, FINGERPRINTS_CAPTURAS
+
+
+def _escribir_json(ruta: str, datos: dict):
+    """Escritura atómica (tmp + replace) en JSON compacto."""
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, separators=(",", ":"), ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+
+class AlmacenCapturas:
+    """Documentos por fingerprint + registro de avistamientos."""
+
+    def __init__(self, directorio: str = FINGERPRINTS_DIR, registro: str = FINGERPRINTS_CAPTURAS):
+        self.directorio = directorio
+        self.registro = registro
+        self._lock = threading.Lock()
+        self._conocidos = set()  # fp_id con documento en disco
+        self._resumen = {}       # fp_id -> [first_seen, last_seen, capturas]
+        self._offset = 0         # bytes del registro ya leídos
+
+    def ruta(self, fingerprint_id: str) -> str:
+        return os.path.join(self.directorio, f"{fingerprint_id}.json")
+
+    # ---------- escritura ----------
+    def registrar(self, fingerprint_id: str, documento: dict, source: dict = None,
+                  timestamp: str = None) -> bool:
+        """
+        Anota un avistamiento de `fingerprint_id`. El documento solo se
+        escribe si el fingerprint no existía. Devuelve True si es nuevo.
+        """
+        ruta = self.ruta(fingerprint_id)
+        es_nuevo = fingerprint_id not in self._conocidos and not os.path.exists(ruta)
+        if es_nuevo:
+            os.makedirs(self.directorio, exist_ok=True)
+            _escribir_json(ruta, documento)
+        self._conocidos.add(fingerprint_id)
+
+        linea = json.dumps({
+            "fingerprint_id": fingerprint_id,
+            "timestamp": timestamp or datetime.utcnow().isoformat() + "Z",
+            "source": source or {},
+        }, separators=(",", ":"), ensure_ascii=False) + "\n"
+        # O_APPEND + una sola escritura: las líneas de varios workers no se mezclan
+        fd = os.open(self.registro, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, linea.encode("utf-8"))
+        finally:
+            os.close(fd)
+        return es_nuevo
+
+    # ---------- lectura ----------
+    def _leer_registro(self):
+        """Incorpora al resumen las líneas añadidas desde la última lectura."""
+        with self._lock:
+            try:
+                tamano = os.path.getsize(self.registro)
+            except OSError:
+                return
+            if tamano < self._offset:  # registro truncado o sustituido
+                self._resumen, self._offset = {}, 0
+            if tamano == self._offset:
+                return
+            with open(self.registro, "rb") as f:
+                f.seek(self._offset)
+                bloque = f.read(tamano - self._offset)
+            fin = bloque.rfind(b"\n") + 1  # ignora una última línea a medio escribir
+            self._offset += fin
+            for linea in bloque[:fin].splitlines():
+                try:
+                    captura = json.loads(linea)
+                    fp_id, ts = captura["fingerprint_id"], captura.get("timestamp") or ""
+                except (ValueError, KeyError, TypeError):
+                    continue
+                resumen = self._resumen.get(fp_id)
+                if resumen is None:
+                    self._resumen[fp_id] = [ts, ts, 1]
+                else:
+                    resumen[0] = min(resumen[0], ts)
+                    resumen[1] = max(resumen[1], ts)
+                    resumen[2] += 1
+
+    def resumen(self, fingerprint_id: str):
+        """{"first_seen", "last_seen", "capturas"} del fingerprint, o None."""
+        self._leer_registro()
+        r = self._resumen.get(fingerprint_id)
+        if r is None:
+            return None
+        return {"first_seen": r[0], "last_seen": r[1], "capturas": r[2]}
+
+    def capturas(self, fingerprint_id: str) -> list:
+        """Avistamientos de un fingerprint en orden de llegada (recorre el registro)."""
+        if not os.path.exists(self.registro):
+            return []
+        clave = f'"fingerprint_id":"{fingerprint_id}"'
+        resultado = []
+        with open(self.registro, "r", encoding="utf-8") as f:
+            for linea in f:
+                if clave not in linea:
+                    continue
+                try:
+                    resultado.append(json.loads(linea))
+                except ValueError:
+                    continue
+        return resultado
+
+    def completar(self, documento: dict) -> dict:
+        """
+        Añade first_seen / last_seen / capturas al documento guardado.
+        `timestamp` pasa a ser el último avistamiento, como cuando el
+        fichero se reescribía en cada captura.
+        """
+        resumen = self.resumen(documento.get("fingerprint_id") or "")
+        if resumen:
+            documento.update(resumen)
+            documento["timestamp"] = resumen["last_seen"]
+        return documento
+
+    def estadisticas(self) -> dict:
+        self._leer_registro()
+        documentos = bytes_documentos = 0
+        if os.path.isdir(self.directorio):
+            for nombre in os.listdir(self.directorio):
+                if nombre.endswith(".json"):
+                    documentos += 1
+                    bytes_documentos += os.path.getsize(os.path.join(self.directorio, nombre))
+        with self._lock:
+            capturas = sum(r[2] for r in self._resumen.values())
+        return {
+            "documentos": documentos,
+            "bytes_documentos": bytes_documentos,
+            "capturas": capturas,
+            "bytes_registro": os.path.getsize(self.registro) if os.path.exists(self.registro) else 0,
+        }
+
+
+ALMACEN_CAPTURAS = AlmacenCapturas()
+
+
+def registrar_captura(fingerprint_id: str, documento: dict, source: dict = None) -> bool:
+    """Atajo sobre el almacén del proceso."""
+    return ALMACEN_CAPTURAS.registrar(fingerprint_id, documento, source)
@@ -0,0 +1,215 @@
+# utils/dns_inverso.py
+"""
+DNS inverso (PTR) de las IPs de cliente sin bloquear las peticiones.
+
+socket.gethostbyaddr no tiene timeout y un PTR lento puede tardar
+segundos. Aquí las consultas se hacen en un pool de hilos:
+- hostname(ip, espera) devuelve el resultado de la caché o espera como
+  mucho `espera` segundos (FARO_DNS_ESPERA; 0 = no espera nunca);
+- si no llega a tiempo, la consulta sigue en segundo plano y rellenar()
+  escribe hostname_local en el evento ya guardado cuando se resuelve
+  (agrupando las escrituras, una actualización por tabla y lote; con el
+  backend CSV se acumulan y se aplican juntas cada
+  FARO_ACTUALIZACION_DIFERIDA_S segundos, ver utils/actualizaciones.py).
+
+Los resultados se guardan en una caché LRU con caducidad; los fallos
+("No disponible") se recuerdan menos tiempo (caché negativa).
+"""
+
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as TiempoAgotado
+
+from . import DNS_ESPERA, DNS_HILOS, DNS_CACHE_MAX, DNS_CACHE_TTL, DNS_CACHE_TTL_NEGATIVO
+from .escritor_eventos import ESCRITOR_EVENTOS
+from .actualizaciones import ACTUALIZACIONES
+
+NO_DISPONIBLE = "No disponible"
+
+# Tablas donde se guarda cada evento de baliza (balizas_eventos es una vista de eventos)
+TABLAS_EVENTO = ("eventos",)
+
+
+def _es_ip(ip: str) -> bool:
+    for familia in (socket.AF_INET, socket.AF_INET6):
+        try:
+            socket.inet_pton(familia, ip)
+            return True
+        except (OSError, TypeError):
+            continue
+    return False
+
+
+def _ptr(ip: str) -> str:
+    return socket.gethostbyaddr(ip)[0]
+
+
+class ResolvedorDns:
+    """
+    Pool de hilos para consultas PTR con caché LRU + TTL.
+    El pool y el hilo de escritura se crean en el primer uso de cada
+    proceso (seguro con los workers de gunicorn creados por fork).
+    """
+
+    def __init__(self, buscar=None, hilos: int = DNS_HILOS, maximo: int = DNS_CACHE_MAX,
+                 ttl: int = DNS_CACHE_TTL, ttl_negativo: int = DNS_CACHE_TTL_NEGATIVO,
+                 espera_lote: float = 0.5, actualizaciones=None):
+        self.buscar = buscar or _ptr
+        self.actualizaciones = actualizaciones or ACTUALIZACIONES
+        self.hilos = max(1, hilos)
+        self.maximo = max(1, maximo)
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.espera_lote = espera_lote
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()  # ip -> (expira, hostname)
+        self._en_curso = {}          # ip -> Future
+        self._pid = None
+        self._pool = None
+        self._cola = None
+        self._sin_escribir = 0
+        self._escritos = threading.Condition()
+        self._contadores = dict.fromkeys(
+            ("aciertos", "fallos", "negativos", "desalojos", "esperas_agotadas"), 0)
+
+    def _arrancar(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pool = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="dns-inverso")
+            self._cola = queue.Queue()
+            self._en_curso = {}
+            threading.Thread(target=self._escribir, args=(self._cola,),
+                             name="dns-inverso-escritura", daemon=True).start()
+            self._pid = os.getpid()
+
+    # ---------- caché ----------
+    def _en_cache(self, ip: str):
+        """Hostname cacheado y vigente (con el lock tomado), o None."""
+        entrada = self._cache.get(ip)
+        if entrada is None:
+            return None
+        if entrada[0] <= time.time():
+            del self._cache[ip]
+            return None
+        self._cache.move_to_end(ip)
+        return entrada[1]
+
+    def _resolver(self, ip: str) -> str:
+        """Consulta PTR (en un hilo del pool) y guarda el resultado."""
+        try:
+            hostname, ttl = self.buscar(ip), self.ttl
+        except Exception:
+            hostname, ttl = NO_DISPONIBLE, self.ttl_negativo
+        with self._lock:
+            if hostname == NO_DISPONIBLE:
+                self._contadores["negativos"] += 1
+            self._cache[ip] = (time.time() + ttl, hostname)
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.maximo:
+                self._cache.popitem(last=False)
+                self._contadores["desalojos"] += 1
+            self._en_curso.pop(ip, None)
+        return hostname
+
+    def _lanzar(self, ip: str) -> Future:
+        """Futuro con el hostname de `ip`: cacheado, en curso o nuevo."""
+        with self._lock:
+            hostname = self._en_cache(ip)
+            if hostname is not None:
+                futuro = Future()
+                futuro.set_result(hostname)
+                return futuro
+            futuro = self._en_curso.get(ip)
+            if futuro is None:
+                futuro = self._en_curso[ip] = self._pool.submit(self._resolver, ip)
+            return futuro
+
+    # ---------- API ----------
+    def hostname(self, ip: str, espera: float = DNS_ESPERA):
+        """
+        (hostname, pendiente). Si el PTR no se resuelve en `espera`
+        segundos devuelve ("", True) y la consulta continúa en segundo plano.
+        """
+        ip = (ip or "").strip()
+        if not _es_ip(ip):
+            return NO_DISPONIBLE, False
+        with self._lock:
+            hostname = self._en_cache(ip)
+            self._contadores["aciertos" if hostname is not None else "fallos"] += 1
+        if hostname is not None:
+            return hostname, False
+
+        self._arrancar()
+        futuro = self._lanzar(ip)
+        if espera > 0 or futuro.done():
+            try:
+                return futuro.result(timeout=espera), False
+            except TiempoAgotado:
+                with self._lock:
+                    self._contadores["esperas_agotadas"] += 1
+        return "", True
+
+    def rellenar(self, evento: dict, ip: str, tablas=TABLAS_EVENTO):
+        """Escribe hostname_local del evento ya guardado en `tablas` cuando se resuelva."""
+        ip = (ip or "").strip()
+        if not _es_ip(ip):
+            return
+        self._arrancar()
+        with self._escritos:
+            self._sin_escribir += 1
+        tablas, id_num, cola = tuple(tablas), evento.get("id_num"), self._cola
+        self._lanzar(ip).add_done_callback(lambda f: cola.put((tablas, id_num, f.result())))
+
+    def esperar(self, timeout: float = None) -> bool:
+        """Bloquea hasta escribir todo lo pendiente (herramientas y pruebas)."""
+        with self._escritos:
+            if not self._escritos.wait_for(lambda: self._sin_escribir == 0, timeout):
+                return False
+        self.actualizaciones.vaciar()
+        return True
+
+    def _escribir(self, cola: queue.Queue):
+        while True:
+            lote = [cola.get()]
+            limite = time.monotonic() + self.espera_lote
+            while True:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            try:
+                por_tabla = {}
+                for tablas, id_num, hostname in lote:
+                    for tabla in tablas:
+                        por_tabla.setdefault(tabla, {})[id_num] = {"hostname_local": hostname}
+                ESCRITOR_EVENTOS.vaciar()  # las filas a actualizar pueden seguir en cola
+                self.actualizaciones.actualizar(por_tabla)
+            except Exception as e:
+                print(f"[dns] Error escribiendo {len(lote)} hostnames: {e}")
+            finally:
+                with self._escritos:
+                    self._sin_escribir -= len(lote)
+                    self._escritos.notify_all()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            stats = dict(self._contadores)
+            stats.update({"entradas": len(self._cache), "maximo": self.maximo,
+                          "en_curso": len(self._en_curso)})
+        return stats
+
+
+RESOLVEDOR_DNS = ResolvedorDns()
+
+
+def encolar_hostname(evento: dict, ip: str, tablas=TABLAS_EVENTO):
+    """Atajo sobre el resolvedor del proceso."""
+    RESOLVEDOR_DNS.rellenar(evento, ip, tablas)
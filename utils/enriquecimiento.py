@@ -0,0 +1,155 @@
+# utils/enriquecimiento.py
+"""
+Enriquecimiento geográfico asíncrono de los eventos de baliza.
+
+La ingesta (pixel PNG, vista HTML, webhook de fingerprint) no espera a ip-api:
+- si la IP se resuelve sin red (LAN / localhost, base MaxMind local o
+  caché), el evento se guarda enriquecido directamente;
+- si no, se guarda con los campos geográficos vacíos y se encola.
+
+Un pool de hilos agrupa los eventos pendientes, resuelve sus IPs por lotes
+(geo_lookup_lote: endpoint batch de ip-api o un sustituto local con la
+misma interfaz) y rellena country / region / city / lat / lon / isp / asn
+y flag_vpn en eventos con una actualización por lote.
+
+La cola vive en memoria: los eventos pendientes de un proceso que termina
+quedan sin geolocalizar.
+
+Con el backend CSV cada actualización reescribe el fichero completo: las
+de cada lote se acumulan y se aplican juntas cada
+FARO_ACTUALIZACION_DIFERIDA_S segundos (utils/actualizaciones.py). La
+ingesta nunca espera a la API.
+"""
+
+import os
+import queue
+import threading
+import time
+
+from . import GEOIP_HILOS
+from .geoip import geo_sin_red, geo_lookup_lote, API_BATCH_MAX
+from .storage import en_vista
+from .escritor_eventos import ESCRITOR_EVENTOS
+from .actualizaciones import ACTUALIZACIONES
+from .tor_y_vpn import isp_es_vpn
+from .rangos_ip import clasificar_ip
+from . import fingerprint_behavior, identidad_fp
+
+CAMPOS_GEO = ("country", "country_code", "region", "city", "lat", "lon", "isp", "asn")
+
+# Tablas donde se guarda cada evento de baliza (balizas_eventos es una vista de eventos)
+TABLAS_BALIZA = ("eventos",)
+
+
+def geo_inmediata(ip: str):
+    """
+    Geolocalización disponible sin tocar la red.
+    Devuelve (geo, pendiente): geo es {} si hay que enriquecer después.
+    """
+    geo = geo_sin_red(ip)
+    return (geo, False) if geo is not None else ({}, True)
+
+
+class Enriquecedor:
+    """
+    Pool de hilos que rellena la geolocalización de eventos ya guardados.
+
+    Cada hilo espera un evento, reúne los que lleguen durante `espera`
+    segundos (hasta `lote`) y los resuelve con una sola llamada a `resolver`.
+    Los hilos se crean en el primer encolar() de cada proceso (seguro con
+    los workers de gunicorn creados por fork).
+    """
+
+    def __init__(self, resolver=None, hilos: int = GEOIP_HILOS,
+                 lote: int = API_BATCH_MAX, espera: float = 0.2, actualizaciones=None):
+        self.resolver = resolver or geo_lookup_lote
+        self.actualizaciones = actualizaciones or ACTUALIZACIONES
+        self.hilos = max(1, hilos)
+        self.lote = lote
+        self.espera = espera
+        self._lock = threading.Lock()
+        self._pid = None
+        self._cola = None
+
+    def _arrancar(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._cola = queue.Queue()
+            for i in range(self.hilos):
+                threading.Thread(target=self._trabajar, args=(self._cola,),
+                                 name=f"geo-enriquecedor-{i}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def encolar(self, evento: dict, ip: str = None, tablas=TABLAS_BALIZA):
+        """Programa el enriquecimiento de un evento ya guardado en `tablas`."""
+        self._arrancar()
+        ip = (ip or evento.get("ip") or "").strip()
+        self._cola.put((tuple(tablas), evento.get("id_num"), ip))
+
+    def esperar(self):
+        """Bloquea hasta procesar y escribir todo lo encolado (herramientas y pruebas)."""
+        if self._pid == os.getpid():
+            self._cola.join()
+            self.actualizaciones.vaciar()
+
+    def _trabajar(self, cola: queue.Queue):
+        while True:
+            lote = [cola.get()]
+            limite = time.monotonic() + self.espera
+            while len(lote) < self.lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    lote.append(cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+            try:
+                self._procesar(lote)
+            except Exception as e:
+                print(f"[enriquecimiento] Error procesando lote de {len(lote)} eventos: {e}")
+            finally:
+                for _ in lote:
+                    cola.task_done()
+
+    def _procesar(self, lote: list):
+        geos = self.resolver([ip for _, _, ip in lote])
+        ESCRITOR_EVENTOS.vaciar()  # las filas a actualizar pueden seguir en cola
+        por_tabla = {}
+        vpn = set()
+        for tablas, id_num, ip in lote:
+            geo = geos.get(ip)
+            if geo is None:
+                continue  # no resuelta (error de red): el evento sigue sin geolocalizar
+            cambios = {c: geo.get(c) for c in CAMPOS_GEO}
+            # Mismo formato que la ingesta de balizas
+            cambios["isp"] = (geo.get("isp") or "").strip().upper()
+            if isp_es_vpn(cambios["isp"]):
+                cambios["flag_vpn"] = True
+                # Las IPs de data/rangos ya se marcaron (y contaron) en la ingesta
+                if clasificar_ip(ip) is None:
+                    vpn.add(str(id_num))
+            for tabla in tablas:
+                por_tabla.setdefault(tabla, {})[id_num] = cambios
+
+        def al_escribir(tabla, filas):
+            # flag_vpn llega después del agregado de comportamiento: sumarlo ahora
+            # en las visitas a balizas. La fila actualizada trae el fingerprint
+            # aunque se asignara después.
+            for fila in filas:
+                if not en_vista("balizas_eventos", fila):
+                    continue
+                if str(fila.get("id_num")) in vpn and fila.get("fingerprint_id"):
+                    fingerprint_behavior.registrar_vpn(fila["fingerprint_id"])
+                    identidad_fp.registrar_vpn(fila["fingerprint_id"])
+
+        self.actualizaciones.actualizar(por_tabla, al_escribir if vpn else None)
+
+
+ENRIQUECEDOR = Enriquecedor()
+
+
+def encolar_enriquecimiento(evento: dict, ip: str = None, tablas=TABLAS_BALIZA):
+    """Atajo sobre el enriquecedor del proceso."""
+    ENRIQUECEDOR.encolar(evento, ip, tablas)
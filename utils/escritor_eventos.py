@@ -0,0 +1,212 @@
+# utils/escritor_eventos.py
+"""
+Escritor de eventos por lotes (group commit).
+
+Cada visita a una baliza escribe una fila de eventos. En vez de una
+escritura (y una transacción) por fila, las filas se encolan y un
+hilo escritor por proceso las vuelca por lotes: cuando reúne
+FARO_ESCRITOR_LOTE filas o pasan FARO_ESCRITOR_MS milisegundos desde la
+primera. Si alguna fila del lote tiene a alguien esperando, el lote no
+espera más: se vuelca con lo ya encolado, y lo que llega mientras tanto
+forma el siguiente (group commit: con N peticiones concurrentes, un
+volcado por tanda en vez de N). Cada lote es una llamada a append_tablas() del backend con
+durable=True: una transacción y un fsync para todas sus filas (en CSV,
+un fsync por fichero).
+
+- esperar=True: la llamada vuelve cuando su lote es durable (las
+  peticiones concurrentes comparten el mismo fsync). Un error del lote
+  se relanza en quien espera.
+- esperar=False: vuelve al encolar (fire-and-forget). Los lotes se
+  escriben en orden, así que esperar la última fila de una petición
+  garantiza también las anteriores.
+- Contrapresión: la cola tiene FARO_ESCRITOR_PROFUNDIDAD filas; con la
+  cola llena el productor espera hasta FARO_ESCRITOR_ESPERA_COLA
+  segundos y, si sigue llena, escribe él mismo (no se pierden filas).
+
+Quien lea filas recién escritas en segundo plano (enriquecimiento) debe
+llamar antes a vaciar(). Lo pendiente se vuelca también al salir.
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+
+from . import (
+    ESCRITOR_LOTE, ESCRITOR_MS, ESCRITOR_PROFUNDIDAD,
+    ESCRITOR_ESPERA_COLA, ESCRITOR_ESPERAR
+)
+from .storage import get_backend
+
+
+class _Pendiente:
+    """
+    Fila encolada que alguien espera: se marca al escribir su lote. Sin
+    fila (tabla None) es la marca de vaciar().
+    """
+
+    __slots__ = ("listo", "error")
+
+    def __init__(self):
+        self.listo = threading.Event()
+        self.error = None
+
+
+class EscritorLotes:
+    """
+    Cola en memoria + hilo escritor. El hilo se crea en la primera
+    escritura de cada proceso (seguro con los workers de gunicorn).
+    """
+
+    def __init__(self, lote: int = ESCRITOR_LOTE, espera_ms: float = ESCRITOR_MS,
+                 profundidad: int = ESCRITOR_PROFUNDIDAD, espera_cola: float = ESCRITOR_ESPERA_COLA):
+        self.lote = max(1, lote)
+        self.espera = espera_ms / 1000
+        self.profundidad = profundidad
+        self.espera_cola = espera_cola
+        self._lock = threading.Lock()
+        self._pid = None
+        self._cola = None
+        self._contadores = {"filas": 0, "lotes": 0, "errores": 0, "esperas_cola_llena": 0, "desbordes": 0}
+        self._latencias = {"ultima_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0}
+        self._tamano_max = 0
+
+    def _arrancar(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._cola = queue.Queue(maxsize=max(0, self.profundidad))
+            threading.Thread(target=self._escribir, args=(self._cola,),
+                             name="escritor-eventos", daemon=True).start()
+            if self._pid is None:
+                atexit.register(self.vaciar)
+            self._pid = os.getpid()
+
+    def _contar(self, clave: str, n: int = 1):
+        with self._lock:
+            self._contadores[clave] += n
+
+    # ---------- productores ----------
+    def escribir(self, tabla: str, fila: dict, esperar: bool = None):
+        """
+        Encola una fila; con esperar=True vuelve cuando su lote es durable
+        (None: FARO_ESCRITOR_ESPERAR).
+        """
+        self._arrancar()
+        if esperar is None:
+            esperar = ESCRITOR_ESPERAR
+        pendiente = _Pendiente() if esperar else None
+        fila = dict(fila)  # el productor puede seguir modificando su dict
+        elemento = (tabla, fila, pendiente)
+        try:
+            self._cola.put_nowait(elemento)
+        except queue.Full:
+            self._contar("esperas_cola_llena")
+            try:
+                self._cola.put(elemento, timeout=self.espera_cola)
+            except queue.Full:
+                # Cola saturada: escribir directamente antes que perder la fila
+                self._contar("desbordes")
+                get_backend().append_tablas({tabla: [fila]}, durable=True)
+                return
+        if pendiente is not None:
+            pendiente.listo.wait()
+            if pendiente.error is not None:
+                raise pendiente.error
+
+    def vaciar(self):
+        """
+        Bloquea hasta escribir todo lo encolado antes de la llamada. Encola
+        una marca que el hilo señala al escribir su lote: con productores
+        constantes la cola no llega a vaciarse nunca (no sirve join()).
+        """
+        if self._pid != os.getpid():
+            return
+        marca = _Pendiente()
+        self._cola.put((None, None, marca))
+        marca.listo.wait()
+
+    # ---------- hilo escritor ----------
+    def _escribir(self, cola: queue.Queue):
+        while True:
+            lote = [cola.get()]
+            esperado = lote[0][2] is not None
+            limite = time.monotonic() + self.espera
+            while len(lote) < self.lote:
+                restante = limite - time.monotonic()
+                try:
+                    if restante <= 0 or esperado:
+                        # Alguien espera el lote: no alargarlo, solo sumar lo ya encolado
+                        elemento = cola.get_nowait()
+                    else:
+                        elemento = cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                lote.append(elemento)
+                esperado = esperado or elemento[2] is not None
+            try:
+                self._volcar(lote)
+            finally:
+                for _ in lote:
+                    cola.task_done()
+
+    def _volcar(self, lote: list):
+        por_tabla = {}
+        for tabla, fila, _ in lote:
+            if tabla is not None:  # None: marca de vaciar()
+                por_tabla.setdefault(tabla, []).append(fila)
+        filas = sum(len(f) for f in por_tabla.values())
+        if not filas:
+            for _, _, pendiente in lote:
+                pendiente.listo.set()
+            return
+        error = None
+        t0 = time.perf_counter()
+        try:
+            get_backend().append_tablas(por_tabla, durable=True)
+        except Exception as e:
+            error = e
+            print(f"[escritor] Error escribiendo lote de {filas} filas: {e}")
+        ms = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            if error is None:
+                self._contadores["filas"] += filas
+                self._contadores["lotes"] += 1
+                self._latencias["total_ms"] += ms
+                self._latencias["ultima_ms"] = ms
+                self._latencias["max_ms"] = max(self._latencias["max_ms"], ms)
+                self._tamano_max = max(self._tamano_max, filas)
+            else:
+                self._contadores["errores"] += 1
+        for _, _, pendiente in lote:
+            if pendiente is not None:
+                pendiente.error = error
+                pendiente.listo.set()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            stats = dict(self._contadores)
+            lotes = stats["lotes"]
+            stats.update({
+                "cola": self._cola.qsize() if self._pid == os.getpid() else 0,
+                "profundidad": self.profundidad,
+                "lote_max": self.lote,
+                "espera_ms": self.espera * 1000,
+                "filas_por_lote": round(stats["filas"] / lotes, 1) if lotes else 0,
+                "lote_mayor": self._tamano_max,
+                "latencia_ms": {
+                    "ultima": round(self._latencias["ultima_ms"], 2),
+                    "media": round(self._latencias["total_ms"] / lotes, 2) if lotes else 0,
+                    "max": round(self._latencias["max_ms"], 2),
+                },
+            })
+        return stats
+
+
+ESCRITOR_EVENTOS = EscritorLotes()
+
+
+def escribir_evento(tabla: str, fila: dict, esperar: bool = None):
+    """Atajo sobre el escritor del proceso."""
+    ESCRITOR_EVENTOS.escribir(tabla, fila, esperar)
@@ -0,0 +1,361 @@
+# utils/event_store.py
+"""
+Capa append-only para los CSV de eventos.
+
+Evita releer el CSV completo en cada ingesta:
+- IdCounter: contador persistente de id_num (fichero .seq) con escritura
+  atómica, compartido entre procesos (flock).
+- ultimo_id_csv(): recupera el último id_num leyendo solo la cola del fichero.
+- tail_csv(): devuelve las últimas N filas sin parsear el CSV entero.
+- IndiceCsv: índice secundario persistente campo -> offsets de fila,
+  para leer solo las filas de un valor (p.ej. un fingerprint_id).
+
+El coste de asignar un ID y añadir una fila es constante,
+independientemente del tamaño de eventos.csv.
+"""
+
+import os
+import csv
+import io
+import threading
+
+from .bloqueo import bloqueo_fichero
+
+# Tamaño de bloque para leer el CSV desde el final
+TAIL_BLOCK = 64 * 1024
+
+
+# ---------------------------
+# Lectura de cola (tail index)
+# ---------------------------
+def _lineas_desde_el_final(path: str):
+    """
+    Generador de líneas completas del fichero, de la última a la primera.
+    Lee bloques desde el final, sin cargar el fichero en memoria.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        resto = b""
+
+        while pos > 0:
+            leer = min(TAIL_BLOCK, pos)
+            pos -= leer
+            f.seek(pos)
+            bloque = f.read(leer) + resto
+            lineas = bloque.split(b"\n")
+
+            # La primera línea del bloque puede estar incompleta
+            resto = lineas.pop(0)
+            for linea in reversed(lineas):
+                if linea.strip():
+                    yield linea.decode("utf-8", errors="replace")
+
+        if resto.strip():
+            yield resto.decode("utf-8", errors="replace")
+
+
+def _leer_registro(f) -> bytes:
+    """
+    Lee un registro CSV completo desde la posición actual de `f` (binario),
+    uniendo líneas si un campo entrecomillado contiene saltos de línea.
+    """
+    registro = f.readline()
+    while registro and registro.count(b'"') % 2:
+        siguiente = f.readline()
+        if not siguiente:
+            break
+        registro += siguiente
+    return registro
+
+
+def _parsear_linea(linea: str) -> list:
+    try:
+        return next(csv.reader(io.StringIO(linea)))
+    except (StopIteration, csv.Error):
+        return []
+
+
+def ultimo_id_csv(path: str, columna: int = 0) -> int:
+    """
+    Devuelve el mayor id_num de las últimas filas del CSV (0 si no hay).
+    Solo recorre el fichero hasta encontrar la primera fila con ID numérico.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return 0
+
+    for linea in _lineas_desde_el_final(path):
+        campos = _parsear_linea(linea)
+        if len(campos) <= columna:
+            continue
+        try:
+            return int(campos[columna])
+        except ValueError:
+            # Cabecera o fila con ID no numérico (uuid): seguir hacia atrás
+            continue
+    return 0
+
+
+def tail_csv(path: str, n: int = 25) -> list:
+    """
+    Devuelve las últimas n filas del CSV como diccionarios,
+    en orden de escritura (la más reciente al final).
+    """
+    if n <= 0 or not os.path.exists(path) or os.path.getsize(path) == 0:
+        return []
+
+    with open(path, newline="", encoding="utf-8") as f:
+        cabecera = next(csv.reader(f), None)
+    if not cabecera:
+        return []
+
+    filas = []
+    for linea in _lineas_desde_el_final(path):
+        campos = _parsear_linea(linea)
+        if not campos or campos == cabecera:
+            continue
+        filas.append(dict(zip(cabecera, campos)))
+        if len(filas) >= n:
+            break
+
+    filas.reverse()
+    return filas
+
+
+# ---------------------------
+# Contador persistente de IDs
+# ---------------------------
+class IdCounter:
+    """
+    Contador monotónico persistido en un fichero de texto.
+
+    - El fichero guarda el siguiente ID libre.
+    - Cada reserva lee y escribe el fichero con un flock tomado
+      (bloqueo_fichero): los workers de gunicorn comparten el contador y
+      nunca reciben el mismo ID. Los IDs son únicos y crecientes en el
+      orden de las reservas de todos los procesos.
+    - Se sobrescribe en su sitio con ancho fijo (una sola write() de 21
+      bytes, sin fsync ni tmp + os.replace por ID): una caída puede dejar
+      el fichero atrasado o dañado, y la reconciliación lo corrige.
+    - Si el fichero falta o está dañado, se reconstruye con la función
+      `recuperar` (último ID persistido en el CSV).
+    - La primera reserva de cada proceso reconcilia con el CSV por si
+      se escribieron filas sin pasar por el contador (o el contador no
+      llegó a disco antes de una caída).
+    """
+
+    def __init__(self, path: str, recuperar):
+        self.path = path
+        self._recuperar = recuperar
+        self._reconciliado = False
+
+    def _leer(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _escribir(self, valor: int):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            contenido = f"{valor:020d}\n".encode("ascii")
+            os.write(fd, contenido)
+            os.ftruncate(fd, len(contenido))  # ficheros antiguos sin ancho fijo
+        finally:
+            os.close(fd)
+
+    def reservar(self) -> int:
+        """Reserva y devuelve el siguiente ID."""
+        with bloqueo_fichero(self.path):
+            siguiente = self._leer()
+
+            if siguiente is None or not self._reconciliado:
+                persistido = self._recuperar() + 1
+                siguiente = max(siguiente or 1, persistido)
+                self._reconciliado = True
+
+            self._escribir(siguiente + 1)
+            return siguiente
+
+    def actual(self) -> int:
+        """Devuelve el siguiente ID que se reservaría, sin consumirlo."""
+        with bloqueo_fichero(self.path):
+            siguiente = self._leer()
+            if siguiente is None:
+                siguiente = self._recuperar() + 1
+            return max(siguiente, 1)
+
+
+# ---------------------------
+# Índice secundario (valor -> offsets)
+# ---------------------------
+class IndiceCsv:
+    """
+    Índice persistente de un campo de un CSV: valor -> offsets (en bytes)
+    del inicio de cada fila con ese valor. Los valores vacíos no se indexan.
+
+    - Fichero <csv>.<campo>.idx con líneas "valor<TAB>offset", append-only.
+      Cada escritura termina con una marca "<TAB>tamaño": los bytes del CSV
+      que cubre el índice.
+    - Se amplía en cada append (registrar) y se sustituye completo cuando
+      el CSV se reescribe (reemplazar).
+    - Si el tamaño del CSV no coincide con el de la marca (escrito por
+      fuera, o un append sin índice), el índice se reconstruye recorriendo
+      el CSV una vez.
+    - Otros procesos que añaden al índice se detectan por su tamaño:
+      solo se leen las líneas nuevas. Si otro proceso lo ha sustituido
+      (otro inodo), se vuelve a cargar entero.
+    - Quien escribe el CSV amplía el índice con el bloqueo del CSV
+      tomado (bloqueo_fichero); la reconstrucción lo toma también, así
+      que nunca recorre un append a medias de otro worker.
+    """
+
+    def __init__(self, ruta_csv: str, campo: str):
+        self.ruta_csv = ruta_csv
+        self.campo = campo
+        self.path = f"{ruta_csv}.{campo}.idx"
+        self._lock = threading.Lock()
+        self._mapa = {}
+        self._leido = 0  # bytes del .idx ya cargados en memoria
+        self._inodo = None
+
+    # ---------- persistencia ----------
+    def _cargar_desde(self, inicio: int):
+        with open(self.path, "rb") as f:
+            self._inodo = os.fstat(f.fileno()).st_ino
+            f.seek(inicio)
+            for linea in f:
+                if not linea.endswith(b"\n"):
+                    break  # línea a medio escribir por otro proceso
+                valor, _, offset = linea.decode("utf-8").rstrip("\n").rpartition("\t")
+                if valor:  # las marcas de tamaño no son entradas
+                    self._mapa.setdefault(valor, []).append(int(offset))
+                inicio += len(linea)
+        self._leido = inicio
+
+    def _cubierto(self):
+        """Bytes del CSV que cubre el índice (marca de su última línea), o None."""
+        try:
+            with open(self.path, "rb") as f:
+                tam = f.seek(0, os.SEEK_END)
+                inicio = max(0, tam - 64)
+                f.seek(inicio)
+                cola = f.read()
+        except FileNotFoundError:
+            return None
+        if not cola.endswith(b"\n"):
+            return None  # vacío o última línea a medio escribir
+        _, salto, linea = cola[:-1].rpartition(b"\n")
+        if not salto and inicio:
+            return None  # la última línea no cabe en la cola: no es una marca
+        valor, _, hasta = linea.rpartition(b"\t")
+        return int(hasta) if not valor and hasta.isdigit() else None
+
+    def _tam_csv(self) -> int:
+        try:
+            return os.path.getsize(self.ruta_csv)
+        except FileNotFoundError:
+            return 0
+
+    def _vigente(self) -> bool:
+        return self._cubierto() == self._tam_csv()
+
+    def _escribir(self, pares: list, hasta: int, modo: str):
+        if modo == "wb":
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(self._serializar(pares, hasta))
+            os.replace(tmp, self.path)
+            return
+        with open(self.path, "ab") as f:
+            f.write(self._serializar(pares, hasta))
+
+    @staticmethod
+    def _serializar(pares: list, hasta: int) -> bytes:
+        lineas = [f"{v}\t{o}\n" for v, o in pares if v]
+        lineas.append(f"\t{hasta}\n")
+        return "".join(lineas).encode("utf-8")
+
+    def _reconstruir(self):
+        """Recorre el CSV completo y regenera el índice."""
+        with bloqueo_fichero(self.ruta_csv):
+            # Otro worker puede haberlo reconstruido (o terminado su append)
+            # mientras se esperaba el bloqueo
+            if not self._vigente():
+                self._escribir(self._recorrer_csv(), self._tam_csv(), "wb")
+            with self._lock:
+                self._mapa, self._leido = {}, 0
+                self._cargar_desde(0)
+
+    def _recorrer_csv(self) -> list:
+        pares = []
+        if os.path.exists(self.ruta_csv) and os.path.getsize(self.ruta_csv):
+            with open(self.ruta_csv, "rb") as f:
+                cabecera = _parsear_linea(_leer_registro(f).decode("utf-8", errors="replace"))
+                if self.campo in cabecera:
+                    col = cabecera.index(self.campo)
+                    while True:
+                        offset = f.tell()
+                        registro = _leer_registro(f)
+                        if not registro:
+                            break
+                        campos = next(csv.reader(io.StringIO(registro.decode("utf-8", errors="replace"))), [])
+                        if len(campos) > col and campos[col]:
+                            pares.append((campos[col], offset))
+        return pares
+
+    def _sincronizar(self):
+        st = os.stat(self.path)
+        if st.st_ino != self._inodo or st.st_size < self._leido:
+            self._mapa, self._leido = {}, 0  # reemplazado por otro proceso
+        if st.st_size != self._leido:
+            self._cargar_desde(self._leido)
+
+    # ---------- API ----------
+    # Orden de bloqueos: el del CSV (bloqueo_fichero) antes que self._lock
+    def registrar(self, pares: list, inicio: int, fin: int):
+        """
+        Añade pares (valor, offset) de las filas recién escritas en el CSV
+        entre los bytes `inicio` y `fin`. Se llama con el bloqueo del CSV
+        tomado.
+        """
+        with self._lock:
+            if self._cubierto() != inicio:
+                # El índice se reconstruirá completo en la próxima búsqueda
+                return
+            self._escribir(pares, fin, "ab")
+
+    def reemplazar(self, pares: list):
+        """
+        Sustituye el índice completo (tras reescribir el CSV, con su
+        bloqueo tomado).
+        """
+        with self._lock:
+            self._escribir(pares, self._tam_csv(), "wb")
+            self._mapa, self._leido = {}, 0
+
+    def offsets(self, valores) -> list:
+        """Offsets (ordenados) de las filas cuyo campo está en `valores`."""
+        if not self._vigente():
+            self._reconstruir()
+        with self._lock:
+            self._sincronizar()
+            encontrados = set()
+            for v in valores:
+                encontrados.update(self._mapa.get(v, ()))
+            return sorted(encontrados)
+
+    def leer_filas(self, offsets: list):
+        """Generador de filas (dict) del CSV en los offsets dados."""
+        if not offsets:
+            return
+        with open(self.ruta_csv, "rb") as f:
+            cabecera = _parsear_linea(_leer_registro(f).decode("utf-8", errors="replace"))
+            for offset in offsets:
+                f.seek(offset)
+                registro = _leer_registro(f).decode("utf-8", errors="replace")
+                campos = next(csv.reader(io.StringIO(registro)), [])
+                if campos:
+                    yield dict(zip(cabecera, campos))
+
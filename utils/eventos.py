@@ -1,17 +1,29 @@
 # utils/eventos.py
 """
-Módulo para gestión de eventos en CSV.
+Módulo para gestión de eventos.
+
+La persistencia se delega en el backend configurado (utils/storage.py):
+SQLite por defecto o el CSV original.
 
 Funciones principales:
 - cargar_eventos(): devuelve todos los eventos como lista de diccionarios.
-- guardar_eventos(eventos): sobrescribe el CSV con los eventos dados.
-- siguiente_id(eventos): calcula el siguiente ID incremental para un nuevo evento.
+- paginar_eventos(...): página de eventos (cursor) filtrada y ordenada por timestamp.
+- preparar_evento(evento): copia normalizada de un evento.
+- guardar_evento(evento): añade un evento normalizado (escritor por lotes).
+- guardar_eventos(eventos): sobrescribe la tabla con los eventos dados
+  (las visitas a balizas se conservan).
+- borrar_evento(id_num): elimina un evento concreto (salvo visitas a balizas).
+- siguiente_id(): reserva el siguiente ID incremental para un nuevo evento (O(1)).
+- ultimos_eventos(n): devuelve los últimos n eventos escritos.
 """
 
-import os
-import csv
+from . import BASE_DIR, EVENTOS_SEQ
+from .event_store import IdCounter
+from .storage import get_backend, EVENTO_FIELDS
+from .escritor_eventos import escribir_evento
 
-from . import BASE_DIR, EVENTOS_CSV
+# Contador persistente de id_num: evita recorrer la tabla en cada ingesta
+CONTADOR_EVENTOS = IdCounter(EVENTOS_SEQ, lambda: get_backend().max_id("eventos"))
 
 
 # Claves estandar para los eventos
@@ -21,48 +33,36 @@ from . import BASE_DIR, EVENTOS_CSV
 #     "region", "city", "lat", "lon", "isp", "ip_local", "hostname_local", "fingerprint_id", "flag_tor", "flag_vpn"
 # ]
 
+def _normalizar_evento(row: dict):
+    """Convierte una fila del backend al dict de evento usado por vistas y plantillas."""
+    try:
+        id_num = int(row["id_num"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    evento = {k: row.get(k) or "" for k in EVENTO_FIELDS}
+    evento["id_num"] = id_num
+    evento["flag_tor"] = str(row.get("flag_tor")).lower() == "true"
+    evento["flag_vpn"] = str(row.get("flag_vpn")).lower() == "true"
+
+    # Los flags se guardan en la ingesta; para recalcularlos con listas
+    # TOR / rangos más recientes: tools/reenriquecer_eventos.py
+    return evento
+
+
 def cargar_eventos():
     """
-    Carga todos los eventos desde el CSV.
+    Carga todos los eventos.
 
     Returns:
-        list[dict]: Lista de eventos, vacía si el CSV no existe.
+        list[dict]: Lista de eventos, vacía si no hay ninguno.
     """
-    if not os.path.exists(EVENTOS_CSV):
-        return []
-
     eventos = []
     try:
-        with open(EVENTOS_CSV, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                eventos.append({
-                    "id_num": int(row["id_num"]),
-                    "timestamp": row["timestamp"],
-                    "ip": row["ip"],
-                    "tipo": row["tipo"],
-                    "evento": row["evento"],
-                    "origen": row["origen"],
-                    "payload": row["payload"],
-                    "so": row["so"],
-                    "navegador": row["navegador"],
-                    "user_agent": row["user_agent"],
-                    "country": row["country"],
-                    "country_code": row["country_code"],
-                    "region": row["region"],
-                    "city": row["city"],
-                    "lat": row["lat"],
-                    "lon": row["lon"],
-                    "isp": row["isp"],
-                    "ip_local": row["ip_local"],
-                    "hostname_local": row["hostname_local"],
-                    "fingerprint_id": row["fingerprint_id"],
-                    "flag_tor": str(row.get("flag_tor")).lower() == "true",
-                    "flag_vpn": str(row.get("flag_vpn")).lower() == "true"
-
-                    # "flag_tor": analyze_ip(row["ip"])["TOR"],
-                    # "flag_vpn": analyze_ip(row["ip"])["VPN"]
-                })
+        for row in get_backend().iterar("eventos"):
+            evento = _normalizar_evento(row)
+            if evento:
+                eventos.append(evento)
     except Exception as e:
         print(f"[eventos] Error al cargar eventos: {e}")
         return []
@@ -70,31 +70,56 @@ def cargar_eventos():
     return eventos
 
 
+def paginar_eventos(filtros: dict = None, tam_pagina: int = 25,
+                    antes: str = None, despues: str = None, ultima: bool = False):
+    """
+    Devuelve una página de eventos ordenados por timestamp descendente,
+    usando paginación por cursor (coste independiente de la página).
 
+    Args:
+        filtros (dict): igualdad por campo, p.ej. {"ip": "1.2.3.4"}
+        tam_pagina (int): eventos por página
+        antes / despues (str): cursor de la página siguiente / anterior
+        ultima (bool): página con los eventos más antiguos
+
+    Returns:
+        tuple: (eventos, total filtrado, cursor_antes, cursor_despues)
+    """
+    backend = get_backend()
+    filas, cursor_antes, cursor_despues = backend.paginar(
+        "eventos", filtros=filtros, limite=tam_pagina,
+        antes=antes, despues=despues, ultima=ultima
+    )
+    eventos = [e for e in (_normalizar_evento(r) for r in filas) if e]
+    return eventos, backend.contar("eventos", filtros), cursor_antes, cursor_despues
 
 
-def siguiente_id(eventos):
+def siguiente_id():
     """
-    Calcula el siguiente ID incremental para un nuevo evento.
+    Reserva el siguiente ID incremental para un nuevo evento.
 
-    Args:
-        eventos (list[dict]): Lista de eventos existentes
+    Usa el contador persistente (eventos.seq), por lo que el coste
+    no depende del número de eventos almacenados.
 
     Returns:
         int: Siguiente ID numérico
     """
-    if not eventos:
-        return 1
-    return max(e["id_num"] for e in eventos) + 1
+    return CONTADOR_EVENTOS.reservar()
 
 
-def guardar_evento(evento: dict):
+def ultimos_eventos(n: int = 25):
     """
-    Añade un evento al CSV con normalización estricta
-    para garantizar cálculos SOC deterministas.
+    Devuelve los últimos n eventos escritos (el más reciente primero),
+    sin recorrer la tabla completa.
     """
+    return [e for e in (_normalizar_evento(r) for r in get_backend().ultimas("eventos", n)) if e]
 
-    ensure_eventos_header()
+
+def preparar_evento(evento: dict) -> dict:
+    """
+    Copia del evento con normalización estricta
+    para garantizar cálculos SOC deterministas.
+    """
 
     # -----------------------------
     # Normalización SOC
@@ -123,54 +148,48 @@ def guardar_evento(evento: dict):
     evento["flag_tor"] = bool(evento.get("flag_tor", False))
     evento["flag_vpn"] = bool(evento.get("flag_vpn", False))
 
-    with open(EVENTOS_CSV, "a", newline="", encoding="utf-8") as f:
-        fieldnames = [
-            "id_num", "timestamp", "ip", "tipo", "evento", "origen",
-            "payload", "so", "navegador", "user_agent",
-            "country", "country_code", "region", "city", "lat", "lon", "isp",
-            "ip_local", "hostname_local", "fingerprint_id", "flag_tor", "flag_vpn"
-        ]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writerow(evento)
+    return evento
 
 
+def guardar_evento(evento: dict, esperar: bool = None):
+    """
+    Añade un evento normalizado (preparar_evento).
 
-def ensure_eventos_header():
-    """Crea la cabecera de CSV de eventos si no existe."""
-    if not os.path.exists(EVENTOS_CSV) or os.path.getsize(EVENTOS_CSV) == 0:
-        with open(EVENTOS_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                "id_num", "timestamp", "ip", "tipo", "evento", "origen",
-                "payload", "so", "navegador", "user_agent",
-                "country", "country_code", "region", "city", "lat", "lon", "isp",
-                "ip_local", "hostname_local", "fingerprint_id", "flag_tor", "flag_vpn"
-            ])
+    La escritura pasa por el escritor por lotes (utils/escritor_eventos.py):
+    esperar=False vuelve sin esperar a que el lote sea durable. Las visitas
+    a balizas se guardan con guardar_evento_baliza (utils/balizas.py): una
+    sola fila en eventos, marcada como de baliza.
+    """
+    escribir_evento("eventos", preparar_evento(evento), esperar)
 
 
 def guardar_eventos(eventos):
     """
-    Sobrescribe el CSV con la lista de eventos proporcionada.
+    Sobrescribe la tabla de eventos con la lista proporcionada.
+
+    Las visitas a balizas (vista balizas_eventos) se conservan: son el
+    histórico de las balizas y de sus contadores derivados.
 
     Args:
         eventos (list[dict]): Lista de eventos a guardar
     """
-    if not eventos:
-        with open(EVENTOS_CSV, "w", newline="", encoding="utf-8") as f:
-            f.write("")  # CSV vacío con cabecera opcional
-        return
-
-    fieldnames = eventos[0].keys()
-
     try:
-        with open(EVENTOS_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(eventos)
+        backend = get_backend()
+        backend.vaciar("eventos", conservar_vistas=True)
+        if eventos:
+            backend.append_many("eventos", eventos)
     except Exception as e:
         print(f"[eventos] Error al guardar eventos: {e}")
 
 
+def borrar_evento(id_num: int) -> int:
+    """
+    Elimina el evento con ese id_num. Devuelve el número de filas borradas
+    (0 si es una visita a una baliza: se conservan).
+    """
+    return get_backend().borrar("eventos", id_num, conservar_vistas=True)
+
+
 
 # Al inicio del archivo, tras imports
 #FINGERPRINT_CACHE = {}  # fingerprint_id -> {"TOR": bool, "VPN": bool}
@@ -1,10 +1,13 @@
-import os
 import json
 import hashlib
 from datetime import datetime
 from typing import Dict, Tuple
 
-from . import FINGERPRINTS_DIR, BASE_DIR
+from . import BASE_DIR
+from .capturas_fp import ALMACEN_CAPTURAS
+from .manifiesto_fp import registrar_captura
+from .identidad_fp import enlazar_fingerprint
+from .motores_fp import registrar_motores
 
 def calcular_hash_estable(core_signals: Dict) -> str:
     """
@@ -48,14 +51,13 @@ def guardar_fingerprint(payload: Dict, source: Dict) -> Tuple[str, bool]:
 
     hash_estable = calcular_hash_estable(core)
     fingerprint_id = f"fp_{hash_estable[:16]}"
-    path = os.path.join(FINGERPRINTS_DIR, f"{fingerprint_id}.json")
-    es_nuevo = not os.path.exists(path)
-
-    print(f"[FP] {'NUEVO' if es_nuevo else 'YA EXISTENTE'} fingerprint → {fingerprint_id}")
+    timestamp = datetime.utcnow().isoformat() + "Z"
 
+    # El documento se escribe solo la primera vez; cada avistamiento va
+    # al registro de capturas (utils/capturas_fp.py)
     data = {
         "fingerprint_id": fingerprint_id,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "timestamp": timestamp,
         "source": source,
         "hash": {
             "stable": hash_estable,
@@ -67,8 +69,11 @@ def guardar_fingerprint(payload: Dict, source: Dict) -> Tuple[str, bool]:
         },
         "raw": payload
     }
+    es_nuevo = ALMACEN_CAPTURAS.registrar(fingerprint_id, data, source, timestamp)
+    registrar_captura(fingerprint_id, data, source, timestamp)
+    enlazar_fingerprint(fingerprint_id)
+    registrar_motores(fingerprint_id, engines)
 
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    print(f"[FP] {'NUEVO' if es_nuevo else 'YA EXISTENTE'} fingerprint → {fingerprint_id}")
 
     return fingerprint_id, es_nuevo
@@ -10,6 +10,10 @@ from datetime import datetime
 # ---------------------------------------------------------------------
 
 from . import  BASE_DIR, FINGERPRINTS_DIR
+from .capturas_fp import ALMACEN_CAPTURAS
+from .manifiesto_fp import registrar_captura
+from .identidad_fp import enlazar_fingerprint
+from .motores_fp import registrar_motores
 
 # Asegura la existencia del directorio de fingerprints
 os.makedirs(FINGERPRINTS_DIR, exist_ok=True)
@@ -65,39 +69,29 @@ def fingerprint_hash(fp: dict) -> str:
 def store_fingerprint(fp: dict) -> str:
     """
     Guarda el fingerprint completo en disco si no existe.
-    Si ya existe, actualiza únicamente el campo last_seen.
+    Si ya existe, solo se anota el avistamiento en el registro de capturas
+    (last_seen se obtiene de ahí, sin reescribir el documento).
 
     Devuelve:
         fingerprint_id (hash estable)
     """
 
     fp_id = fingerprint_hash(fp)
-    path = os.path.join(FINGERPRINTS_DIR, f"{fp_id}.json")
     now = datetime.utcnow().isoformat() + "Z"
 
-    if not os.path.exists(path):
-        # Primer avistamiento del fingerprint
-        payload = {
-            "fingerprint_id": fp_id,
-            "first_seen": now,
-            "last_seen": now,
-            "data": fp
-        }
-
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2)
-
-    else:
-        # Fingerprint ya conocido → solo se actualiza last_seen
-        try:
-            with open(path, "r+", encoding="utf-8") as f:
-                payload = json.load(f)
-                payload["last_seen"] = now
-                f.seek(0)
-                json.dump(payload, f, indent=2)
-                f.truncate()
-        except Exception:
-            # Fallo silencioso: no rompe ingestión
-            pass
+    documento = {
+        "fingerprint_id": fp_id,
+        "first_seen": now,
+        "last_seen": now,
+        "data": fp
+    }
+    try:
+        ALMACEN_CAPTURAS.registrar(fp_id, documento, timestamp=now)
+        registrar_captura(fp_id, documento, {}, now)
+        enlazar_fingerprint(fp_id)
+        registrar_motores(fp_id, fp.get("engines"))
+    except Exception:
+        # Fallo silencioso: no rompe ingestión
+        pass
 
     return fp_id
@@ -1,114 +1,261 @@
 # utils/fingerprint_behavior.py
+"""
+Comportamiento por fingerprint (vista SOC Behavior).
+
+Agregado incremental: cada evento de baliza con fingerprint actualiza el
+estado de su fingerprint (visitas, primera/última visita, balizas, TOR/VPN,
+score y clasificación) en el backend (espacio "behavior"). La vista lee
+los agregados ya calculados: siempre al día, sin recalcular el histórico.
+
+El recálculo completo (reconstruir) solo es necesario la primera vez o
+para reparar el estado; recorre el archivo Parquet de forma columnar y el
+backend caliente.
+"""
 
-import csv
-import os
-from collections import defaultdict
 from datetime import datetime, timezone
 from typing import List, Dict, Tuple, Optional
 
-from . import BALIZAS_EVENTOS_CSV, FINGERPRINT_BEHAVIOUR_CSV
+from . import archivo
+from .storage import get_backend
+from .escritor_eventos import ESCRITOR_EVENTOS
+
+# Espacio del estado derivado en el backend
+ESPACIO_BEHAVIOR = "behavior"
+
+# Columnas necesarias para el cálculo (el archivo Parquet solo lee estas)
+COLUMNAS_BEHAVIOR = ["fingerprint_id", "timestamp", "payload", "origen", "flag_tor", "flag_vpn"]
 
 # ---------------------------------------------------------
 # Utils
 # ---------------------------------------------------------
 def parse_ts(ts_str: str) -> Optional[datetime]:
-    """Convierte timestamp ISO8601 a datetime UTC."""
+    """Convierte timestamp ISO8601 a datetime UTC (sin zona => UTC)."""
     try:
-        return datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
+        dt = datetime.fromisoformat(ts_str.replace("Z", "+00:00"))
     except Exception:
         return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
 
 def to_bool(v) -> bool:
     return str(v).lower() == "true"
 
+
+def _puntuar(visitas: int, window_sec: int, tor: int, vpn: int) -> Tuple[int, str]:
+    """Score y clasificación a partir de los contadores del fingerprint."""
+    base_score = min(100, window_sec // 120 + visitas * 5)
+
+    # Ajuste de score
+    score = base_score
+    if tor > 0:
+        score = 100
+    elif vpn > 0 and base_score >= 60:
+        score = min(100, base_score + 20)
+
+    # Clasificación
+    if score < 50:
+        classification = "LEGIT"
+    elif score < 80:
+        classification = "SUSPICIOUS"
+    else:
+        classification = "MALICIOUS"
+    return score, classification
+
+
+def _nuevo_estado(visitas: int, balizas, ts_min: datetime, ts_max: datetime, tor: int, vpn: int) -> dict:
+    """Estado persistido de un fingerprint (serializable a JSON)."""
+    window_sec = int((ts_max - ts_min).total_seconds())
+    score, classification = _puntuar(visitas, window_sec, tor, vpn)
+    return {
+        "visitas": visitas,
+        "balizas": sorted(balizas),
+        "ts_min": ts_min.isoformat(),
+        "ts_max": ts_max.isoformat(),
+        "tor": tor,
+        "vpn": vpn,
+        "score": score,
+        "clasificacion": classification,
+    }
+
+
+def _fila_resultado(fp: str, e: dict) -> dict:
+    """Fila de la vista SOC Behavior a partir del estado de un fingerprint."""
+    visitas = e["visitas"]
+    window_sec = int((parse_ts(e["ts_max"]) - parse_ts(e["ts_min"])).total_seconds())
+    return {
+        "fingerprint": fp,
+        "TOR": f"YES {e['tor']}/{visitas}" if e["tor"] else f"NO 0/{visitas}",
+        "VPN": f"YES {e['vpn']}/{visitas}" if e["vpn"] else f"NO 0/{visitas}",
+        "Visitas": visitas,
+        "Balizas": len(e["balizas"]),
+        "Ventana (s)": window_sec,
+        "Score": e["score"],
+        "Clasificación": e["clasificacion"],
+    }
+
+
+# ---------------------------------------------------------
+# Actualización incremental (por evento)
+# ---------------------------------------------------------
+def registrar_evento(evento: dict):
+    """
+    Suma un evento de baliza al estado de su fingerprint, O(1).
+    Se llama al guardar un evento con fingerprint o al asignárselo después.
+    """
+    fp = (evento.get("fingerprint_id") or "").strip()
+    ts = parse_ts(evento.get("timestamp") or "")
+    if not fp or not ts:
+        return None
+
+    baliza = evento.get("payload") or evento.get("origen", "UNKNOWN")
+    tor = int(to_bool(evento.get("flag_tor")))
+    vpn = int(to_bool(evento.get("flag_vpn")))
+
+    def sumar(e):
+        if e is None:
+            return _nuevo_estado(1, {baliza}, ts, ts, tor, vpn)
+        return _nuevo_estado(
+            e["visitas"] + 1,
+            set(e["balizas"]) | {baliza},
+            min(parse_ts(e["ts_min"]), ts),
+            max(parse_ts(e["ts_max"]), ts),
+            e["tor"] + tor,
+            e["vpn"] + vpn,
+        )
+
+    try:
+        return get_backend().modificar_estado(ESPACIO_BEHAVIOR, fp, sumar)
+    except Exception as e:
+        # El agregado nunca debe impedir registrar la visita
+        print(f"[behavior] Error actualizando {fp}: {e}")
+        return None
+
+
+def registrar_vpn(fp: str, n: int = 1):
+    """
+    Suma `n` visitas VPN a un fingerprint ya registrado. Se usa cuando el
+    enriquecimiento en segundo plano marca flag_vpn en eventos ya contados.
+    """
+    def sumar(e):
+        if e is None:
+            return None
+        return _nuevo_estado(e["visitas"], e["balizas"], parse_ts(e["ts_min"]), parse_ts(e["ts_max"]),
+                             e["tor"], e["vpn"] + n)
+
+    try:
+        return get_backend().modificar_estado(ESPACIO_BEHAVIOR, fp, sumar)
+    except Exception as e:
+        print(f"[behavior] Error actualizando {fp}: {e}")
+        return None
+
+
+# ---------------------------------------------------------
+# Reconstrucción completa (histórico)
+# ---------------------------------------------------------
+def _acumular(acum: dict, fp: str, balizas, ts_min: datetime, ts_max: datetime,
+              visitas: int, tor: int, vpn: int):
+    """Suma un grupo de visitas de un fingerprint a su acumulado."""
+    a = acum.get(fp)
+    if a is None:
+        a = acum[fp] = {"visitas": 0, "balizas": set(), "ts_min": ts_min, "ts_max": ts_max, "tor": 0, "vpn": 0}
+    a["visitas"] += visitas
+    a["balizas"].update(balizas)
+    a["ts_min"] = min(a["ts_min"], ts_min)
+    a["ts_max"] = max(a["ts_max"], ts_max)
+    a["tor"] += tor
+    a["vpn"] += vpn
+
+
+# Filas del archivo agregadas de una vez (acota la memoria del group_by)
+FILAS_POR_AGREGACION = 1000000
+
+
+def _agregar_lotes(acum: dict, lotes: list):
+    pa, pc = archivo.pa, archivo.pc
+    t = pa.Table.from_batches(lotes)
+    t = t.filter(pc.and_(pc.not_equal(t["fingerprint_id"], ""), pc.not_equal(t["timestamp"], "")))
+    if not t.num_rows:
+        return
+    grupos = pa.table({
+        "fp": t["fingerprint_id"],
+        "baliza": pc.if_else(pc.not_equal(t["payload"], ""), t["payload"], t["origen"]),
+        "ts": t["timestamp"],
+        "tor": pc.cast(pc.equal(pc.utf8_lower(t["flag_tor"]), "true"), pa.int64()),
+        "vpn": pc.cast(pc.equal(pc.utf8_lower(t["flag_vpn"]), "true"), pa.int64()),
+    }).group_by("fp").aggregate([
+        ("ts", "min"), ("ts", "max"), ("ts", "count"),
+        ("tor", "sum"), ("vpn", "sum"), ("baliza", "distinct"),
+    ])
+    for g in grupos.to_pylist():
+        ts_min, ts_max = parse_ts(g["ts_min"]), parse_ts(g["ts_max"])
+        if not ts_min or not ts_max:
+            continue
+        _acumular(acum, g["fp"], g["baliza_distinct"], ts_min, ts_max,
+                  g["ts_count"], g["tor_sum"], g["vpn_sum"])
+
+
+def _acumular_archivo(acum: dict):
+    """
+    Agrega el archivo Parquet por fingerprint de forma columnar
+    (pyarrow group_by), sin construir un dict por evento.
+    """
+    lotes, filas = [], 0
+    for lote in archivo.escanear("balizas_eventos", COLUMNAS_BEHAVIOR):
+        lotes.append(lote)
+        filas += lote.num_rows
+        if filas >= FILAS_POR_AGREGACION:
+            _agregar_lotes(acum, lotes)
+            lotes, filas = [], 0
+    if lotes:
+        _agregar_lotes(acum, lotes)
+
+
 # -------------------------------
 # Core
 # -------------------------------
-def calculate_behavior(force: bool = False, max_age_minutes: int = 5):
+def reconstruir() -> dict:
     """
-    Calcula métricas de comportamiento por fingerprint.
+    Recalcula el estado de todos los fingerprints desde el histórico
+    (archivo columnar + backend caliente) y lo sustituye en el backend.
+    """
+    # Las filas aún en cola ya se sumaron al encolarlas: deben estar en el recuento
+    ESCRITOR_EVENTOS.vaciar()
+    acum = {}
+    _acumular_archivo(acum)
+    for row in get_backend().iterar("balizas_eventos", columnas=COLUMNAS_BEHAVIOR):
+        fp = row.get("fingerprint_id")
+        if not fp:
+            continue
+        ts = parse_ts(row.get("timestamp", ""))
+        if not ts:
+            continue
+        baliza = row.get("payload") or row.get("origen", "UNKNOWN")
+        _acumular(acum, fp, (baliza,), ts, ts, 1,
+                  int(to_bool(row.get("flag_tor"))), int(to_bool(row.get("flag_vpn"))))
+
+    estados = {
+        fp: _nuevo_estado(a["visitas"], a["balizas"], a["ts_min"], a["ts_max"], a["tor"], a["vpn"])
+        for fp, a in acum.items()
+    }
+    get_backend().reemplazar_estado(ESPACIO_BEHAVIOR, estados)
+    return estados
+
+
+def calculate_behavior(force: bool = False):
+    """
+    Métricas de comportamiento por fingerprint.
     TOR/VPN se calculan de forma estable por IP pública / ISP único.
+
+    Lee los agregados incrementales (siempre al día). Solo recorre el
+    histórico si aún no existen o con force=True.
     Devuelve lista de dicts y timestamp de cálculo.
     """
     now = datetime.now(timezone.utc)
 
-    # Reusar CSV si es reciente
-    if not force and os.path.exists(FINGERPRINT_BEHAVIOUR_CSV):
-        mtime = datetime.fromtimestamp(os.path.getmtime(FINGERPRINT_BEHAVIOUR_CSV), timezone.utc)
-        if (now - mtime).total_seconds() / 60 < max_age_minutes:
-            with open(FINGERPRINT_BEHAVIOUR_CSV, newline="", encoding="utf-8") as f:
-                return list(csv.DictReader(f)), mtime
-
-    # Cargar eventos
-    events = defaultdict(list)
-    if os.path.exists(BALIZAS_EVENTOS_CSV):
-        with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-            for row in csv.DictReader(f):
-                fp = row.get("fingerprint_id")
-                if not fp:
-                    continue
-                ts = parse_ts(row.get("timestamp", ""))
-                if not ts:
-                    continue
-                events[fp].append({
-                    "baliza": row.get("payload") or row.get("origen", "UNKNOWN"),
-                    "ts": ts,
-                    "flag_tor": to_bool(row.get("flag_tor")),
-                    "flag_vpn": to_bool(row.get("flag_vpn"))
-                })
-
-    # Analizar por fingerprint
-    results = []
-    for fp, ev_list in events.items():
-        visitas = len(ev_list)
-        balizas = len({e["baliza"] for e in ev_list})
-        window_sec = int((max(e["ts"] for e in ev_list) - min(e["ts"] for e in ev_list)).total_seconds())
-        base_score = min(100, window_sec // 120 + visitas * 5)
-
-        # Conteo TOR/VPN
-        tor_visitas = sum(1 for e in ev_list if e["flag_tor"])
-        vpn_visitas = sum(1 for e in ev_list if e["flag_vpn"])
-        total_visitas = visitas
-
-        tor_flag = tor_visitas > 0
-        vpn_flag = vpn_visitas > 0
-
-        tor_summary = f"YES {tor_visitas}/{total_visitas}" if tor_flag else f"NO 0/{total_visitas}"
-        vpn_summary = f"YES {vpn_visitas}/{total_visitas}" if vpn_flag else f"NO 0/{total_visitas}"
-
-        # Ajuste de score
-        score = base_score
-        if tor_flag:
-            score = 100
-        elif vpn_flag and base_score >= 60:
-            score = min(100, base_score + 20)
-
-        # Clasificación
-        if score < 50:
-            classification = "LEGIT"
-        elif score < 80:
-            classification = "SUSPICIOUS"
-        else:
-            classification = "MALICIOUS"
-
-        results.append({
-            "fingerprint": fp,
-            "TOR": tor_summary,
-            "VPN": vpn_summary,
-            "Visitas": visitas,
-            "Balizas": balizas,
-            "Ventana (s)": window_sec,
-            "Score": score,
-            "Clasificación": classification
-        })
-
-    # Guardar CSV
-    if results:
-        with open(FINGERPRINT_BEHAVIOUR_CSV, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=results[0].keys())
-            writer.writeheader()
-            writer.writerows(results)
+    estados = None if force else get_backend().leer_estado(ESPACIO_BEHAVIOR)
+    if estados is None:
+        estados = reconstruir()
 
+    results = [_fila_resultado(fp, e) for fp, e in estados.items()]
     return results, now
 
 
@@ -1,5 +1,5 @@
 # utils/fingerprint_policy.py
-import json, os
+import copy, json, os
 from pathlib import Path
 
 from . import CONFIG_FP_POLICY_JSON
@@ -20,14 +20,36 @@ DEFAULT_FP_POLICY = {
 }
 
 
+# Política leída, invalidada por mtime / tamaño del fichero
+_cache = {"firma": None, "politica": None}
+
+
+def firma_politica():
+    """(mtime_ns, tamaño) del fichero de política, o None si no existe."""
+    try:
+        st = os.stat(CONFIG_FP_POLICY_JSON)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
 def load_fingerprint_policy() -> dict:
     """
     Carga la política de correlación de fingerprints desde JSON.
     Devuelve una política válida siempre (fallback a defaults).
+    El fichero solo se vuelve a leer si ha cambiado; cada llamada
+    devuelve una copia que el llamador puede modificar.
     """
+    firma = firma_politica()
+    if firma is None or firma != _cache["firma"]:
+        _cache["politica"] = _leer_politica()
+        _cache["firma"] = firma
+    return copy.deepcopy(_cache["politica"])
+
 
+def _leer_politica() -> dict:
     if not os.path.exists(CONFIG_FP_POLICY_JSON):
-        return DEFAULT_FP_POLICY.copy()
+        return copy.deepcopy(DEFAULT_FP_POLICY)
 
     try:
         with open(CONFIG_FP_POLICY_JSON, "r", encoding="utf-8") as f:
@@ -55,7 +77,7 @@ def load_fingerprint_policy() -> dict:
 
     except Exception:
         # Fail-safe: nunca romper el flujo SOC
-        return DEFAULT_FP_POLICY.copy()
+        return copy.deepcopy(DEFAULT_FP_POLICY)
 
 
 
@@ -2,17 +2,19 @@
 
 import os
 import json
-import csv
 import uuid
 from datetime import datetime
 from collections import defaultdict
 from utils.fingerprint_policy import load_fingerprint_policy
+from utils.archivo import iterar_historico
+from utils.capturas_fp import ALMACEN_CAPTURAS
+from utils.similitud_fp import extraer_senales
 
 # ---------------------------
 # Rutas base
 # ---------------------------
 
-from . import FINGERPRINTS_DIR, BALIZAS_EVENTOS_CSV
+from . import FINGERPRINTS_DIR
 
 
 # ---------------------------
@@ -34,7 +36,7 @@ def cargar_fingerprints():
         path = os.path.join(FINGERPRINTS_DIR, fname)
         try:
             with open(path, "r", encoding="utf-8") as f:
-                fps.append(json.load(f))
+                fps.append(ALMACEN_CAPTURAS.completar(json.load(f)))
         except Exception:
             continue
 
@@ -50,7 +52,7 @@ def cargar_fingerprint(fingerprint_id: str):
         return None
 
     with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+        return ALMACEN_CAPTURAS.completar(json.load(f))
 
 
 # ---------------------------
@@ -70,15 +72,16 @@ def comparar_fingerprints(fp1: dict, fp2: dict) -> dict:
     matches = []
     mismatches = []
 
-    def get_signal(fp, key):
-        return fp.get("signals", {}).get(key)
+    # Señales de la política (core, componentes de FingerprintJS o metadata)
+    senales1 = extraer_senales(fp1, checks)
+    senales2 = extraer_senales(fp2, checks)
 
     # -----------------------------
     # Evaluación de señales
     # -----------------------------
     for key, weight in checks.items():
-        v1 = get_signal(fp1, key)
-        v2 = get_signal(fp2, key)
+        v1 = senales1.get(key)
+        v2 = senales2.get(key)
 
         if v1 is not None and v1 == v2:
             score += int(weight)
@@ -174,7 +177,7 @@ def listar_fingerprints():
         path = os.path.join(FINGERPRINTS_DIR, fname)
         try:
             with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+                data = ALMACEN_CAPTURAS.completar(json.load(f))
 
             fp_id = data.get("fingerprint_id")
             if fp_id:
@@ -196,18 +199,9 @@ def eventos_por_fingerprint(fingerprint_id: str):
     """
     Devuelve todos los eventos asociados a un fingerprint.
     """
-    eventos = []
-
-    if not os.path.exists(BALIZAS_EVENTOS_CSV):
-        return eventos
-
-    with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row.get("fingerprint_id") == fingerprint_id:
-                eventos.append(row)
-
-    return eventos
+    if not fingerprint_id:
+        return []
+    return list(iterar_historico("balizas_eventos", filtros={"fingerprint_id": fingerprint_id}))
 
 
 
@@ -223,33 +217,29 @@ def correlacionar_fingerprints_balizas_desde_fps(fps: dict):
             "balizas": {},
             "ultima_visita": None
         }
-    if not os.path.exists(BALIZAS_EVENTOS_CSV):
-        return stats
-
-    with open(BALIZAS_EVENTOS_CSV, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            fp_id = row.get("fingerprint_id")
-            if fp_id not in stats:
-                continue
-
-            stats[fp_id]["total_visitas"] += 1
-
-            origen = row.get("origen", "desconocido")
-            stats[fp_id]["balizas"][origen] = (
-                stats[fp_id]["balizas"].get(origen, 0) + 1
-            )
-
-            ts = row.get("timestamp")
-            if ts:
-                try:
-                    dt = datetime.fromisoformat(ts.replace("Z", ""))
-                    if (
-                        not stats[fp_id]["ultima_visita"]
-                        or dt > stats[fp_id]["ultima_visita"]
-                    ):
-                        stats[fp_id]["ultima_visita"] = dt
-                except Exception:
-                    pass
+    columnas = ["fingerprint_id", "origen", "timestamp"]
+    for row in iterar_historico("balizas_eventos", columnas=columnas):
+        fp_id = row.get("fingerprint_id")
+        if fp_id not in stats:
+            continue
+
+        stats[fp_id]["total_visitas"] += 1
+
+        origen = row.get("origen", "desconocido")
+        stats[fp_id]["balizas"][origen] = (
+            stats[fp_id]["balizas"].get(origen, 0) + 1
+        )
+
+        ts = row.get("timestamp")
+        if ts:
+            try:
+                dt = datetime.fromisoformat(ts.replace("Z", ""))
+                if (
+                    not stats[fp_id]["ultima_visita"]
+                    or dt > stats[fp_id]["ultima_visita"]
+                ):
+                    stats[fp_id]["ultima_visita"] = dt
+            except Exception:
+                pass
 
     return stats
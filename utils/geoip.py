@@ -2,99 +2,530 @@
 """
 Módulo para consultas geográficas de IP (GeoIP) y conversión de códigos de país a emoji.
 Incluye:
-- cache local de resultados para no sobrecargar la API
+- proveedores intercambiables (FARO_GEOIP_PROVEEDORES, en orden):
+    maxmind: bases GeoLite2 City / ASN locales (.mmdb), sin red, microsegundos
+    ipapi:   API HTTP de ip-api.com (con límite de peticiones), como respaldo
+- caché de resultados de la API para no sobrecargarla: LRU acotada en memoria,
+  SQLite en disco (una fila por IP), caducidad y caché negativa de fallos
 - tratamiento de IPs locales y LAN
+- resolución por lotes (endpoint batch) para el enriquecimiento en segundo plano
 - conversión de ISO2 country codes a emojis
 """
 
 import os
 import json
+import time
+import sqlite3
+import threading
 import requests
+from collections import OrderedDict
 from pathlib import Path
 from time import sleep
 
-# Carpeta para guardar caché de IPs
-from . import GEOIP_CACHE_FILE as CACHE_FILE
+# Caché de IPs (LRU + SQLite) y proveedores
+from . import (
+    GEOIP_CACHE_FILE, GEOIP_CACHE_DB, GEOIP_CACHE_MAX,
+    GEOIP_CACHE_TTL, GEOIP_CACHE_TTL_NEGATIVO, GEOIP_BATCH_URL,
+    GEOIP_CITY_DB, GEOIP_ASN_DB, GEOIP_PROVEEDORES
+)
 
-# Cargar caché si existe
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r", encoding="utf-8") as f:
-        GEOIP_CACHE = json.load(f)
-else:
-    GEOIP_CACHE = {}
+try:
+    import maxminddb  # lector de bases .mmdb (dependencia de geoip2)
+except ImportError:  # pragma: no cover - dependencia opcional
+    maxminddb = None
 
-API_URL = "http://ip-api.com/json/{ip}"  # API gratuita
+API_URL = "http://ip-api.com/json/{ip}?fields={campos}"  # API gratuita
+API_BATCH_URL = GEOIP_BATCH_URL
+API_BATCH_MAX = 100  # IPs por petición admitidas por el endpoint batch
+API_CAMPOS = "status,country,countryCode,regionName,city,lat,lon,isp,as,query"
 
 # ---------------------------
-# Funciones
+# Caché
 # ---------------------------
-def save_cache():
-    """Guardar la caché de IPs en disco"""
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(GEOIP_CACHE, f, indent=2, ensure_ascii=False)
+class CacheGeo:
+    """
+    Caché de resultados de los proveedores de red, en dos niveles:
+    - memoria: LRU de hasta `maximo` IPs por proceso;
+    - disco: tabla SQLite compartida por los workers; cada resultado nuevo
+      es un INSERT OR REPLACE de su fila (no se reescribe la caché entera).
 
+    Cada entrada caduca a los `ttl` segundos (los datos de ISP / ASN
+    cambian). Las consultas fallidas se guardan como entradas negativas con
+    `ttl_negativo` para no repetir cada vez la petición a la API; obtener()
+    devuelve para ellas un resultado vacío.
 
-def geo_lookup(ip: str) -> dict:
+    La caché JSON antigua (utils/geoip_cache.json) se importa una vez.
     """
-    Devuelve información geográfica de una IP.
-    - Usa cache local si disponible.
-    - Trata IPs locales (LAN, localhost) de manera especial.
-    - Consulta la API externa si no está en cache.
 
-    Args:
-        ip (str): Dirección IP a consultar
+    def __init__(self, db_path: str = GEOIP_CACHE_DB, maximo: int = GEOIP_CACHE_MAX,
+                 ttl: int = GEOIP_CACHE_TTL, ttl_negativo: int = GEOIP_CACHE_TTL_NEGATIVO,
+                 json_antiguo: str = GEOIP_CACHE_FILE):
+        self.db_path = db_path
+        self.maximo = max(1, maximo)
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.json_antiguo = json_antiguo
+        self._memoria = OrderedDict()  # ip -> (expira, negativo, resultado)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._contadores = dict.fromkeys(
+            ("aciertos", "aciertos_negativos", "fallos", "caducadas", "desalojos", "escrituras"), 0)
 
-    Returns:
-        dict: Diccionario con keys: ip, country, country_code, region, city, lat, lon, isp
-    """
-    ip = ip.strip()
-    if ip in GEOIP_CACHE:
-        return GEOIP_CACHE[ip]
+    # ---------- disco ----------
+    def _conexion(self) -> sqlite3.Connection:
+        # Una conexión por hilo y proceso (no se heredan tras el fork)
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            con = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "ip TEXT PRIMARY KEY, expira REAL NOT NULL, negativo INTEGER NOT NULL, datos TEXT)"
+            )
+            con.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+            self._local.con, self._local.pid = con, os.getpid()
+            self._importar_json(con)
+        return con
 
-    result = {"ip": ip, "country": "", "country_code": "", "region": "", "city": "", "lat": None, "lon": None, "isp": ""}
+    def _importar_json(self, con: sqlite3.Connection):
+        """Importa la caché JSON antigua una sola vez (caduca según su fecha)."""
+        if con.execute("SELECT 1 FROM meta WHERE clave = 'json_importado'").fetchone():
+            return
+        filas = []
+        if self.json_antiguo and os.path.exists(self.json_antiguo):
+            try:
+                with open(self.json_antiguo, "r", encoding="utf-8") as f:
+                    antigua = json.load(f)
+                expira = os.path.getmtime(self.json_antiguo) + self.ttl
+                filas = [(ip, expira, 0, json.dumps(r, ensure_ascii=False))
+                         for ip, r in antigua.items() if isinstance(r, dict)]
+            except Exception as e:
+                print(f"[geoip] No se pudo importar {self.json_antiguo}: {e}")
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany("INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)", filas)
+            con.execute("INSERT OR REPLACE INTO meta VALUES ('json_importado', ?)", (str(len(filas)),))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
 
-    # IP local -> LAN
-    if ip.startswith(("192.", "10.", "172.")):
-        result.update({
-            "country": "LAN",
-            "country_code": "LAN",
-            "region": "LAN",
-            "city": "LAN",
-            "lat": 0,
-            "lon": 0,
-            "isp": "LAN",
+    # ---------- memoria ----------
+    def _recordar(self, ip: str, entrada: tuple):
+        """Guarda en el LRU (con el lock tomado), desalojando las más antiguas."""
+        self._memoria[ip] = entrada
+        self._memoria.move_to_end(ip)
+        while len(self._memoria) > self.maximo:
+            self._memoria.popitem(last=False)
+            self._contadores["desalojos"] += 1
+
+    def _resultado(self, ip: str, entrada: tuple) -> dict:
+        _, negativo, resultado = entrada
+        with self._lock:
+            self._contadores["aciertos_negativos" if negativo else "aciertos"] += 1
+        return _resultado_vacio(ip) if negativo else dict(resultado)
+
+    # ---------- API ----------
+    def obtener(self, ip: str):
+        """Resultado cacheado y vigente de `ip` (vacío si es negativo) o None."""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(ip)
+            if entrada is not None:
+                if entrada[0] > ahora:
+                    self._memoria.move_to_end(ip)
+                else:
+                    del self._memoria[ip]
+                    self._contadores["caducadas"] += 1
+                    entrada = None
+        if entrada is not None:
+            return self._resultado(ip, entrada)
+
+        # Otro worker puede haberla resuelto: se consulta la tabla
+        fila = self._conexion().execute(
+            "SELECT expira, negativo, datos FROM cache WHERE ip = ?", (ip,)
+        ).fetchone()
+        if fila is None or fila[0] <= ahora:
+            with self._lock:
+                self._contadores["fallos"] += 1
+            return None
+        entrada = (fila[0], bool(fila[1]), json.loads(fila[2]) if fila[2] else None)
+        with self._lock:
+            self._recordar(ip, entrada)
+        return self._resultado(ip, entrada)
+
+    def guardar(self, ip: str, resultado: dict = None):
+        """Cachea un resultado; None registra una consulta fallida (negativa)."""
+        if resultado is None:
+            self.guardar_muchos({}, [ip])
+        else:
+            self.guardar_muchos({ip: resultado})
+
+    def guardar_muchos(self, resultados: dict, negativos=()):
+        """Cachea varios resultados y fallos en una sola transacción."""
+        ahora = time.time()
+        entradas = {ip: (ahora + self.ttl, False, r) for ip, r in resultados.items()}
+        entradas.update({ip: (ahora + self.ttl_negativo, True, None) for ip in negativos})
+        if not entradas:
+            return
+        with self._lock:
+            for ip, entrada in entradas.items():
+                self._recordar(ip, entrada)
+            self._contadores["escrituras"] += len(entradas)
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                [(ip, expira, int(negativo), json.dumps(r, ensure_ascii=False) if r is not None else None)
+                 for ip, (expira, negativo, r) in entradas.items()],
+            )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    def purgar(self) -> int:
+        """Borra las entradas caducadas (memoria y disco). Devuelve las borradas del disco."""
+        ahora = time.time()
+        with self._lock:
+            for ip in [ip for ip, e in self._memoria.items() if e[0] <= ahora]:
+                del self._memoria[ip]
+        return self._conexion().execute("DELETE FROM cache WHERE expira <= ?", (ahora,)).rowcount
+
+    def vaciar(self):
+        """Borra toda la caché (por ejemplo, tras actualizar las bases o la API)."""
+        with self._lock:
+            self._memoria.clear()
+        self._conexion().execute("DELETE FROM cache")
+
+    def estadisticas(self) -> dict:
+        """Contadores del proceso y tamaño de la caché en memoria y disco."""
+        ahora = time.time()
+        fila = self._conexion().execute(
+            "SELECT COUNT(*), COALESCE(SUM(negativo), 0), COALESCE(SUM(expira <= ?), 0) FROM cache", (ahora,)
+        ).fetchone()
+        with self._lock:
+            stats = dict(self._contadores)
+            stats["memoria"] = len(self._memoria)
+        consultas = stats["aciertos"] + stats["aciertos_negativos"] + stats["fallos"]
+        stats.update({
+            "maximo": self.maximo,
+            "ttl": self.ttl,
+            "ttl_negativo": self.ttl_negativo,
+            "tasa_aciertos": round((consultas - stats["fallos"]) / consultas, 4) if consultas else None,
+            "disco": fila[0],
+            "disco_negativas": fila[1],
+            "disco_caducadas": fila[2],
         })
+        return stats
+
+
+CACHE_GEO = CacheGeo()
+
+
+def estadisticas_cache() -> dict:
+    """Aciertos / fallos / desalojos de la caché GeoIP de este proceso."""
+    return CACHE_GEO.estadisticas()
+
+
+def _resultado_vacio(ip: str) -> dict:
+    return {"ip": ip, "country": "", "country_code": "", "region": "", "city": "",
+            "lat": None, "lon": None, "isp": "", "asn": ""}
+
+
+def _resultado_local(ip: str):
+    """Resultado fijo para IPs LAN / localhost (sin consultar la API), o None."""
+    result = _resultado_vacio(ip)
+    if ip.startswith(("192.", "10.", "172.")):
+        nombre = "LAN"
     elif ip.startswith("127."):
+        nombre = "localhost"
+        result["country"] = "Localhost"
+    else:
+        return None
+    result.update({
+        "country": result["country"] or nombre,
+        "country_code": nombre,
+        "region": nombre,
+        "city": nombre,
+        "lat": 0,
+        "lon": 0,
+        "isp": nombre,
+    })
+    return result
+
+
+# ---------------------------
+# Proveedores
+# ---------------------------
+class ProveedorGeo:
+    """
+    Interfaz de un proveedor de geolocalización.
+    consultar() devuelve un dict con el formato de geo_lookup() o None si
+    el proveedor no conoce la IP. `offline` indica que no usa la red
+    (se puede consultar dentro de una petición sin bloquearla).
+    """
+
+    nombre = ""
+    offline = True
+
+    def disponible(self) -> bool:
+        return True
+
+    def consultar(self, ip: str):
+        raise NotImplementedError
+
+    def consultar_lote(self, ips: list) -> dict:
+        """{ip: resultado} de las IPs resueltas."""
+        resultados = {}
+        for ip in ips:
+            resultado = self.consultar(ip)
+            if resultado is not None:
+                resultados[ip] = resultado
+        return resultados
+
+
+class ProveedorMaxMind(ProveedorGeo):
+    """
+    Bases GeoLite2 City y ASN (.mmdb) abiertas una vez por proceso con
+    mmap: el sistema comparte las páginas del fichero entre workers.
+    Se usa el lector de maxminddb (el que usa geoip2 por debajo) con su
+    extensión C (MODE_MMAP_EXT) si está compilada, o MODE_MMAP si no;
+    leer los registros como dict evita construir los modelos de geoip2.
+    Cualquiera de las dos bases puede faltar; ASN aporta asn e isp.
+    """
+
+    nombre = "maxmind"
+    offline = True
+
+    def __init__(self, ruta_city: str, ruta_asn: str):
+        self.ruta_city = ruta_city
+        self.ruta_asn = ruta_asn
+        self._lock = threading.Lock()
+        self._pid = None
+        self._lectores = (None, None)
+
+    @staticmethod
+    def _abrir(ruta: str):
+        if maxminddb is None or not ruta or not os.path.exists(ruta):
+            return None
+        for modo in (maxminddb.MODE_MMAP_EXT, maxminddb.MODE_MMAP):
+            try:
+                return maxminddb.open_database(ruta, modo)
+            except ValueError:
+                continue  # extensión C no disponible
+            except Exception as e:
+                print(f"[geoip] No se pudo abrir {ruta}: {e}")
+                return None
+        return None
+
+    def _lectores_proceso(self):
+        # Los lectores se abren tras el fork de cada worker (mmap propio)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._lectores = (self._abrir(self.ruta_city), self._abrir(self.ruta_asn))
+                    self._pid = os.getpid()
+        return self._lectores
+
+    def disponible(self) -> bool:
+        return any(self._lectores_proceso())
+
+    @staticmethod
+    def _leer(lector, ip: str):
+        if lector is None:
+            return None
+        try:
+            return lector.get(ip)
+        except ValueError:  # IP no válida o IPv6 en una base solo IPv4
+            return None
+
+    def consultar(self, ip: str):
+        city, asn = self._lectores_proceso()
+        r_city, r_asn = self._leer(city, ip), self._leer(asn, ip)
+        if not r_city and not r_asn:
+            return None
+
+        result = _resultado_vacio(ip)
+        if r_city:
+            nombre = lambda d: (d or {}).get("names", {}).get("en", "")
+            location = r_city.get("location", {})
+            subdivisiones = r_city.get("subdivisions") or [{}]
+            result.update({
+                "country": nombre(r_city.get("country")),
+                "country_code": r_city.get("country", {}).get("iso_code", ""),
+                "region": nombre(subdivisiones[-1]),
+                "city": nombre(r_city.get("city")),
+                "lat": location.get("latitude"),
+                "lon": location.get("longitude"),
+            })
+        if r_asn:
+            if r_asn.get("autonomous_system_number"):
+                result["asn"] = f"AS{r_asn['autonomous_system_number']}"
+            result["isp"] = r_asn.get("autonomous_system_organization", "")
+        return result
+
+
+class ProveedorIpApi(ProveedorGeo):
+    """API HTTP de ip-api.com: consultas individuales o por lotes (batch)."""
+
+    nombre = "ipapi"
+    offline = False
+
+    @staticmethod
+    def _desde_api(result: dict, data: dict) -> dict:
+        """Completa `result` con una respuesta correcta de ip-api."""
+        asn = (data.get("as") or "").split(" ", 1)[0]
         result.update({
-            "country": "Localhost",
-            "country_code": "localhost",
-            "region": "localhost",
-            "city": "localhost",
-            "lat": 0,
-            "lon": 0,
-            "isp": "localhost",
+            "country": data.get("country", ""),
+            "country_code": data.get("countryCode", ""),
+            "region": data.get("regionName", ""),
+            "city": data.get("city", ""),
+            "lat": data.get("lat"),
+            "lon": data.get("lon"),
+            "isp": data.get("isp", ""),
+            "asn": asn if asn.startswith("AS") else "",
         })
-    else:
+        return result
+
+    def consultar(self, ip: str):
+        """Resultado de la API o None si falla (IP reservada, cuota, error de red)."""
+        result = None
         try:
-            resp = requests.get(API_URL.format(ip=ip), timeout=5)
+            resp = requests.get(API_URL.format(ip=ip, campos=API_CAMPOS), timeout=5)
             data = resp.json()
             if data.get("status") == "success":
-                result.update({
-                    "country": data.get("country", ""),
-                    "country_code": data.get("countryCode", ""),
-                    "region": data.get("regionName", ""),
-                    "city": data.get("city", ""),
-                    "lat": data.get("lat"),
-                    "lon": data.get("lon"),
-                    "isp": data.get("isp", ""),
-                })
+                result = self._desde_api(_resultado_vacio(ip), data)
         except Exception as e:
             print(f"[geoip] Error consultando IP {ip}: {e}")
+        # Límite de peticiones de la API gratuita
+        sleep(0.5)
+        return result
 
-    GEOIP_CACHE[ip] = result
-    save_cache()
-    sleep(0.5)
-    return result
+    def consultar_lote(self, ips: list, timeout: float = 10) -> dict:
+        """
+        Hasta API_BATCH_MAX IPs por petición. Las IPs que la API no resuelve
+        y las de un bloque que falla (error de red) no aparecen en el resultado.
+        """
+        resultados = {}
+        for i in range(0, len(ips), API_BATCH_MAX):
+            bloque = ips[i:i + API_BATCH_MAX]
+            try:
+                resp = requests.post(
+                    API_BATCH_URL,
+                    json=[{"query": ip, "fields": API_CAMPOS} for ip in bloque],
+                    timeout=timeout,
+                )
+                resp.raise_for_status()
+                respuestas = resp.json()
+            except Exception as e:
+                print(f"[geoip] Error consultando lote de {len(bloque)} IPs: {e}")
+                continue
+            for ip, data in zip(bloque, respuestas):
+                if isinstance(data, dict) and data.get("status") == "success":
+                    resultados[ip] = self._desde_api(_resultado_vacio(ip), data)
+        return resultados
+
+
+_DISPONIBLES = {
+    "maxmind": lambda: ProveedorMaxMind(GEOIP_CITY_DB, GEOIP_ASN_DB),
+    "ipapi": ProveedorIpApi,
+}
+
+PROVEEDORES = [_DISPONIBLES[n]() for n in GEOIP_PROVEEDORES if n in _DISPONIBLES]
+
+
+def _proveedores(offline: bool) -> list:
+    return [p for p in PROVEEDORES if p.offline == offline and p.disponible()]
+
+
+# ---------------------------
+# Consultas
+# ---------------------------
+def geo_sin_red(ip: str):
+    """
+    Información geográfica sin tocar la red: IP local, proveedores offline
+    (MaxMind) o caché de la API. Devuelve None si haría falta la API.
+    Una IP cuya consulta falló hace poco (caché negativa) devuelve un
+    resultado vacío hasta que caduque.
+    """
+    ip = (ip or "").strip()
+    resultado = _resultado_local(ip)
+    if resultado is not None:
+        return resultado
+    for proveedor in _proveedores(offline=True):
+        resultado = proveedor.consultar(ip)
+        if resultado is not None:
+            return resultado
+    return CACHE_GEO.obtener(ip)
+
+
+def geo_lookup(ip: str) -> dict:
+    """
+    Devuelve información geográfica de una IP.
+    - Trata IPs locales (LAN, localhost) de manera especial.
+    - Usa los proveedores offline (MaxMind) si están disponibles.
+    - Usa cache local si disponible (también de consultas fallidas).
+    - Consulta la API externa si no está en cache.
+
+    Args:
+        ip (str): Dirección IP a consultar
+
+    Returns:
+        dict: Diccionario con keys: ip, country, country_code, region, city, lat, lon, isp, asn
+    """
+    ip = ip.strip()
+    result = geo_sin_red(ip)
+    if result is not None:
+        return result
+
+    proveedores = _proveedores(offline=False)
+    for proveedor in proveedores:
+        result = proveedor.consultar(ip)
+        if result is not None:
+            CACHE_GEO.guardar(ip, result)
+            return result
+    if proveedores:
+        CACHE_GEO.guardar(ip, None)  # caché negativa
+    return _resultado_vacio(ip)
+
+
+def geo_lookup_lote(ips) -> dict:
+    """
+    Resuelve varias IPs con el mínimo de peticiones: LAN, proveedores
+    offline y caché primero; el resto por lotes en los proveedores de red.
+    La caché se actualiza en una sola transacción por lote.
+
+    Las IPs que no se pudieron resolver no aparecen en el resultado y se
+    cachean como negativas: se reintentan cuando caduca la entrada.
+
+    Returns:
+        dict: {ip: resultado con el formato de geo_lookup()}
+    """
+    resultados, pendientes = {}, []
+    for ip in {(ip or "").strip() for ip in ips}:
+        if not ip:
+            continue
+        resultado = geo_sin_red(ip)
+        if resultado is None:
+            pendientes.append(ip)
+        else:
+            resultados[ip] = resultado
+
+    nuevos = {}
+    proveedores = _proveedores(offline=False)
+    for proveedor in proveedores:
+        if not pendientes:
+            break
+        nuevos.update(proveedor.consultar_lote(pendientes))
+        pendientes = [ip for ip in pendientes if ip not in nuevos]
+
+    CACHE_GEO.guardar_muchos(nuevos, pendientes if proveedores else ())
+    resultados.update(nuevos)
+    return resultados
 
 
 def country_code_to_emoji(code: str) -> str:
@@ -0,0 +1,143 @@
+# utils/html_baliza.py
+"""
+HTML descargable de las balizas, generado bajo demanda.
+
+Crear una baliza ya no escribe balizas/<origen>.html. La plantilla
+templates/baliza_descarga.html se renderiza una vez por perfil de
+static/fingerprint/profiles.json y se guarda partida por los huecos del
+origen; cada petición solo une esas partes con el origen escapado (HTML
+en el título, JSON en el script), sin tocar el disco.
+
+- El perfil se elige con ?perfil=<nombre> (por defecto, el "default" de
+  profiles.json). Los cambios en profiles.json se detectan por su firma
+  (mtime, tamaño), con un stat() como mucho cada REFRESCO segundos.
+- ETag por contenido + Cache-Control: no-cache: una descarga repetida
+  recibe un 304 sin cuerpo.
+"""
+
+import os
+import re
+import json
+import html
+import time
+import hashlib
+import threading
+
+from flask import Response, current_app, request
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
+
+from . import FP_PROFILES_JSON
+
+PLANTILLA = "baliza_descarga.html"
+
+# Segundos entre comprobaciones de profiles.json
+REFRESCO = 5
+
+# Huecos del origen en la plantilla renderizada (no cambian al escapar)
+_HUECO_HTML = "\x00origen-html\x00"
+_HUECO_JS = "\x00origen-js\x00"
+_HUECOS = re.compile(f"({_HUECO_HTML}|{_HUECO_JS})")
+
+_ESCAPAR = {
+    _HUECO_HTML: html.escape,
+    _HUECO_JS: htmlsafe_json_dumps,
+}
+
+
+class PlantillasBaliza:
+    """Plantilla del HTML de baliza renderizada por perfil, en memoria."""
+
+    def __init__(self, ruta_perfiles: str = FP_PROFILES_JSON, refresco: float = REFRESCO):
+        self.ruta_perfiles = ruta_perfiles
+        self.refresco = refresco
+        self._lock = threading.Lock()
+        self._firma = None
+        self._revisado = None
+        self._perfiles = {"default": None, "profiles": {}}
+        self._partes = {}   # perfil -> [texto | hueco]
+
+    def _leer_firma(self):
+        try:
+            st = os.stat(self.ruta_perfiles)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _revisar(self):
+        ahora = time.monotonic()
+        if self._revisado is not None and ahora - self._revisado < self.refresco:
+            return
+        with self._lock:
+            if self._revisado is not None and ahora - self._revisado < self.refresco:
+                return
+            firma = self._leer_firma()
+            if firma != self._firma:
+                try:
+                    with open(self.ruta_perfiles, "r", encoding="utf-8") as f:
+                        perfiles = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"[html_baliza] Error leyendo {self.ruta_perfiles}: {e}")
+                    perfiles = {}
+                self._perfiles = {
+                    "default": perfiles.get("default"),
+                    "profiles": perfiles.get("profiles") or {},
+                }
+                self._partes = {}
+                self._firma = firma
+            self._revisado = ahora
+
+    def _partes_perfil(self, perfil: str):
+        partes = self._partes.get(perfil)
+        if partes is None:
+            texto = current_app.jinja_env.get_template(PLANTILLA).render(
+                origen_html=_HUECO_HTML,
+                origen_js=Markup(_HUECO_JS),
+                perfil=perfil,
+            )
+            partes = [p for p in _HUECOS.split(texto) if p]
+            self._partes[perfil] = partes
+        return partes
+
+    def html(self, origen: str, perfil: str = None):
+        """
+        HTML de la baliza con el perfil pedido (None: el de por defecto).
+        Devuelve None si el perfil no existe.
+        """
+        self._revisar()
+        perfil = perfil or self._perfiles["default"]
+        if perfil not in self._perfiles["profiles"]:
+            return None
+        escapados = {hueco: str(escapar(origen)) for hueco, escapar in _ESCAPAR.items()}
+        return "".join(escapados.get(p, p) for p in self._partes_perfil(perfil))
+
+    def responder(self, origen: str, perfil: str = None, adjunto: str = None):
+        """
+        Respuesta de la petición en curso (None si el perfil no existe):
+        el HTML o un 304 si el navegador ya lo tiene. Con `adjunto`, como
+        descarga con ese nombre de fichero.
+        """
+        texto = self.html(origen, perfil)
+        if texto is None:
+            return None
+        datos = texto.encode("utf-8")
+        etag = hashlib.sha1(datos).hexdigest()[:20]
+        cabeceras = {
+            "Content-Type": "text/html; charset=utf-8",
+            "ETag": f'"{etag}"',
+            "Cache-Control": "no-cache",
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=cabeceras)
+        respuesta = Response(datos, headers=cabeceras)
+        if adjunto:
+            respuesta.headers.set("Content-Disposition", "attachment", filename=adjunto)
+        return respuesta
+
+
+PLANTILLAS_BALIZA = PlantillasBaliza()
+
+
+def responder_html(origen: str, perfil: str = None, adjunto: str = None):
+    """Atajo sobre las plantillas del proceso."""
+    return PLANTILLAS_BALIZA.responder(origen, perfil, adjunto)
@@ -0,0 +1,303 @@
+# utils/identidad_fp.py
+"""
+Identidad de equipo: agrupa fingerprints del mismo navegador.
+
+Los fingerprint_id son hashes de salidas volátiles de los motores, así
+que un mismo equipo acaba con varios ids. Dos fingerprints se enlazan si
+comparar_fingerprints les da confianza HIGH con la política de
+config_fingerprint.json; los equipos son las componentes conexas
+(union-find incremental) y se guardan en el backend (espacio
+"identidad"):
+
+    fp_id   -> {"raiz": fp_raiz}                         (miembro)
+    fp_raiz -> {"raiz": fp_raiz, "fingerprints": [...],  (raíz del equipo)
+                "estado": agregado de comportamiento}
+
+- La raíz de un equipo es siempre su fingerprint_id menor: al unir dos
+  equipos la raíz mayor pasa a apuntar a la menor. Los punteros solo
+  bajan, así que dos uniones concurrentes no pueden formar un ciclo, y
+  el id del equipo es estable. Las búsquedas comprimen el camino.
+- Los candidatos HIGH salen del índice de similitud por bloques
+  (utils/similitud_fp.py, sin recall perdido por debajo de MEDIUM): al
+  capturar un fingerprint solo se puntúan los que comparten bloque.
+- "estado" es el mismo agregado que utils/fingerprint_behavior.py
+  (visitas, balizas, ventana, TOR/VPN, score) sumado sobre todo el
+  equipo. Cada evento de baliza lo actualiza en la raíz y al unir dos
+  equipos se fusionan; la vista agrupada no recorre eventos ni parejas.
+
+Si cambia la política, los enlaces existentes no se deshacen: el
+recálculo completo (reconstruir, botón "Refrescar") los rehace.
+"""
+
+from datetime import datetime, timezone
+
+from .storage import get_backend
+from .manifiesto_fp import leer_manifiesto
+from .similitud_fp import INDICE_SIMILITUD
+from .fingerprint_behavior import (
+    ESPACIO_BEHAVIOR, reconstruir as reconstruir_behavior,
+    parse_ts, to_bool, _nuevo_estado, _fila_resultado
+)
+
+# Espacio del estado derivado en el backend
+ESPACIO_IDENTIDAD = "identidad"
+
+# Reintentos de una operación que otra escritura concurrente ha adelantado
+REINTENTOS = 20
+
+
+# ---------------------------
+# Agregados
+# ---------------------------
+def _fusionar(a: dict, b: dict) -> dict:
+    """Suma dos agregados de comportamiento (cualquiera puede ser None)."""
+    if not a or not b:
+        return a or b
+    return _nuevo_estado(
+        a["visitas"] + b["visitas"],
+        set(a["balizas"]) | set(b["balizas"]),
+        min(parse_ts(a["ts_min"]), parse_ts(b["ts_min"])),
+        max(parse_ts(a["ts_max"]), parse_ts(b["ts_max"])),
+        a["tor"] + b["tor"],
+        a["vpn"] + b["vpn"],
+    )
+
+
+def _raiz_nueva(fp: str, estado: dict = None) -> dict:
+    return {"raiz": fp, "fingerprints": [fp], "estado": estado}
+
+
+# ---------------------------
+# Union-find sobre el backend
+# ---------------------------
+class IdentidadEquipos:
+    """Union-find persistido en el estado del backend."""
+
+    def __init__(self, espacio: str = ESPACIO_IDENTIDAD):
+        self.espacio = espacio
+
+    def _leer(self, fp: str):
+        return get_backend().leer_estado_clave(self.espacio, fp)
+
+    def _modificar(self, fp: str, modificar):
+        return get_backend().modificar_estado(self.espacio, fp, modificar)
+
+    def raiz(self, fp: str):
+        """Raíz del equipo de fp (None si fp no está registrado). Comprime el camino."""
+        camino, actual = [], fp
+        entrada = self._leer(actual)
+        if entrada is None:
+            return None
+        while entrada is not None and entrada["raiz"] != actual:
+            camino.append(actual)
+            actual = entrada["raiz"]
+            entrada = self._leer(actual)
+        for miembro in camino[:-1]:
+            # Solo miembros (las raíces no vuelven a serlo); la nueva raíz es menor
+            self._modificar(miembro, lambda e, r=actual, m=miembro:
+                            {"raiz": r} if e is not None and e["raiz"] != m and e["raiz"] > r else None)
+        return actual
+
+    def asegurar(self, fp: str):
+        """Registra fp como equipo de un solo fingerprint si aún no existe."""
+        self._modificar(fp, lambda e: _raiz_nueva(fp) if e is None else None)
+
+    def _en_raiz(self, fp: str, modificar) -> bool:
+        """Aplica modificar(entrada) a la raíz actual del equipo de fp."""
+        for _ in range(REINTENTOS):
+            raiz = self.raiz(fp)
+            if raiz is None:
+                return False
+            aplicado = []
+
+            def aplicar(e, raiz=raiz):
+                if e is None or e["raiz"] != raiz:
+                    return None  # otra unión la ha convertido en miembro: repetir
+                aplicado.append(True)
+                return modificar(e)
+
+            self._modificar(raiz, aplicar)
+            if aplicado:
+                return True
+        return False
+
+    def unir(self, fp_a: str, fp_b: str):
+        """Une los equipos de fp_a y fp_b; devuelve la raíz resultante."""
+        for _ in range(REINTENTOS):
+            raiz_a, raiz_b = self.raiz(fp_a), self.raiz(fp_b)
+            if raiz_a is None or raiz_b is None or raiz_a == raiz_b:
+                return raiz_a
+            menor, mayor = sorted((raiz_a, raiz_b))
+            absorbida = []
+
+            def degradar(e):
+                if e is None or e["raiz"] != mayor:
+                    return None
+                absorbida.append(e)
+                return {"raiz": menor}
+
+            self._modificar(mayor, degradar)
+            if not absorbida:
+                continue
+            e = absorbida[0]
+            self._en_raiz(menor, lambda r: {
+                **r,
+                "fingerprints": r["fingerprints"] + e["fingerprints"],
+                "estado": _fusionar(r["estado"], e["estado"]),
+            })
+            return menor
+        return None
+
+    # ---------- escritura ----------
+    def enlazar(self, fp_id: str) -> int:
+        """
+        Une fp_id con los fingerprints con los que tiene confianza HIGH.
+        Sincroniza el índice de similitud la primera vez en el proceso.
+        """
+        if not INDICE_SIMILITUD.sincronizado():
+            INDICE_SIMILITUD.sincronizar(leer_manifiesto())
+        self.asegurar(fp_id)
+        enlaces = 0
+        for similar in INDICE_SIMILITUD.similares(fp_id, k=None):
+            if similar["confidence"] != "HIGH":
+                continue
+            self.asegurar(similar["fingerprint_id"])
+            self.unir(fp_id, similar["fingerprint_id"])
+            enlaces += 1
+        return enlaces
+
+    def sumar(self, fp: str, estado: dict) -> bool:
+        """Suma un agregado de comportamiento al equipo de fp."""
+        self.asegurar(fp)
+        return self._en_raiz(fp, lambda r: {**r, "estado": _fusionar(r["estado"], estado)})
+
+    # ---------- lectura ----------
+    def equipos(self) -> dict:
+        """{raíz: entrada} de todos los equipos (None si el espacio no existe)."""
+        entradas = get_backend().leer_estado(self.espacio)
+        if entradas is None:
+            return None
+        return {fp: e for fp, e in entradas.items() if e["raiz"] == fp}
+
+
+IDENTIDAD = IdentidadEquipos()
+
+
+# ---------------------------------------------------------
+# Actualización incremental
+# ---------------------------------------------------------
+def enlazar_fingerprint(fingerprint_id: str):
+    """Tras capturar un fingerprint: lo une a los equipos con confianza HIGH."""
+    try:
+        return IDENTIDAD.enlazar(fingerprint_id)
+    except Exception as e:
+        # La identidad nunca debe impedir guardar la captura
+        print(f"[identidad] Error enlazando {fingerprint_id}: {e}")
+        return None
+
+
+def registrar_evento(evento: dict):
+    """Suma un evento de baliza al agregado del equipo de su fingerprint."""
+    fp = (evento.get("fingerprint_id") or "").strip()
+    ts = parse_ts(evento.get("timestamp") or "")
+    if not fp or not ts:
+        return None
+    baliza = evento.get("payload") or evento.get("origen", "UNKNOWN")
+    estado = _nuevo_estado(1, {baliza}, ts, ts,
+                           int(to_bool(evento.get("flag_tor"))), int(to_bool(evento.get("flag_vpn"))))
+    try:
+        return IDENTIDAD.sumar(fp, estado)
+    except Exception as e:
+        print(f"[identidad] Error actualizando {fp}: {e}")
+        return None
+
+
+def registrar_vpn(fp: str, n: int = 1):
+    """Suma `n` visitas VPN (ya contadas como visitas) al equipo de fp."""
+    def sumar(r):
+        e = r["estado"]
+        if not e:
+            return None
+        return {**r, "estado": _nuevo_estado(e["visitas"], e["balizas"], parse_ts(e["ts_min"]),
+                                             parse_ts(e["ts_max"]), e["tor"], e["vpn"] + n)}
+
+    try:
+        return IDENTIDAD._en_raiz(fp, sumar)
+    except Exception as e:
+        print(f"[identidad] Error actualizando {fp}: {e}")
+        return None
+
+
+# ---------------------------------------------------------
+# Reconstrucción completa
+# ---------------------------------------------------------
+def reconstruir(estados: dict = None) -> dict:
+    """
+    Recalcula los equipos en memoria: enlaces HIGH de cada fingerprint
+    del manifiesto (candidatos del índice por bloques, no todas las
+    parejas) y agregados sumando el comportamiento por fingerprint.
+    """
+    if estados is None:
+        estados = get_backend().leer_estado(ESPACIO_BEHAVIOR)
+        if estados is None:
+            estados = reconstruir_behavior()
+
+    manifiesto = leer_manifiesto()
+    INDICE_SIMILITUD.sincronizar(manifiesto)
+
+    padre = {fp: fp for fp in set(manifiesto) | set(estados)}
+
+    def raiz(fp):
+        while padre[fp] != fp:
+            padre[fp] = padre[padre[fp]]
+            fp = padre[fp]
+        return fp
+
+    for fp in manifiesto:
+        for similar in INDICE_SIMILITUD.similares(fp, k=None):
+            otro = similar["fingerprint_id"]
+            if similar["confidence"] != "HIGH" or otro not in padre:
+                continue
+            a, b = raiz(fp), raiz(otro)
+            if a != b:
+                menor, mayor = sorted((a, b))
+                padre[mayor] = menor
+
+    equipos = {}
+    for fp in padre:
+        equipos.setdefault(raiz(fp), []).append(fp)
+
+    entradas = {}
+    for r, miembros in equipos.items():
+        estado = None
+        for fp in miembros:
+            estado = _fusionar(estado, estados.get(fp))
+            if fp != r:
+                entradas[fp] = {"raiz": r}
+        entradas[r] = {"raiz": r, "fingerprints": sorted(miembros), "estado": estado}
+
+    get_backend().reemplazar_estado(ESPACIO_IDENTIDAD, entradas)
+    return entradas
+
+
+def calculate_behavior_equipos(force: bool = False):
+    """
+    Métricas de comportamiento por equipo (vista SOC Behavior agrupada).
+    Como calculate_behavior, pero una fila por equipo con su raíz como
+    fingerprint y el número de fingerprints enlazados.
+    """
+    now = datetime.now(timezone.utc)
+
+    equipos = None if force else IDENTIDAD.equipos()
+    if equipos is None:
+        reconstruir()
+        equipos = IDENTIDAD.equipos()
+
+    results = []
+    for fp, e in equipos.items():
+        if not e.get("estado"):
+            continue  # equipo sin visitas registradas
+        fila = _fila_resultado(fp, e["estado"])
+        fila["Fingerprints"] = len(e["fingerprints"])
+        results.append(fila)
+    return results, now
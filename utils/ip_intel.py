@@ -3,6 +3,8 @@
 import socket
 import ipaddress
 
+from utils.geoip import geo_sin_red
+
 def is_private_ip(ip: str) -> bool:
     try:
         return ipaddress.ip_address(ip).is_private
@@ -19,9 +21,11 @@ def enrich_ip(ip: str) -> dict:
             "org": "Internal"
         }
 
+    # Sin red: MaxMind local o caché de la API
+    geo = geo_sin_red(ip) or {}
     return {
         "ip": ip,
         "scope": "PUBLIC",
-        "asn": "UNKNOWN",
-        "org": "UNKNOWN"
+        "asn": geo.get("asn") or "UNKNOWN",
+        "org": geo.get("isp") or "UNKNOWN"
     }
@@ -5,7 +5,8 @@ Gestión de intentos de login y control anti-bruteforce.
 Funciones principales:
 - log_login_attempt(): registra cada intento de login con UUID, timestamp, IP, geolocalización y OS/browser.
 - cargar_login_attempts(): devuelve todos los intentos normalizados para el dashboard.
-- siguiente_id_log(): calcula el siguiente ID incremental.
+- paginar_login_attempts(): página de intentos (cursor) filtrada y ordenada por timestamp.
+- siguiente_id_log(): reserva el siguiente ID incremental (contador persistente).
 - check_brute_force(): detecta bloqueos por exceso de intentos.
 - log_event_block(): registra eventos especiales de bloqueo.
 - get_client_ip(): obtiene la IP real considerando proxies.
@@ -13,7 +14,6 @@ Funciones principales:
 - cargar_admin(): lee el JSON de configuración de admins.
 """
 
-import os
 import json
 import csv
 import uuid
@@ -28,48 +28,27 @@ from utils.utils import parse_user_agent
 # ADMIN_FILE = os.path.join(DATA_DIR, "admin.json")
 # LOGINS_FILE = os.path.join(DATA_DIR, "login_attempts.csv")
 
-from . import BASE_DIR, DATA_DIR, ADMIN_FILE, LOGINS_FILE
+from . import BASE_DIR, DATA_DIR, ADMIN_FILE, LOGINS_SEQ
+from .event_store import IdCounter
+from .storage import get_backend, LOGIN_FIELDS
+from .dns_inverso import encolar_hostname
 
 LOG_PASSWORDS = True
-FIELDNAMES = [
-    "id_num", "id", "timestamp", "ip", "usuario_introducido",
-    "password_introducido", "user_agent", "os", "navegador", "resultado",
-    "country", "country_code", "region", "city", "lat", "lon", "isp",
-    "ip_local", "hostname_local"
-]
+FIELDNAMES = LOGIN_FIELDS
+TABLAS_LOGIN = ("login_attempts",)
 
-MAX_FALLOS = 5
-BLOQUEO_MINUTOS = 15
+# Contador persistente de id_num de intentos de login
+CONTADOR_LOGINS = IdCounter(LOGINS_SEQ, lambda: get_backend().max_id("login_attempts"))
 
-# -----------------------------
-# Funciones de soporte
-# -----------------------------
-def ensure_log_header(path=LOGINS_FILE):
-    """Crea el CSV si no existe, con la cabecera."""
-    if not os.path.exists(path):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(FIELDNAMES)
-        try:
-            os.chmod(path, 0o600)
-        except Exception:
-            pass
-
-
-def asegurar_salto_linea_csv(ruta_csv: str):
-    """Garantiza que el CSV termina con un salto de línea."""
-    if not os.path.exists(ruta_csv):
-        return
-    try:
-        with open(ruta_csv, "rb") as f:
-            contenido = f.read()
-        if not contenido.endswith(b"\n"):
-            with open(ruta_csv, "ab") as f:
-                f.write(b"\n")
-    except Exception:
-        pass
+# Valores en bruto de "resultado" para cada resultado normalizado
+RESULTADOS_RAW = {
+    "OK": ("success", "ok", "true", "1"),
+    "FAIL": ("failure", "failed", "fail", "false", "0", "error"),
+    "BRUTEFORCE": ("bloqueo", "bruteforce", "bloqueo bruteforce"),
+}
 
+MAX_FALLOS = 5
+BLOQUEO_MINUTOS = 15
 
 # -----------------------------
 # Funciones principales
@@ -78,12 +57,9 @@ def log_login_attempt(username: str, password: str, result: str,
                       ip_local="", hostname_local=""):
     """
     Registra un intento de login con UUID, timestamp, IP, OS, navegador y geolocalización.
+    hostname_local=None: DNS inverso pendiente, se rellena en segundo plano.
     """
-    ensure_log_header()
-    asegurar_salto_linea_csv(LOGINS_FILE)
-
-    intentos = cargar_login_attempts()
-    id_num = siguiente_id_log(intentos)
+    id_num = siguiente_id_log()
     attempt_id = str(uuid.uuid4())
     ts = datetime.utcnow().replace(microsecond=0).isoformat() + "Z"
     ip = get_client_ip()
@@ -120,96 +96,121 @@ def log_login_attempt(username: str, password: str, result: str,
         "lon": geo.get("lon",""),
         "isp": geo.get("isp",""),
         "ip_local": ip_local,
-        "hostname_local": hostname_local
+        "hostname_local": hostname_local or ""
     }
 
-    with open(LOGINS_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-        writer.writerow(row)
+    get_backend().append("login_attempts", row)
+    if hostname_local is None:
+        encolar_hostname(row, ip_local, TABLAS_LOGIN)
+
+
+def _normalizar_intento(row: dict) -> dict:
+    """Convierte una fila en bruto al formato usado por el dashboard."""
+    # Normalización de ID
+    try:
+        id_num = int(row.get("id_num",""))
+    except Exception:
+        id_num = row.get("id_num","")
+    # Normalización de timestamp
+    ts_raw = row.get("timestamp","")
+    fecha_str = ts_raw
+    try:
+        dt = datetime.fromisoformat(ts_raw.replace("Z","+00:00"))
+        fecha_str = dt.strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        pass
+    # Normalización de resultado
+    raw_res = (row.get("resultado","") or "").strip().lower()
+    if raw_res in RESULTADOS_RAW["OK"]:
+        resultado_norm = "OK"
+    elif raw_res in RESULTADOS_RAW["FAIL"]:
+        resultado_norm = "FAIL"
+    elif raw_res in RESULTADOS_RAW["BRUTEFORCE"]:
+        resultado_norm = "BRUTEFORCE"
+    else:
+        resultado_norm = "OTHER"
+
+    return {
+        "id_num": id_num,
+        "timestamp": ts_raw,
+        "fecha": fecha_str,
+        "ip": row.get("ip",""),
+        "usuario": row.get("usuario_introducido",""),
+        "password": row.get("password_introducido",""),
+        "user_agent": row.get("user_agent",""),
+        "so": row.get("os",""),
+        "navegador": row.get("navegador",""),
+        "resultado": resultado_norm,
+        "country": row.get("country",""),
+        "country_code": row.get("country_code",""),
+        "region": row.get("region",""),
+        "city": row.get("city",""),
+        "lat": row.get("lat",""),
+        "lon": row.get("lon",""),
+        "isp": row.get("isp",""),
+        "ip_local": row.get("ip_local",""),
+        "hostname_local": row.get("hostname_local",""),
+    }
 
 
 def cargar_login_attempts():
     """Carga todos los intentos normalizados para el dashboard."""
-    if not os.path.exists(LOGINS_FILE):
-        return []
-
-    intentos = []
-    with open(LOGINS_FILE, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Normalización de ID
-            try:
-                id_num = int(row.get("id_num",""))
-            except Exception:
-                id_num = row.get("id_num","")
-            # Normalización de timestamp
-            ts_raw = row.get("timestamp","")
-            fecha_str = ts_raw
-            try:
-                dt = datetime.fromisoformat(ts_raw.replace("Z","+00:00"))
-                fecha_str = dt.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                pass
-            # Normalización de resultado
-            raw_res = (row.get("resultado","") or "").strip().lower()
-            if raw_res in ("success","ok","true","1"):
-                resultado_norm = "OK"
-            elif raw_res in ("failure","failed","fail","false","0","error"):
-                resultado_norm = "FAIL"
-            elif raw_res in ("bloqueo","bruteforce","bloqueo bruteforce"):
-                resultado_norm = "BRUTEFORCE"
-            else:
-                resultado_norm = "OTHER"
-
-            intentos.append({
-                "id_num": id_num,
-                "timestamp": ts_raw,
-                "fecha": fecha_str,
-                "ip": row.get("ip",""),
-                "usuario": row.get("usuario_introducido",""),
-                "password": row.get("password_introducido",""),
-                "user_agent": row.get("user_agent",""),
-                "so": row.get("os",""),
-                "navegador": row.get("navegador",""),
-                "resultado": resultado_norm,
-                "country": row.get("country",""),
-                "country_code": row.get("country_code",""),
-                "region": row.get("region",""),
-                "city": row.get("city",""),
-                "lat": row.get("lat",""),
-                "lon": row.get("lon",""),
-                "isp": row.get("isp",""),
-                "ip_local": row.get("ip_local",""),
-                "hostname_local": row.get("hostname_local",""),
-            })
-    return intentos
-
-
-def siguiente_id_log(intentos):
-    """Calcula el siguiente ID incremental."""
-    ids_validos = []
-    for e in intentos:
-        if not isinstance(e, dict):
-            continue
-        val = e.get("id_num")
-        if val is None:
-            continue
-        try:
-            ids_validos.append(int(val))
-        except ValueError:
-            continue
-    return max(ids_validos)+1 if ids_validos else 1
+    return [_normalizar_intento(row) for row in get_backend().iterar("login_attempts")]
+
+
+def _filtro_resultado(resultado: str):
+    """Traduce un resultado normalizado (OK/FAIL/...) a sus valores en bruto."""
+    raw = RESULTADOS_RAW.get(resultado.upper())
+    if not raw:
+        return resultado
+    return [v for r in raw for v in (r, r.upper())]
+
+
+def paginar_login_attempts(ip: str = None, usuario: str = None, resultado: str = None,
+                           tam_pagina: int = 25, antes: str = None, despues: str = None,
+                           ultima: bool = False):
+    """
+    Devuelve una página de intentos (timestamp descendente, paginación por
+    cursor): (intentos, total filtrado, cursor_antes, cursor_despues).
+    Los filtros a None no se aplican.
+    """
+    filtros = {}
+    if ip:
+        filtros["ip"] = ip
+    if usuario:
+        filtros["usuario_introducido"] = usuario
+    if resultado:
+        filtros["resultado"] = _filtro_resultado(resultado)
+
+    backend = get_backend()
+    filas, cursor_antes, cursor_despues = backend.paginar(
+        "login_attempts", filtros=filtros or None, limite=tam_pagina,
+        antes=antes, despues=despues, ultima=ultima
+    )
+    total = backend.contar("login_attempts", filtros or None)
+    return [_normalizar_intento(r) for r in filas], total, cursor_antes, cursor_despues
+
+
+def siguiente_id_log():
+    """Reserva el siguiente ID incremental (contador persistente, O(1))."""
+    return CONTADOR_LOGINS.reservar()
 
 
 def check_brute_force(username, ip):
     """Devuelve True si se supera el límite de intentos fallidos recientes."""
-    intentos = cargar_login_attempts()
     now = datetime.utcnow()
     ventana = now - timedelta(minutes=BLOQUEO_MINUTOS)
+    desde = ventana.replace(microsecond=0).isoformat()
+
+    # Solo intentos recientes del usuario o de la IP (consultas indexadas)
+    recientes = {}
+    for filtros in ({"usuario_introducido": username}, {"ip": ip}):
+        for row in get_backend().iterar("login_attempts", filtros=filtros, desde=desde):
+            recientes[(row.get("id"), row.get("timestamp"))] = _normalizar_intento(row)
+
     fallos = [
-        e for e in intentos
+        e for e in recientes.values()
         if e["resultado"].lower() in ("fail","failure") and
-           (e["usuario"]==username or e["ip"]==ip) and
            datetime.fromisoformat(e["timestamp"].replace("Z","")) > ventana
     ]
     return len(fallos) >= MAX_FALLOS
@@ -219,10 +220,9 @@ def log_event_block(username, password, ip, user_agent, os_name, navegador,
                     ip_local, hostname_local, motivo):
     """
     Registra un evento de bloqueo especial en el CSV de intentos.
+    hostname_local=None: DNS inverso pendiente, se rellena en segundo plano.
     """
-    asegurar_salto_linea_csv(LOGINS_FILE)
-    intentos = cargar_login_attempts()
-    id_num = siguiente_id_log(intentos)
+    id_num = siguiente_id_log()
     id_uuid = str(uuid.uuid4())
     dt_now = datetime.utcnow().isoformat() + "Z"
 
@@ -245,12 +245,12 @@ def log_event_block(username, password, ip, user_agent, os_name, navegador,
         "lon": "",
         "isp": "",
         "ip_local": ip_local,
-        "hostname_local": hostname_local,
+        "hostname_local": hostname_local or "",
     }
 
-    with open(LOGINS_FILE, "a", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-        writer.writerow(row)
+    get_backend().append("login_attempts", row)
+    if hostname_local is None:
+        encolar_hostname(row, ip_local, TABLAS_LOGIN)
 
 
 # def cargar_admin():
@@ -0,0 +1,190 @@
+# utils/manifiesto_fp.py
+"""
+Manifiesto de fingerprints (vista /equipos).
+
+Resumen compacto por fingerprint en el backend (espacio "manifiesto"):
+
+    {"hash", "first_seen", "last_seen", "source", "senales",
+     "visitas", "balizas": {origen: visitas}, "ultima_visita"}
+
+Se mantiene al día en la captura (registrar_captura) y al guardar cada
+evento de baliza con fingerprint (registrar_visita), así que la vista no
+abre los JSON de data/fingerprints (con el payload completo) ni recorre
+los eventos. "senales" son las señales de la política de correlación
+que usa el índice de similitud (utils/similitud_fp.py). Como los demás
+agregados, el recálculo completo (reconstruir) solo hace falta la
+primera vez o para repararlo.
+
+Las visitas pueden llegar antes que el documento del fingerprint: esas
+entradas no tienen first_seen y no se listan hasta que se captura.
+"""
+
+import os
+import json
+
+from . import FINGERPRINTS_DIR
+from .storage import get_backend
+from .archivo import iterar_historico
+from .capturas_fp import ALMACEN_CAPTURAS
+from .fingerprint_behavior import parse_ts
+from .similitud_fp import extraer_senales, INDICE_SIMILITUD
+
+# Espacio del estado derivado en el backend
+ESPACIO_MANIFIESTO = "manifiesto"
+
+
+def _entrada_vacia() -> dict:
+    return {"visitas": 0, "balizas": {}, "ultima_visita": None}
+
+
+def _posterior(ts_a, ts_b) -> bool:
+    """True si ts_a es posterior a ts_b (ts_b puede ser None)."""
+    if not ts_b:
+        return True
+    a, b = parse_ts(ts_a), parse_ts(ts_b)
+    return a is not None and (b is None or a > b)
+
+
+def _datos_documento(documento: dict, timestamp: str = None) -> dict:
+    """Campos del manifiesto que salen del documento capturado."""
+    ts = timestamp or documento.get("timestamp") or documento.get("first_seen") or ""
+    return {
+        "hash": (documento.get("hash") or {}).get("stable"),
+        "first_seen": documento.get("first_seen") or ts,
+        "last_seen": documento.get("last_seen") or ts,
+        "source": documento.get("source") or {},
+        "senales": extraer_senales(documento),
+    }
+
+
+def _sumar_visita(entrada: dict, origen: str, ts: str, n: int = 1):
+    entrada["visitas"] += n
+    entrada["balizas"][origen] = entrada["balizas"].get(origen, 0) + n
+    if ts and _posterior(ts, entrada["ultima_visita"]):
+        entrada["ultima_visita"] = ts
+
+
+# ---------------------------------------------------------
+# Actualización incremental
+# ---------------------------------------------------------
+def registrar_captura(fingerprint_id: str, documento: dict, source: dict, timestamp: str):
+    """
+    Alta del fingerprint (también en el índice de similitud del proceso)
+    o actualización de last_seen / source, O(1).
+    """
+    alta = []
+
+    def aplicar(e):
+        e = e or _entrada_vacia()
+        if "first_seen" not in e:
+            e.update(_datos_documento(documento, timestamp))
+            alta.append(e["senales"])
+        if _posterior(timestamp, e.get("last_seen")):
+            e["last_seen"] = timestamp
+        e["source"] = source or e.get("source") or {}
+        return e
+
+    try:
+        entrada = get_backend().modificar_estado(ESPACIO_MANIFIESTO, fingerprint_id, aplicar)
+        if entrada is not None and alta:
+            INDICE_SIMILITUD.anadir(fingerprint_id, alta[-1])
+        return entrada
+    except Exception as e:
+        # El manifiesto nunca debe impedir guardar la captura
+        print(f"[manifiesto] Error actualizando {fingerprint_id}: {e}")
+        return None
+
+
+def registrar_visita(evento: dict):
+    """Suma un evento de baliza a su fingerprint, O(1)."""
+    fp = (evento.get("fingerprint_id") or "").strip()
+    if not fp:
+        return None
+    origen = evento.get("origen") or "desconocido"
+    ts = evento.get("timestamp") or ""
+
+    def aplicar(e):
+        e = e or _entrada_vacia()
+        _sumar_visita(e, origen, ts)
+        return e
+
+    try:
+        return get_backend().modificar_estado(ESPACIO_MANIFIESTO, fp, aplicar)
+    except Exception as e:
+        print(f"[manifiesto] Error actualizando {fp}: {e}")
+        return None
+
+
+# ---------------------------------------------------------
+# Reconstrucción completa
+# ---------------------------------------------------------
+def reconstruir() -> dict:
+    """
+    Recalcula el manifiesto leyendo una vez los documentos de
+    data/fingerprints, el registro de capturas y el histórico de eventos.
+    """
+    manifiesto = {}
+
+    if os.path.isdir(FINGERPRINTS_DIR):
+        for nombre in os.listdir(FINGERPRINTS_DIR):
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(FINGERPRINTS_DIR, nombre), "r", encoding="utf-8") as f:
+                    documento = json.load(f)
+            except Exception:
+                continue
+            fp_id = documento.get("fingerprint_id")
+            if not fp_id:
+                continue
+            entrada = manifiesto[fp_id] = _entrada_vacia()
+            entrada.update(_datos_documento(ALMACEN_CAPTURAS.completar(documento)))
+
+    columnas = ["fingerprint_id", "origen", "timestamp"]
+    for row in iterar_historico("balizas_eventos", columnas=columnas):
+        fp = row.get("fingerprint_id")
+        if not fp:
+            continue
+        entrada = manifiesto.get(fp)
+        if entrada is None:
+            entrada = manifiesto[fp] = _entrada_vacia()
+        _sumar_visita(entrada, row.get("origen") or "desconocido", row.get("timestamp") or "")
+
+    get_backend().reemplazar_estado(ESPACIO_MANIFIESTO, manifiesto)
+    return manifiesto
+
+
+def leer_manifiesto(force: bool = False) -> dict:
+    """
+    {fingerprint_id: resumen} de los fingerprints capturados. Lee el
+    estado mantenido al escribir; solo recorre disco e histórico la
+    primera vez o con force=True.
+    """
+    manifiesto = None if force else get_backend().leer_estado(ESPACIO_MANIFIESTO)
+    if manifiesto is None:
+        manifiesto = reconstruir()
+    manifiesto = {fp: e for fp, e in manifiesto.items() if "first_seen" in e}
+    for fp, e in manifiesto.items():
+        if "senales" not in e:
+            _completar_senales(fp, e)
+    return manifiesto
+
+
+def _completar_senales(fingerprint_id: str, entrada: dict):
+    """Añade las señales a una entrada creada antes de guardarlas (lee su documento una vez)."""
+    try:
+        with open(os.path.join(FINGERPRINTS_DIR, f"{fingerprint_id}.json"), "r", encoding="utf-8") as f:
+            entrada["senales"] = extraer_senales(json.load(f))
+    except Exception:
+        entrada["senales"] = {}
+
+    def aplicar(e):
+        if e is None:
+            return None
+        e["senales"] = entrada["senales"]
+        return e
+
+    try:
+        get_backend().modificar_estado(ESPACIO_MANIFIESTO, fingerprint_id, aplicar)
+    except Exception as e:
+        print(f"[manifiesto] Error actualizando {fingerprint_id}: {e}")
@@ -0,0 +1,213 @@
+# utils/motores_fp.py
+"""
+Índices por motor de fingerprint (fingerprintjs, creepjs, broprint,
+thumbmark, detectincognito).
+
+Cada motor devuelve su propio identificador del navegador. Al ingerir un
+fingerprint se anota, por motor, valor -> fingerprint_id en el backend
+(espacio "motores", clave "<motor>:<valor>"). Resolver un payload
+multi-motor contra los fingerprints conocidos son así tantas búsquedas
+por clave como motores trae:
+
+- los candidatos son los fingerprints que comparten el valor de algún
+  motor; su confianza es calculate_confidence (ENGINE_WEIGHTS) sobre los
+  motores que coinciden;
+- la comparación completa (señales de la política, como
+  comparar_fingerprints) solo se hace con esos candidatos, leyendo sus
+  señales del manifiesto (utils/manifiesto_fp.py), nunca con todo el
+  almacén.
+
+Un valor compartido por más de FARO_FP_BLOQUE_MAX fingerprints (p.ej. un
+motor que devuelve siempre lo mismo) deja de crecer y no se usa para
+resolver, igual que los bloques del índice de similitud.
+"""
+
+import os
+import json
+import hashlib
+
+from . import FINGERPRINTS_DIR, FP_BLOQUE_MAX, FP_MOTORES_UMBRAL
+from .storage import get_backend
+from .fingerprint_normalizer import ENGINE_WEIGHTS, calculate_confidence, calculate_fp_id, normalize_engines
+from .fingerprint_policy import load_fingerprint_policy
+from .manifiesto_fp import ESPACIO_MANIFIESTO
+from .similitud_fp import extraer_senales, puntuar
+
+# Espacio del estado derivado en el backend
+ESPACIO_MOTORES = "motores"
+
+# Candidatos (los de mayor confianza por motores) que pasan a la comparación completa
+CANDIDATOS_MAX = 20
+
+# Campos con el identificador que calcula cada motor (en orden de preferencia)
+CLAVES_ID = ("visitorId", "hash", "fingerprint", "id")
+
+
+# ---------------------------
+# Valor identificador por motor
+# ---------------------------
+def valor_motor(resultado):
+    """
+    Identificador estable del resultado de un motor, o None si el motor
+    no se ejecutó o dio error. Usa visitorId / hash / fingerprint / id si
+    el adapter lo devuelve; si no, un hash canónico de sus datos.
+    """
+    if resultado in (None, "", False):
+        return None
+    if not isinstance(resultado, dict):
+        return str(resultado)
+    if resultado.get("error"):
+        return None
+    datos = resultado.get("data", resultado)
+    if isinstance(datos, dict):
+        for clave in CLAVES_ID:
+            if datos.get(clave):
+                return str(datos[clave])
+    canonico = json.dumps(datos, sort_keys=True, separators=(",", ":"), default=str)
+    return "sha256:" + hashlib.sha256(canonico.encode("utf-8")).hexdigest()[:32]
+
+
+def valores_motores(engines: dict) -> dict:
+    """{motor: valor} de los motores conocidos con resultado válido."""
+    valores = {}
+    for motor in ENGINE_WEIGHTS:
+        valor = valor_motor((engines or {}).get(motor))
+        if valor is not None:
+            valores[motor] = valor
+    return valores
+
+
+def _clave(motor: str, valor: str) -> str:
+    return f"{motor}:{valor}"
+
+
+# ---------------------------
+# Índice
+# ---------------------------
+class IndiceMotores:
+    """motor -> valor -> fingerprint_ids, en el estado del backend."""
+
+    def __init__(self, espacio: str = ESPACIO_MOTORES, max_fingerprints: int = FP_BLOQUE_MAX):
+        self.espacio = espacio
+        self.max_fingerprints = max_fingerprints
+        self._inicializado = False
+
+    def _asegurar_inicializado(self):
+        if not self._inicializado:
+            if not get_backend().estado_inicializado(self.espacio):
+                self.reconstruir()
+            self._inicializado = True
+
+    def registrar(self, fingerprint_id: str, engines: dict):
+        """Anota los valores de los motores de un fingerprint ingerido, O(motores)."""
+        self._asegurar_inicializado()
+        for motor, valor in valores_motores(engines).items():
+            def anadir(e):
+                e = e or {"fingerprints": [], "comun": False}
+                if fingerprint_id in e["fingerprints"] or e["comun"]:
+                    return None
+                if len(e["fingerprints"]) >= self.max_fingerprints:
+                    return {"fingerprints": [], "comun": True}
+                e["fingerprints"].append(fingerprint_id)
+                return e
+
+            get_backend().modificar_estado(self.espacio, _clave(motor, valor), anadir)
+
+    def candidatos(self, engines: dict) -> dict:
+        """{fingerprint_id: [motores que coinciden]} con una búsqueda por motor."""
+        self._asegurar_inicializado()
+        candidatos = {}
+        for motor, valor in valores_motores(engines).items():
+            e = get_backend().leer_estado_clave(self.espacio, _clave(motor, valor))
+            if not e or e["comun"]:
+                continue
+            for fp in e["fingerprints"]:
+                candidatos.setdefault(fp, []).append(motor)
+        return candidatos
+
+    def resolver(self, engines: dict, metadata: dict = None) -> list:
+        """
+        Fingerprints conocidos que comparten algún motor con el payload,
+        de mayor a menor confianza: {fingerprint_id, motores, confidence
+        (ENGINE_WEIGHTS), score / policy_confidence (comparación completa)}.
+        Solo los CANDIDATOS_MAX de más confianza se comparan completos.
+        """
+        candidatos = self.candidatos(engines)
+        if not candidatos:
+            return []
+        confianzas = {fp: calculate_confidence({m: True for m in motores}) for fp, motores in candidatos.items()}
+        mejores = sorted(candidatos, key=lambda fp: (-confianzas[fp], fp))[:CANDIDATOS_MAX]
+        politica = load_fingerprint_policy()
+        senales = extraer_senales({"raw": {"engines": engines, "metadata": metadata or {}}},
+                                  politica.get("checks"))
+        resultado = []
+        for fp in mejores:
+            entrada = get_backend().leer_estado_clave(ESPACIO_MANIFIESTO, fp) or {}
+            comparacion = puntuar(senales, entrada.get("senales") or {}, politica)
+            resultado.append({
+                "fingerprint_id": fp,
+                "motores": candidatos[fp],
+                "confidence": confianzas[fp],
+                "score": comparacion["score"],
+                "policy_confidence": comparacion["confidence"],
+            })
+        resultado.sort(key=lambda r: (-r["confidence"], -r["score"], r["fingerprint_id"]))
+        return resultado
+
+    def reconstruir(self) -> dict:
+        """
+        Recalcula el índice desde los documentos de data/fingerprints
+        (los ids asignados solo en el webhook de motores no tienen
+        documento: se conservan mientras no se reconstruya).
+        """
+        indice = {}
+        if os.path.isdir(FINGERPRINTS_DIR):
+            for nombre in os.listdir(FINGERPRINTS_DIR):
+                if not nombre.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(FINGERPRINTS_DIR, nombre), "r", encoding="utf-8") as f:
+                        documento = json.load(f)
+                except Exception:
+                    continue
+                fp_id = documento.get("fingerprint_id")
+                raw = documento.get("raw") or documento.get("data") or {}
+                if not fp_id or not isinstance(raw, dict):
+                    continue
+                for motor, valor in valores_motores(raw.get("engines")).items():
+                    fps = indice.setdefault(_clave(motor, valor), [])
+                    if fp_id not in fps:
+                        fps.append(fp_id)
+        valores = {}
+        for clave, fps in indice.items():
+            comun = len(fps) > self.max_fingerprints
+            valores[clave] = {"fingerprints": [] if comun else fps, "comun": comun}
+        get_backend().reemplazar_estado(self.espacio, valores)
+        self._inicializado = True
+        return valores
+
+
+INDICE_MOTORES = IndiceMotores()
+
+
+# ---------------------------------------------------------
+# Atajos
+# ---------------------------------------------------------
+def registrar_motores(fingerprint_id: str, engines: dict):
+    """Tras ingerir un fingerprint: anota sus motores (nunca impide la ingesta)."""
+    try:
+        INDICE_MOTORES.registrar(fingerprint_id, engines)
+    except Exception as e:
+        print(f"[motores] Error indexando {fingerprint_id}: {e}")
+
+
+def identificar(engines: dict, metadata: dict, umbral: float = FP_MOTORES_UMBRAL):
+    """
+    fingerprint_id de un payload multi-motor: el del mejor candidato si
+    su confianza llega al umbral, o uno nuevo (calculate_fp_id).
+    Devuelve (fingerprint_id, candidatos).
+    """
+    candidatos = INDICE_MOTORES.resolver(engines, metadata)
+    if candidatos and candidatos[0]["confidence"] >= umbral:
+        return candidatos[0]["fingerprint_id"], candidatos
+    return calculate_fp_id(normalize_engines(engines), metadata), candidatos
@@ -0,0 +1,157 @@
+# utils/pixel.py
+"""
+Píxel de las balizas servido desde memoria.
+
+Todas las balizas sirven el mismo PNG (balizas/origin.png): se lee una
+vez por proceso y cada petición responde con ese buffer y sus cabeceras
+ya calculadas (ETag, Content-Type), sin abrir ficheros. Crear una baliza
+no copia ningún PNG.
+
+- Una baliza puede tener su propio PNG en balizas/<origen>.png (p.ej. las
+  copias de origin.png que se generaban antes). Solo esos ficheros se
+  cargan aparte y, si son idénticos a origin.png, comparten su buffer.
+- La carpeta se revisa como mucho cada FARO_PIXEL_REFRESCO segundos (un
+  stat() de la carpeta y de origin.png): añadir o quitar un PNG propio, o
+  cambiar origin.png, se ve sin reiniciar.
+- Cache-Control: no-cache + ETag: el navegador revalida en cada carga (la
+  visita se registra igual) y, si ya tiene el píxel, recibe un 304 sin
+  cuerpo.
+"""
+
+import os
+import time
+import hashlib
+import threading
+
+from flask import Response, request
+
+from . import BALIZAS_FOLDER, ORIGIN_PNG, PIXEL_REFRESCO
+
+# PNG transparente de 1x1 si falta origin.png
+PNG_VACIO = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c489"
+    "0000000b49444154789c6360000200000500017a5eab3f0000000049454e44ae426082"
+)
+
+
+class Pixel:
+    """Bytes de un PNG con sus cabeceras de respuesta."""
+
+    __slots__ = ("datos", "etag", "cabeceras")
+
+    def __init__(self, datos: bytes):
+        self.datos = datos
+        self.etag = hashlib.sha1(datos).hexdigest()[:20]
+        self.cabeceras = {
+            "Content-Type": "image/png",
+            "ETag": f'"{self.etag}"',
+            "Cache-Control": "no-cache",
+        }
+
+
+def _firma(ruta: str):
+    try:
+        st = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class CachePixeles:
+    """PNG común y PNG propios de las balizas, en memoria."""
+
+    def __init__(self, carpeta: str = BALIZAS_FOLDER, png_comun: str = ORIGIN_PNG,
+                 refresco: float = PIXEL_REFRESCO):
+        self.carpeta = carpeta
+        self.png_comun = png_comun
+        self.refresco = refresco
+        self._lock = threading.Lock()
+        self._firma = None
+        self._revisado = None
+        self._comun = Pixel(PNG_VACIO)
+        self._propios = {}          # origen -> Pixel
+        self._firmas_propios = {}   # nombre de fichero -> (mtime, tamaño)
+
+    def _leer(self, ruta: str):
+        try:
+            with open(ruta, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _cargar(self):
+        """Relee origin.png y los PNG propios nuevos o modificados."""
+        datos = self._leer(self.png_comun)
+        comun = self._comun if datos == self._comun.datos else Pixel(datos or PNG_VACIO)
+        propios, firmas = {}, {}
+        nombre_comun = os.path.basename(self.png_comun)
+        try:
+            entradas = list(os.scandir(self.carpeta))
+        except FileNotFoundError:
+            entradas = []
+        for entrada in entradas:
+            if not entrada.name.endswith(".png") or entrada.name == nombre_comun:
+                continue
+            try:
+                st = entrada.stat()
+            except OSError:
+                continue
+            origen = entrada.name[:-4]
+            firma = (st.st_mtime_ns, st.st_size)
+            anterior = self._propios.get(origen)
+            if anterior is not None and self._firmas_propios.get(entrada.name) == firma:
+                pixel = anterior
+            else:
+                datos = self._leer(entrada.path)
+                if datos is None:
+                    continue
+                pixel = Pixel(datos)
+            # Las copias de origin.png comparten el buffer común
+            propios[origen] = comun if pixel.datos == comun.datos else pixel
+            firmas[entrada.name] = firma
+        self._comun, self._propios, self._firmas_propios = comun, propios, firmas
+
+    def _revisar(self):
+        ahora = time.monotonic()
+        if self._revisado is not None and ahora - self._revisado < self.refresco:
+            return
+        with self._lock:
+            if self._revisado is not None and ahora - self._revisado < self.refresco:
+                return
+            firma = (_firma(self.carpeta), _firma(self.png_comun))
+            if firma != self._firma:
+                self._cargar()
+                self._firma = firma
+            self._revisado = ahora
+
+    def invalidar(self):
+        """Fuerza la revisión de la carpeta en la siguiente petición."""
+        with self._lock:
+            self._firma = None
+            self._revisado = None
+
+    def pixel(self, origen: str) -> Pixel:
+        """PNG propio de la baliza o, si no tiene, el común."""
+        self._revisar()
+        return self._propios.get(origen, self._comun)
+
+    def responder(self, origen: str, adjunto: str = None) -> Response:
+        """
+        Respuesta de la petición en curso: el píxel o un 304 si el navegador
+        ya lo tiene. Con `adjunto`, como descarga con ese nombre de fichero.
+        """
+        pixel = self.pixel(origen)
+        if request.if_none_match.contains(pixel.etag):
+            return Response(status=304, headers=pixel.cabeceras)
+        respuesta = Response(pixel.datos, headers=pixel.cabeceras)
+        if adjunto:
+            respuesta.headers.set("Content-Disposition", "attachment", filename=adjunto)
+        return respuesta
+
+
+PIXELES = CachePixeles()
+
+
+def responder_pixel(origen: str, adjunto: str = None) -> Response:
+    """Atajo sobre la caché del proceso."""
+    return PIXELES.responder(origen, adjunto)
@@ -0,0 +1,192 @@
+# utils/puntuacion_fp.py
+"""
+Puntuación por lotes de la política de correlación de fingerprints.
+
+comparar_fingerprints puntúa una pareja clave a clave. Aquí la política
+se compila una vez (claves, pesos y umbrales; se recompila si cambia el
+fichero) y cada fingerprint se codifica como una fila de enteros: una
+columna por clave de la política, con el valor de la señal sustituido
+por su código en un diccionario por clave (0 = sin dato). La
+codificación es exacta: dos señales coinciden si y solo si sus códigos
+son iguales y distintos de 0, igual que en comparar_fingerprints.
+
+Con NumPy las columnas son arrays int32 y un score uno-contra-muchos es
+una suma ponderada de comparaciones vectorizadas; muchos-contra-muchos
+se calcula por bloques de filas. NumPy es opcional: sin él se usa la
+misma codificación con bucles de Python (mismos resultados, más lento).
+"""
+
+import threading
+
+from .fingerprint_policy import load_fingerprint_policy, firma_politica
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - dependencia opcional
+    np = None
+
+NIVELES = ("LOW", "MEDIUM", "HIGH")
+
+# Filas de la matriz muchos-contra-muchos calculadas de una vez
+FILAS_POR_BLOQUE = 256
+
+
+def disponible() -> bool:
+    """True si NumPy está instalado (puntuación vectorizada)."""
+    return np is not None
+
+
+# ---------------------------
+# Política compilada
+# ---------------------------
+class PoliticaCompilada:
+    """Claves, pesos y umbrales de la política en orden fijo."""
+
+    def __init__(self, politica: dict):
+        checks = politica.get("checks", {})
+        niveles = politica.get("confidence_levels", {})
+        self.politica = politica
+        self.claves = list(checks)
+        self.pesos = [int(checks[c]) for c in self.claves]
+        self.alto = niveles.get("HIGH", 80)
+        self.medio = niveles.get("MEDIUM", 50)
+
+    def confianza(self, score: int) -> str:
+        if score >= self.alto:
+            return "HIGH"
+        if score >= self.medio:
+            return "MEDIUM"
+        return "LOW"
+
+    def niveles(self, scores):
+        """Índice en NIVELES (0 LOW, 1 MEDIUM, 2 HIGH) de cada score."""
+        if np is not None and not isinstance(scores, list):
+            return (scores >= self.medio).astype(np.int8) + (scores >= self.alto).astype(np.int8)
+        return [self.niveles(s) if isinstance(s, list) else (s >= self.medio) + (s >= self.alto)
+                for s in scores]
+
+
+_compilada = {"firma": None, "politica": None}
+_lock_politica = threading.Lock()
+
+
+def politica_compilada() -> PoliticaCompilada:
+    """Política del fichero compilada; solo se recompila si cambia su mtime."""
+    firma = firma_politica()
+    with _lock_politica:
+        if _compilada["politica"] is None or firma is None or firma != _compilada["firma"]:
+            _compilada["politica"] = PoliticaCompilada(load_fingerprint_policy())
+            _compilada["firma"] = firma
+        return _compilada["politica"]
+
+
+# ---------------------------
+# Matriz de fingerprints
+# ---------------------------
+class MatrizFingerprints:
+    """
+    Fingerprints codificados por columnas (una por clave de la política).
+    Los diccionarios de códigos son de la matriz: las consultas se
+    codifican con ellos (un valor desconocido no coincide con nadie).
+    """
+
+    def __init__(self, politica: PoliticaCompilada = None, capacidad: int = 1024):
+        self.politica = politica or politica_compilada()
+        self.ids = []
+        self._codigos = [{} for _ in self.politica.claves]
+        self._n = 0
+        if np is not None:
+            self._columnas = np.zeros((len(self.politica.claves), max(1, capacidad)), dtype=np.int32)
+        else:
+            self._filas = []
+
+    def __len__(self):
+        return self._n
+
+    def _codificar(self, senales: dict, crear: bool) -> list:
+        fila = []
+        for clave, codigos in zip(self.politica.claves, self._codigos):
+            valor = senales.get(clave)
+            if valor is None:
+                fila.append(0)
+            elif crear:
+                fila.append(codigos.setdefault(valor, len(codigos) + 1))
+            else:
+                fila.append(codigos.get(valor, -1))  # -1: ningún fingerprint lo tiene
+        return fila
+
+    def anadir(self, fp_id: str, senales: dict):
+        fila = self._codificar(senales, crear=True)
+        if np is not None:
+            if self._n == self._columnas.shape[1]:
+                ampliada = np.zeros((self._columnas.shape[0], self._n * 2), dtype=np.int32)
+                ampliada[:, :self._n] = self._columnas
+                self._columnas = ampliada
+            self._columnas[:, self._n] = fila
+        else:
+            self._filas.append(fila)
+        self.ids.append(fp_id)
+        self._n += 1
+
+    def anadir_muchos(self, senales_por_id: dict):
+        for fp_id, senales in senales_por_id.items():
+            self.anadir(fp_id, senales)
+
+    def columnas(self):
+        """Vista (claves x n) de los códigos (solo con NumPy)."""
+        return self._columnas[:, :self._n]
+
+    # ---------- puntuación ----------
+    def uno_contra_todos(self, senales: dict):
+        """Score de `senales` contra cada fingerprint de la matriz (orden de self.ids)."""
+        consulta = self._codificar(senales, crear=False)
+        pesos = self.politica.pesos
+        if np is not None:
+            columnas = self.columnas()
+            scores = np.zeros(self._n, dtype=np.int64)
+            for j, codigo in enumerate(consulta):
+                if codigo > 0 and pesos[j]:
+                    scores += pesos[j] * (columnas[j] == codigo)
+            return scores
+        activas = [(j, c, pesos[j]) for j, c in enumerate(consulta) if c > 0 and pesos[j]]
+        return [sum(p for j, c, p in activas if fila[j] == c) for fila in self._filas]
+
+    def todos_contra_todos(self, otra: "MatrizFingerprints" = None):
+        """
+        Matriz de scores (len(self) x len(otra)); `otra` debe compartir
+        la política y, para códigos comparables, ser esta misma matriz o
+        haberse codificado con copiar_vacia().
+        """
+        otra = otra if otra is not None else self
+        pesos = self.politica.pesos
+        if np is not None:
+            a, b = self.columnas(), otra.columnas()
+            scores = np.zeros((self._n, otra._n), dtype=np.int64)
+            for inicio in range(0, self._n, FILAS_POR_BLOQUE):
+                fin = min(inicio + FILAS_POR_BLOQUE, self._n)
+                bloque = scores[inicio:fin]
+                for j, peso in enumerate(pesos):
+                    if not peso:
+                        continue
+                    izquierda = a[j, inicio:fin, None]
+                    bloque += peso * ((izquierda == b[j][None, :]) & (izquierda > 0))
+            return scores
+        return [[sum(p for x, y, p in zip(fa, fb, pesos) if x > 0 and x == y) for fb in otra._filas]
+                for fa in self._filas]
+
+    def copiar_vacia(self) -> "MatrizFingerprints":
+        """Matriz vacía con la misma política y los mismos diccionarios de códigos."""
+        nueva = MatrizFingerprints(self.politica)
+        nueva._codigos = self._codigos
+        return nueva
+
+    def mejores(self, senales: dict, k: int = 5, excluir: str = None) -> list:
+        """Los k fingerprints con mayor score frente a `senales`, con su confianza."""
+        scores = self.uno_contra_todos(senales)
+        if np is not None:
+            orden = np.argsort(-scores, kind="stable")[:k + 1]
+            candidatos = [(self.ids[i], int(scores[i])) for i in orden]
+        else:
+            candidatos = sorted(zip(self.ids, scores), key=lambda x: -x[1])[:k + 1]
+        return [{"fingerprint_id": fp, "score": s, "confidence": self.politica.confianza(s)}
+                for fp, s in candidatos if fp != excluir][:k]
@@ -0,0 +1,211 @@
+# utils/rangos_ip.py
+"""
+Clasificación de IPs por rangos de proveedores cloud / hosting / VPN.
+
+Los rangos se leen de los ficheros de data/rangos (FARO_RANGOS_DIR):
+- JSON publicados por los proveedores (AWS ip-ranges.json, GCP cloud.json,
+  Azure ServiceTags, DigitalOcean, Oracle...): se recogen todos los
+  valores con forma de CIDR, sea cual sea su clave;
+- CSV / TXT con un CIDR por línea y, opcionalmente, la categoría
+  (cloud / hosting / vpn) y el proveedor en las columnas siguientes.
+
+El proveedor es el nombre del fichero (aws.json -> "aws") y la categoría
+sale de CATEGORIA_PROVEEDOR (por defecto "hosting"; los ficheros vpn*
+son "vpn"). Si un CIDR aparece en varios ficheros gana el más específico.
+
+Con ellos se construye un trie binario por familia (IPv4 / IPv6): buscar
+una IP recorre como mucho 32 / 128 nodos y devuelve el prefijo más largo
+que la contiene, sin tocar la red ni depender del texto del ISP.
+Los ficheros se cargan en la primera consulta de cada proceso; los
+cambios se aplican con recargar() o al reiniciar los workers.
+"""
+
+import os
+import csv
+import json
+import socket
+import ipaddress
+import threading
+
+from . import RANGOS_DIR
+
+CATEGORIAS = ("cloud", "hosting", "vpn")
+
+CATEGORIA_PROVEEDOR = {
+    "aws": "cloud", "amazon": "cloud",
+    "gcp": "cloud", "google": "cloud",
+    "azure": "cloud", "microsoft": "cloud",
+    "oracle": "cloud",
+}
+
+EXTENSIONES = (".json", ".csv", ".txt")
+
+
+# ---------------------------
+# Trie
+# ---------------------------
+class TrieIp:
+    """
+    Trie binario de prefijos de `bits` bits (32 para IPv4, 128 para IPv6).
+    Cada nodo es una lista [hijo_0, hijo_1, valor].
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.raiz = [None, None, None]
+        self.prefijos = 0
+
+    def insertar(self, red: int, longitud: int, valor):
+        nodo = self.raiz
+        for i in range(self.bits - 1, self.bits - 1 - longitud, -1):
+            bit = (red >> i) & 1
+            if nodo[bit] is None:
+                nodo[bit] = [None, None, None]
+            nodo = nodo[bit]
+        if nodo[2] is None:
+            self.prefijos += 1
+        nodo[2] = valor
+
+    def buscar(self, direccion: int):
+        """Valor del prefijo más largo que contiene `direccion`, o None."""
+        nodo, valor = self.raiz, self.raiz[2]
+        i = self.bits - 1
+        while i >= 0:
+            nodo = nodo[(direccion >> i) & 1]
+            if nodo is None:
+                break
+            if nodo[2] is not None:
+                valor = nodo[2]
+            i -= 1
+        return valor
+
+
+# ---------------------------
+# Lectura de ficheros
+# ---------------------------
+def _red(texto: str):
+    try:
+        return ipaddress.ip_network(texto.strip(), strict=False)
+    except ValueError:
+        return None
+
+
+def _cidrs_json(dato):
+    """Todos los valores de texto con forma de CIDR del documento."""
+    if isinstance(dato, dict):
+        for valor in dato.values():
+            yield from _cidrs_json(valor)
+    elif isinstance(dato, list):
+        for valor in dato:
+            yield from _cidrs_json(valor)
+    elif isinstance(dato, str) and "/" in dato:
+        red = _red(dato)
+        if red is not None:
+            yield red
+
+
+def _categoria(proveedor: str) -> str:
+    if proveedor.startswith("vpn"):
+        return "vpn"
+    return CATEGORIA_PROVEEDOR.get(proveedor, "hosting")
+
+
+def leer_rangos(ruta: str):
+    """(red, categoría, proveedor) de un fichero de rangos."""
+    proveedor = os.path.basename(ruta).split(".", 1)[0].lower()
+    categoria = _categoria(proveedor)
+
+    if ruta.endswith(".json"):
+        with open(ruta, "r", encoding="utf-8") as f:
+            for red in _cidrs_json(json.load(f)):
+                yield red, categoria, proveedor
+        return
+
+    with open(ruta, "r", encoding="utf-8", newline="") as f:
+        for fila in csv.reader(f):
+            if not fila or fila[0].lstrip().startswith("#"):
+                continue
+            red = _red(fila[0])
+            if red is None:
+                continue  # cabecera u otra línea sin CIDR
+            cat = fila[1].strip().lower() if len(fila) > 1 else ""
+            prov = fila[2].strip().lower() if len(fila) > 2 else ""
+            yield red, cat if cat in CATEGORIAS else categoria, prov or proveedor
+
+
+# ---------------------------
+# Clasificador
+# ---------------------------
+class ClasificadorRangos:
+    """Tries IPv4 / IPv6 construidos con los ficheros de `directorio`."""
+
+    def __init__(self, directorio: str = RANGOS_DIR):
+        self.directorio = directorio
+        self._lock = threading.Lock()
+        self._tries = None  # (ipv4, ipv6), sustituidos de una vez al recargar
+        self.ficheros = {}
+
+    def ficheros_rangos(self) -> list:
+        if not os.path.isdir(self.directorio):
+            return []
+        return sorted(
+            os.path.join(self.directorio, n) for n in os.listdir(self.directorio)
+            if n.lower().endswith(EXTENSIONES)
+        )
+
+    def recargar(self):
+        """Vuelve a leer todos los ficheros de rangos."""
+        v4, v6 = TrieIp(32), TrieIp(128)
+        ficheros = {}
+        for ruta in self.ficheros_rangos():
+            n = 0
+            try:
+                for red, categoria, proveedor in leer_rangos(ruta):
+                    trie = v4 if red.version == 4 else v6
+                    trie.insertar(int(red.network_address), red.prefixlen,
+                                  (proveedor, categoria, str(red)))
+                    n += 1
+            except Exception as e:
+                print(f"[rangos] Error leyendo {ruta}: {e}")
+            ficheros[os.path.basename(ruta)] = n
+        self._tries = (v4, v6)
+        self.ficheros = ficheros
+
+    def _cargados(self):
+        tries = self._tries
+        if tries is None:
+            with self._lock:
+                if self._tries is None:
+                    self.recargar()
+                tries = self._tries
+        return tries
+
+    def clasificar(self, ip: str):
+        """
+        {"proveedor", "categoria", "red"} del rango más específico que
+        contiene la IP, o None si no está en ningún fichero.
+        """
+        v4, v6 = self._tries or self._cargados()
+        try:
+            encontrado = v4.buscar(int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big"))
+        except OSError:
+            try:
+                encontrado = v6.buscar(int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big"))
+            except OSError:
+                return None
+        if encontrado is None:
+            return None
+        proveedor, categoria, red = encontrado
+        return {"proveedor": proveedor, "categoria": categoria, "red": red}
+
+    def estado(self) -> dict:
+        v4, v6 = self._cargados()
+        return {"ficheros": dict(self.ficheros), "prefijos_ipv4": v4.prefijos, "prefijos_ipv6": v6.prefijos}
+
+
+CLASIFICADOR_RANGOS = ClasificadorRangos()
+
+
+def clasificar_ip(ip: str):
+    """Atajo sobre el clasificador del proceso."""
+    return CLASIFICADOR_RANGOS.clasificar(ip)
@@ -0,0 +1,220 @@
+# utils/similitud_fp.py
+"""
+Índice de similitud entre fingerprints (score_vs_others de /equipos).
+
+Comparar cada fingerprint con todos los demás es O(n²). Aquí cada
+fingerprint se resume en las señales de la política de correlación
+(config_fingerprint.json: visitorId, platform, browser...) y se indexa
+por bloques:
+
+- una pareja llega al umbral MEDIUM solo si coincide en todas las
+  señales de algún conjunto mínimo de claves cuyo peso suma MEDIUM
+  (con la política por defecto, todos incluyen visitorId);
+- cada fingerprint entra en un bloque por conjunto mínimo, con clave
+  (conjunto, valores); los candidatos son los que comparten bloque;
+- solo los candidatos se puntúan con la política (mismo cálculo que
+  comparar_fingerprints) y se devuelven los k mejores.
+
+No se pierde ninguna pareja >= MEDIUM, salvo las de bloques con más de
+`max_bloque` fingerprints (FARO_FP_BLOQUE_MAX), que se ignoran para
+acotar el coste si la política solo pesa señales muy comunes.
+
+El índice vive en memoria y se sincroniza con el manifiesto
+(utils/manifiesto_fp.py), que guarda las señales de cada fingerprint al
+capturarlo: añadir uno nuevo no lee ningún documento. Si cambia la
+política se reconstruye desde el manifiesto.
+"""
+
+import json
+import threading
+
+from . import FP_SIMILARES, FP_BLOQUE_MAX
+from .fingerprint_policy import load_fingerprint_policy, DEFAULT_FP_POLICY
+from .utils import parse_user_agent
+
+
+# ---------------------------
+# Señales
+# ---------------------------
+def _normalizar(valor):
+    """Valor comparable (texto) de una señal, o None si no hay dato."""
+    if isinstance(valor, dict) and "value" in valor:
+        valor = valor["value"]  # componentes de FingerprintJS: {"value", "duration"}
+    if valor is None or valor == "" or valor == "Desconocido":
+        return None
+    if isinstance(valor, list) and len(valor) == 2 and all(isinstance(v, (int, float)) for v in valor):
+        return f"{valor[0]}x{valor[1]}"  # screenResolution [ancho, alto]
+    if isinstance(valor, (dict, list)):
+        return json.dumps(valor, sort_keys=True, separators=(",", ":"))
+    return str(valor)
+
+
+def extraer_senales(documento: dict, claves=None) -> dict:
+    """
+    {clave: valor} de las señales de la política en un documento de
+    fingerprint (utils/fingerprint.py o utils/fingerprint_backend.py).
+    """
+    if claves is None:
+        claves = set(DEFAULT_FP_POLICY["checks"]) | set(load_fingerprint_policy()["checks"])
+    core = (documento.get("signals") or {}).get("core") or {}
+    raw = documento.get("raw") or documento.get("data") or {}
+    fpjs = ((raw.get("engines") or {}).get("fingerprintjs") or {}).get("data") or {}
+    componentes = fpjs.get("components") or {}
+    metadata = raw.get("metadata") or {}
+
+    alternativas = {
+        "visitorId": [fpjs.get("visitorId")],
+        "browser": [core.get("browserName"), componentes.get("browserName"),
+                    parse_user_agent(metadata.get("user_agent") or "")[1]],
+        "timezone": [metadata.get("timezone")],
+        "screenResolution": [metadata.get("screen")],
+        "platform": [metadata.get("platform")],
+    }
+    senales = {}
+    for clave in claves:
+        for valor in [core.get(clave), componentes.get(clave)] + alternativas.get(clave, []):
+            valor = _normalizar(valor)
+            if valor is not None:
+                senales[clave] = valor
+                break
+    return senales
+
+
+def puntuar(senales_1: dict, senales_2: dict, politica: dict) -> dict:
+    """Score ponderado y nivel de confianza según la política."""
+    score, matches = 0, []
+    for clave, peso in politica.get("checks", {}).items():
+        valor = senales_1.get(clave)
+        if valor is not None and valor == senales_2.get(clave):
+            score += int(peso)
+            matches.append(clave)
+    niveles = politica.get("confidence_levels", {})
+    if score >= niveles.get("HIGH", 80):
+        confianza = "HIGH"
+    elif score >= niveles.get("MEDIUM", 50):
+        confianza = "MEDIUM"
+    else:
+        confianza = "LOW"
+    return {"score": score, "confidence": confianza, "matches": matches}
+
+
+# ---------------------------
+# Índice por bloques
+# ---------------------------
+def subconjuntos_minimos(checks: dict, umbral: int) -> list:
+    """
+    Conjuntos mínimos de claves cuyo peso suma al menos `umbral`
+    (quitar cualquiera de ellas lo deja por debajo).
+    """
+    claves = sorted(c for c, peso in checks.items() if int(peso) > 0)
+    minimos = []
+    for mascara in range(1, 1 << len(claves)):
+        grupo = [c for i, c in enumerate(claves) if mascara >> i & 1]
+        peso = sum(int(checks[c]) for c in grupo)
+        if peso >= umbral and all(peso - int(checks[c]) < umbral for c in grupo):
+            minimos.append(tuple(grupo))
+    return minimos
+
+
+class IndiceSimilitud:
+    """Bloques en memoria: (conjunto de claves, valores) -> {fp_id}."""
+
+    def __init__(self, max_bloque: int = FP_BLOQUE_MAX):
+        self.max_bloque = max_bloque
+        self._lock = threading.Lock()
+        self._politica = None
+        self._conjuntos = []
+        self._senales = {}  # fp_id -> señales
+        self._claves = {}   # fp_id -> claves de bloque
+        self._bloques = {}
+
+    def _claves_bloque(self, senales: dict) -> list:
+        claves = []
+        for i, conjunto in enumerate(self._conjuntos):
+            valores = tuple(senales.get(c) for c in conjunto)
+            if None not in valores:
+                claves.append((i, valores))
+        return claves
+
+    def _anadir(self, fp_id: str, senales: dict):
+        claves = self._claves_bloque(senales)
+        self._senales[fp_id] = senales
+        self._claves[fp_id] = claves
+        for clave in claves:
+            self._bloques.setdefault(clave, set()).add(fp_id)
+
+    def _reiniciar(self, politica: dict):
+        self._politica = {"checks": dict(politica.get("checks", {})),
+                          "confidence_levels": dict(politica.get("confidence_levels", {}))}
+        umbral = int(self._politica["confidence_levels"].get("MEDIUM", 50))
+        self._conjuntos = subconjuntos_minimos(self._politica["checks"], max(1, umbral))
+        self._senales, self._claves, self._bloques = {}, {}, {}
+
+    def sincronizar(self, manifiesto: dict, politica: dict = None):
+        """
+        Añade los fingerprints del manifiesto que aún no están indexados.
+        Reconstruye el índice si ha cambiado la política (pesos o umbrales).
+        """
+        politica = politica or load_fingerprint_policy()
+        with self._lock:
+            if (self._politica is None
+                    or self._politica["checks"] != politica.get("checks", {})
+                    or self._politica["confidence_levels"] != politica.get("confidence_levels", {})):
+                self._reiniciar(politica)
+            for fp_id, entrada in manifiesto.items():
+                if fp_id not in self._senales and entrada.get("senales") is not None:
+                    self._anadir(fp_id, entrada["senales"])
+
+    def sincronizado(self) -> bool:
+        """True si el índice ya se ha sincronizado con el manifiesto en este proceso."""
+        return self._politica is not None
+
+    def anadir(self, fp_id: str, senales: dict):
+        """Indexa (o re-indexa) un fingerprint; sin efecto hasta la primera sincronización."""
+        with self._lock:
+            if self._politica is None:
+                return
+            for clave in self._claves.get(fp_id, ()):
+                self._bloques.get(clave, set()).discard(fp_id)
+            self._anadir(fp_id, senales)
+
+    def candidatos(self, fp_id: str) -> set:
+        resultado = set()
+        for clave in self._claves.get(fp_id, ()):
+            bloque = self._bloques.get(clave, ())
+            if len(bloque) <= self.max_bloque:
+                resultado.update(bloque)
+        resultado.discard(fp_id)
+        return resultado
+
+    def similares(self, fp_id: str, k: int = FP_SIMILARES) -> list:
+        """Los k fingerprints más parecidos a fp_id (score >= MEDIUM), de mayor a menor (k=None: todos)."""
+        with self._lock:
+            senales = self._senales.get(fp_id)
+            if senales is None:
+                return []
+            puntuados = [{"fingerprint_id": otro, **puntuar(senales, self._senales[otro], self._politica)}
+                         for otro in self.candidatos(fp_id)]
+        puntuados.sort(key=lambda r: (-r["score"], r["fingerprint_id"]))
+        return puntuados[:k]
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            tamanos = [len(b) for b in self._bloques.values()]
+            conjuntos = [list(c) for c in self._conjuntos]
+        return {
+            "fingerprints": len(self._senales),
+            "conjuntos": conjuntos,
+            "bloques": len(tamanos),
+            "bloque_maximo": max(tamanos, default=0),
+            "bloques_ignorados": sum(1 for n in tamanos if n > self.max_bloque),
+        }
+
+
+INDICE_SIMILITUD = IndiceSimilitud()
+
+
+def similares(manifiesto: dict, fp_id: str, k: int = FP_SIMILARES) -> list:
+    """Atajo: sincroniza el índice del proceso con el manifiesto y consulta."""
+    INDICE_SIMILITUD.sincronizar(manifiesto)
+    return INDICE_SIMILITUD.similares(fp_id, k)
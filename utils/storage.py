@@ -0,0 +1,1346 @@
+# utils/storage.py
+"""
+Backends de almacenamiento para las tablas calientes de FARO-CEI:
+- eventos          (eventos.csv)
+- login_attempts   (login_attempts.csv)
+- balizas_eventos: vista sobre eventos (las visitas a balizas son filas
+  de eventos con baliza = "True"; cada visita se escribe una sola vez)
+
+Backends disponibles:
+- SqliteBackend (por defecto): data/faro.db en modo WAL, con índices
+  sobre timestamp, origen, ip, fingerprint_id y usuario.
+- CsvBackend: los CSV originales (modo compatible, sin índices).
+
+Se selecciona con la variable de entorno FARO_STORAGE_BACKEND ("sqlite" | "csv").
+Todas las filas se devuelven como dict con los mismos nombres de columna
+que los CSV, de modo que el resto de módulos no depende del backend.
+
+Los filtros son dict {campo: valor} (igualdad) o {campo: [v1, v2]} (IN).
+
+Vistas: una tabla con "vista" en TABLAS se lee, escribe, actualiza y
+borra con la misma API, pero sus filas viven en la tabla física con la
+marca de la vista (añadir a la vista añade la fila marcada). En SQLite
+sus "indices" son índices parciales de la tabla física. La copia física
+anterior (tabla SQLite o CSV propio) se fusiona una vez al abrir el backend.
+
+Paginación: paginar() usa cursores (keyset) sobre (timestamp, clave), de
+modo que cualquier página cuesta O(tamaño de página) en SQLite.
+
+Estado derivado: leer_estado() / leer_estado_clave() / modificar_estado() /
+reemplazar_estado() / estado_inicializado()
+guardan agregados incrementales (dict JSON por clave) agrupados por
+"espacio", p.ej. el comportamiento por fingerprint.
+
+Varios procesos (workers de gunicorn): SQLite serializa las escrituras
+con BEGIN IMMEDIATE; CsvBackend toma un flock por fichero al añadir o
+reescribir (utils/bloqueo.py). El estado derivado de CsvBackend es de
+cada proceso: con varios workers, usar SQLite.
+"""
+
+import io
+import os
+import csv
+import json
+import sqlite3
+import threading
+from collections import deque
+
+from . import (
+    EVENTOS_CSV, BALIZAS_EVENTOS_CSV, LOGINS_FILE,
+    STORAGE_BACKEND, STORAGE_DB
+)
+from .event_store import ultimo_id_csv, tail_csv, IndiceCsv
+from .bloqueo import bloqueo_fichero
+
+# ---------------------------
+# Esquema de tablas
+# ---------------------------
+# Las columnas nuevas se añaden siempre al final: los ficheros y bases de
+# datos existentes se migran al abrirlos (cabecera CSV / ALTER TABLE).
+EVENTO_FIELDS = [
+    "id_num", "timestamp", "ip", "tipo", "evento", "origen",
+    "payload", "so", "navegador", "user_agent",
+    "country", "country_code", "region", "city", "lat", "lon", "isp",
+    "ip_local", "hostname_local", "fingerprint_id", "flag_tor", "flag_vpn",
+    "asn", "baliza"
+]
+
+LOGIN_FIELDS = [
+    "id_num", "id", "timestamp", "ip", "usuario_introducido",
+    "password_introducido", "user_agent", "os", "navegador", "resultado",
+    "country", "country_code", "region", "city", "lat", "lon", "isp",
+    "ip_local", "hostname_local"
+]
+
+# Índices compuestos (filtro, timestamp): sirven para filtrar y ordenar a la vez.
+# "distintos": campos con lista de valores (y conteo) mantenida al escribir.
+# "busqueda": campos con índice secundario también en CSV y en el archivo
+#             Parquet (búsqueda puntual de un valor sin recorrer la tabla).
+TABLAS = {
+    "eventos": {
+        "csv": EVENTOS_CSV,
+        "campos": EVENTO_FIELDS,
+        "indices": [
+            ("timestamp",), ("id_num",),
+            ("origen", "timestamp"), ("ip", "timestamp"),
+            ("evento", "timestamp"), ("fingerprint_id", "timestamp"),
+        ],
+        "distintos": ("ip", "evento", "origen", "baliza"),
+        "busqueda": ("fingerprint_id",),
+    },
+    # Visitas a balizas: filas de eventos con baliza = "True". "csv" es el
+    # fichero de antes de la unificación (se fusiona en eventos); al
+    # fusionar, los campos "fusion" de esa copia prevalecen (solo esa copia
+    # recibía el fingerprint y los datos del navegador). Solo el orden por
+    # timestamp tiene índice parcial propio: los filtros por origen, ip o
+    # fingerprint_id usan los índices de eventos.
+    "balizas_eventos": {
+        "vista": {"tabla": "eventos", "campo": "baliza", "valor": "True"},
+        "csv": BALIZAS_EVENTOS_CSV,
+        "campos": EVENTO_FIELDS,
+        "indices": [("timestamp",)],
+        "busqueda": ("fingerprint_id",),
+        "fusion": ("fingerprint_id", "so", "navegador", "ip_local", "hostname_local"),
+    },
+    "login_attempts": {
+        "csv": LOGINS_FILE,
+        "campos": LOGIN_FIELDS,
+        "privada": True,  # contiene contraseñas introducidas: permisos 0600
+        "indices": [
+            ("timestamp",), ("id_num",),
+            ("usuario_introducido", "timestamp"), ("ip", "timestamp"),
+        ],
+        "distintos": ("ip", "usuario_introducido"),
+    },
+}
+
+
+# Tablas con almacenamiento propio (las vistas viven en su tabla física)
+TABLAS_FISICAS = tuple(t for t, cfg in TABLAS.items() if "vista" not in cfg)
+
+
+def es_vista(tabla: str) -> bool:
+    return "vista" in TABLAS[tabla]
+
+
+def tabla_fisica(tabla: str) -> str:
+    """Tabla donde se guardan las filas de `tabla` (ella misma si no es vista)."""
+    vista = TABLAS[tabla].get("vista")
+    return vista["tabla"] if vista else tabla
+
+
+def en_vista(vista: str, fila: dict) -> bool:
+    """True si una fila de la tabla física pertenece a la vista."""
+    marca = TABLAS[vista]["vista"]
+    return _a_texto(fila.get(marca["campo"])) == marca["valor"]
+
+
+def vistas_de(tabla: str) -> list:
+    """Vistas cuyas filas se guardan en la tabla física `tabla`."""
+    return [v for v, cfg in TABLAS.items() if cfg.get("vista", {}).get("tabla") == tabla]
+
+
+def en_alguna_vista(tabla: str, fila: dict) -> bool:
+    """True si una fila de la tabla física pertenece a alguna de sus vistas."""
+    return any(en_vista(v, fila) for v in vistas_de(tabla))
+
+
+def _filtros_vista(tabla: str, filtros: dict = None):
+    """(tabla física, filtros con la marca de la vista)."""
+    vista = TABLAS[tabla].get("vista")
+    if not vista:
+        return tabla, filtros
+    return vista["tabla"], {**(filtros or {}), vista["campo"]: vista["valor"]}
+
+
+def _marcar(tabla: str, filas):
+    """(tabla física, filas con la marca de la vista)."""
+    vista = TABLAS[tabla].get("vista")
+    if not vista:
+        return tabla, filas
+    return vista["tabla"], ({**fila, vista["campo"]: vista["valor"]} for fila in filas)
+
+
+def _fila_fusionada(vista: str, fila: dict, copia: dict) -> dict:
+    """
+    Fila de la tabla física completada con la copia antigua de la vista:
+    en los campos "fusion" prevalece la copia, en el resto la fila.
+    """
+    cfg = TABLAS[vista]
+    nueva = dict(fila)
+    for c in cfg["campos"]:
+        preferida, otra = fila.get(c) or "", copia.get(c) or ""
+        if c in cfg.get("fusion", ()):
+            preferida, otra = otra, preferida
+        nueva[c] = preferida or otra
+    nueva[cfg["vista"]["campo"]] = cfg["vista"]["valor"]
+    return nueva
+
+
+def _a_texto(valor) -> str:
+    """Serializa un valor igual que csv.writer (None -> "", True -> "True")."""
+    if valor is None:
+        return ""
+    return str(valor)
+
+
+def _fila_normalizada(tabla: str, fila: dict) -> dict:
+    return {c: _a_texto(fila.get(c)) for c in TABLAS[tabla]["campos"]}
+
+
+def _cumple(fila: dict, filtros: dict, desde, hasta=None) -> bool:
+    for campo, valor in (filtros or {}).items():
+        if isinstance(valor, (list, tuple, set)):
+            if fila.get(campo) not in {_a_texto(v) for v in valor}:
+                return False
+        elif fila.get(campo) != _a_texto(valor):
+            return False
+    if desde and (fila.get("timestamp") or "") < desde:
+        return False
+    if hasta and not ("" < (fila.get("timestamp") or "") < hasta):
+        return False
+    return True
+
+
+def _cursor(timestamp: str, clave) -> str:
+    """Cursor opaco de paginación: posición (timestamp, clave) de una fila."""
+    return f"{timestamp or ''}|{clave}"
+
+
+def _leer_cursor(cursor: str):
+    """Devuelve (timestamp, clave) o None si el cursor no es válido."""
+    try:
+        timestamp, clave = cursor.rsplit("|", 1)
+        return timestamp, int(clave)
+    except (AttributeError, ValueError):
+        return None
+
+
+# ---------------------------
+# Backend CSV (compatibilidad)
+# ---------------------------
+class CsvBackend:
+    """
+    Backend sobre los CSV originales.
+    Las consultas recorren el fichero completo (salvo los filtros por campos
+    de "busqueda", que usan un índice de offsets): pensado para despliegues
+    pequeños o para mantener los ficheros legibles con herramientas externas.
+    """
+
+    nombre = "csv"
+    # actualizar_muchos() reescribe el fichero completo: las actualizaciones
+    # en segundo plano se acumulan y se aplican juntas (utils/actualizaciones.py)
+    actualiza_en_sitio = False
+
+    def __init__(self, rutas: dict = None):
+        rutas = rutas or {t: cfg["csv"] for t, cfg in TABLAS.items()}
+        self.rutas = {t: ruta for t, ruta in rutas.items() if not es_vista(t)}
+        self._lock = threading.Lock()
+        # Estado derivado solo en memoria: se reconstruye en cada arranque
+        self._estado = {}
+        self._indices = {
+            tabla: {campo: IndiceCsv(self.rutas[tabla], campo) for campo in TABLAS[tabla].get("busqueda", ())}
+            for tabla in self.rutas
+        }
+        for tabla in self.rutas:
+            self._migrar_cabecera(tabla)
+        for vista, ruta in rutas.items():
+            if es_vista(vista) and tabla_fisica(vista) in self.rutas:
+                self._fusionar_vista(vista, ruta)
+
+    def _migrar_cabecera(self, tabla: str):
+        """Reescribe una vez los CSV creados antes de añadir columnas al esquema."""
+        ruta = self.rutas[tabla]
+        if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+            return
+        with open(ruta, newline="", encoding="utf-8") as f:
+            cabecera = next(csv.reader(f), [])
+        campos = TABLAS[tabla]["campos"]
+        if cabecera != campos and cabecera == campos[:len(cabecera)]:
+            self._reescribir(tabla, lambda fila: fila)
+            print(f"[storage] {ruta}: añadidas las columnas {', '.join(campos[len(cabecera):])}")
+
+    def _fusionar_vista(self, vista: str, ruta: str):
+        """
+        Fusiona el CSV propio de una vista (anterior a la unificación) en su
+        tabla física: las filas ya presentes (mismo id_num y timestamp) se
+        marcan y completan, el resto se añaden marcadas. El CSV antiguo se
+        conserva como <ruta>.fusionado.
+        """
+        if not os.path.exists(ruta):
+            return  # sin CSV antiguo (o ya fusionado): no crear su .lock
+        with bloqueo_fichero(ruta):
+            if not os.path.exists(ruta):
+                return  # otro worker ya lo ha fusionado
+            copias = {}
+            with open(ruta, newline="", encoding="utf-8") as f:
+                for fila in csv.DictReader(f):
+                    copias.setdefault((fila.get("id_num", ""), fila.get("timestamp", "")), []).append(fila)
+
+            def fusionar(fila):
+                pendientes = copias.get((fila.get("id_num", ""), fila.get("timestamp", "")))
+                if not pendientes:
+                    return fila
+                return _fila_fusionada(vista, fila, pendientes.pop(0))
+
+            fusionadas = self._reescribir(tabla_fisica(vista), fusionar)
+            restantes = [fila for pendientes in copias.values() for fila in pendientes]
+            self.append_tablas({vista: restantes})
+            os.replace(ruta, f"{ruta}.fusionado")
+        print(f"[storage] {ruta}: {fusionadas} filas fusionadas y {len(restantes)} añadidas "
+              f"a {self.rutas[tabla_fisica(vista)]}")
+
+    @staticmethod
+    def _serializar(tabla: str, fila: dict) -> bytes:
+        """Fila CSV en bytes, idéntica a la que escribe csv.DictWriter."""
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, fieldnames=TABLAS[tabla]["campos"], extrasaction="ignore").writerow(fila)
+        return buffer.getvalue().encode("utf-8")
+
+    def _escribir_filas(self, f, tabla: str, filas) -> dict:
+        """
+        Escribe filas en `f` (binario) y devuelve {campo: [(valor, offset)]}
+        para los índices de búsqueda de la tabla.
+        """
+        pares = {campo: [] for campo in self._indices[tabla]}
+        for fila in filas:
+            offset = f.tell()
+            f.write(self._serializar(tabla, fila))
+            for campo in pares:
+                pares[campo].append((fila.get(campo) or "", offset))
+        return pares
+
+    def _asegurar_cabecera(self, tabla: str):
+        ruta = self.rutas[tabla]
+        if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(TABLAS[tabla]["campos"])
+            if TABLAS[tabla].get("privada"):
+                try:
+                    os.chmod(ruta, 0o600)
+                except Exception:
+                    pass
+
+    def append(self, tabla: str, fila: dict):
+        self.append_many(tabla, [fila])
+
+    def append_many(self, tabla: str, filas: list):
+        self.append_tablas({tabla: filas})
+
+    def append_tablas(self, filas_por_tabla: dict, durable: bool = False):
+        """Añade {tabla: filas}; durable=True hace fsync de cada fichero al final."""
+        with self._lock:
+            for tabla, filas in filas_por_tabla.items():
+                tabla, filas = _marcar(tabla, filas)
+                # Otros workers escriben el mismo fichero: filas e índice bajo su flock
+                with bloqueo_fichero(self.rutas[tabla]):
+                    self._asegurar_cabecera(tabla)
+                    with open(self.rutas[tabla], "ab") as f:
+                        inicio = f.tell()
+                        pares = self._escribir_filas(f, tabla, (_fila_normalizada(tabla, fila) for fila in filas))
+                        fin = f.tell()
+                        if durable:
+                            f.flush()
+                            os.fsync(f.fileno())
+                    for campo, indice in self._indices[tabla].items():
+                        indice.registrar(pares[campo], inicio, fin)
+
+    def iterar(self, tabla: str, filtros: dict = None, desde: str = None,
+               hasta: str = None, columnas: list = None):
+        tabla, filtros = _filtros_vista(tabla, filtros)
+        ruta = self.rutas[tabla]
+        if not os.path.exists(ruta):
+            return
+        filas = None
+        for campo, indice in self._indices[tabla].items():
+            if campo in (filtros or {}):
+                valor = filtros[campo]
+                valores = valor if isinstance(valor, (list, tuple, set)) else [valor]
+                filas = indice.leer_filas(indice.offsets({_a_texto(v) for v in valores}))
+                break
+        with open(ruta, newline="", encoding="utf-8") as f:
+            for fila in (csv.DictReader(f) if filas is None else filas):
+                if _cumple(fila, filtros, desde, hasta):
+                    yield {c: fila.get(c, "") for c in columnas} if columnas else fila
+
+    def consultar(self, tabla: str, filtros: dict = None, limite: int = None,
+                  offset: int = 0, desc: bool = True, desde: str = None):
+        # Empates de timestamp: orden de escritura (como rowid en SQLite)
+        ordenadas = sorted(enumerate(self.iterar(tabla, filtros, desde)),
+                           key=lambda x: (x[1].get("timestamp", ""), x[0]), reverse=desc)
+        filas = [f for _, f in ordenadas]
+        total = len(filas)
+        fin = None if limite is None else offset + limite
+        return filas[offset:fin], total
+
+    def paginar(self, tabla: str, filtros: dict = None, limite: int = 25,
+                antes: str = None, despues: str = None, ultima: bool = False):
+        """Misma interfaz que SqliteBackend.paginar (aquí la clave es la posición en el CSV)."""
+        todas = sorted(
+            ((f.get("timestamp") or "", i, f) for i, f in enumerate(self.iterar(tabla, filtros))),
+            key=lambda x: (x[0], x[1]), reverse=True
+        )
+        c_antes, c_despues = _leer_cursor(antes), _leer_cursor(despues)
+        if c_antes:
+            inicio = next((k for k, x in enumerate(todas) if x[:2] < c_antes), len(todas))
+            fin = inicio + limite
+        elif c_despues:
+            fin = next((k for k, x in enumerate(todas) if x[:2] <= c_despues), len(todas))
+            inicio = max(0, fin - limite)
+        elif ultima:
+            # Las páginas se cuentan desde la más reciente: la última tiene el resto
+            fin = len(todas)
+            inicio = fin - ((fin - 1) % limite + 1) if fin else 0
+        else:
+            inicio, fin = 0, limite
+
+        pagina = todas[inicio:fin]
+        filas = [f for _, _, f in pagina]
+        cursor_antes = _cursor(*pagina[-1][:2]) if pagina and fin < len(todas) else None
+        cursor_despues = _cursor(*pagina[0][:2]) if pagina and inicio > 0 else None
+        return filas, cursor_antes, cursor_despues
+
+    def ultimas(self, tabla: str, n: int = 25) -> list:
+        """Últimas n filas escritas (la más reciente primero), leyendo solo la cola."""
+        if es_vista(tabla):
+            return list(reversed(deque(self.iterar(tabla), maxlen=n)))
+        return list(reversed(tail_csv(self.rutas[tabla], n)))
+
+    def contar(self, tabla: str, filtros: dict = None, desde: str = None) -> int:
+        return sum(1 for _ in self.iterar(tabla, filtros, desde))
+
+    def contar_por(self, tabla: str, campo: str) -> dict:
+        conteo = {}
+        for fila in self.iterar(tabla):
+            valor = fila.get(campo, "")
+            conteo[valor] = conteo.get(valor, 0) + 1
+        return conteo
+
+    def distintos(self, tabla: str, campo: str) -> list:
+        return sorted(self.contar_por(tabla, campo).keys())
+
+    def max_id(self, tabla: str) -> int:
+        if es_vista(tabla):
+            return max((int(f["id_num"]) for f in self.iterar(tabla, columnas=["id_num"])
+                        if f["id_num"].isdigit()), default=0)
+        return ultimo_id_csv(self.rutas[tabla])
+
+    def _reescribir(self, tabla: str, transformar):
+        """Reescribe el CSV aplicando transformar(fila) -> fila | None."""
+        if es_vista(tabla):
+            # Solo las filas de la vista; el resto de la tabla física no cambia
+            vista, transformar_vista = tabla, transformar
+            tabla = tabla_fisica(vista)
+
+            def transformar(fila):
+                return transformar_vista(fila) if en_vista(vista, fila) else fila
+
+        ruta = self.rutas[tabla]
+        if not os.path.exists(ruta):
+            return 0
+        cambios = 0
+        tmp = f"{ruta}.tmp"
+
+        def transformadas(fin):
+            nonlocal cambios
+            for fila in csv.DictReader(fin):
+                nueva = transformar(fila)
+                if nueva is not fila:
+                    cambios += 1
+                if nueva is not None:
+                    yield nueva
+
+        with self._lock, bloqueo_fichero(ruta):
+            with open(ruta, newline="", encoding="utf-8") as fin, open(tmp, "wb") as fout:
+                cabecera = io.StringIO()
+                csv.writer(cabecera).writerow(TABLAS[tabla]["campos"])
+                fout.write(cabecera.getvalue().encode("utf-8"))
+                pares = self._escribir_filas(fout, tabla, transformadas(fin))
+            os.replace(tmp, ruta)
+            # Los offsets cambian al reescribir: regenerar los índices
+            for campo, indice in self._indices[tabla].items():
+                indice.reemplazar(pares[campo])
+        return cambios
+
+    def borrar(self, tabla: str, id_num, conservar_vistas: bool = False) -> int:
+        """
+        Borra la fila con ese id_num. conservar_vistas=True no borra las
+        filas que pertenecen a una vista de la tabla.
+        """
+        objetivo = _a_texto(id_num)
+
+        def borrar(f):
+            if f.get("id_num") != objetivo or (conservar_vistas and en_alguna_vista(tabla, f)):
+                return f
+            return None
+
+        return self._reescribir(tabla, borrar)
+
+    def borrar_anteriores(self, tabla: str, hasta: str) -> int:
+        """Borra las filas con timestamp anterior a `hasta` (archivado)."""
+        return self._reescribir(tabla, lambda f: None if _cumple(f, None, None, hasta) else f)
+
+    def actualizar(self, tabla: str, id_num, cambios: dict) -> int:
+        return len(self.actualizar_muchos(tabla, {id_num: cambios}))
+
+    def actualizar_muchos(self, tabla: str, cambios_por_id: dict) -> list:
+        """Aplica {id_num: cambios} en una sola reescritura. Devuelve las filas actualizadas."""
+        objetivos = {_a_texto(i): c for i, c in cambios_por_id.items()}
+        actualizadas = []
+
+        def aplicar(fila):
+            cambios = objetivos.get(fila.get("id_num"))
+            if cambios is None:
+                return fila
+            nueva = dict(fila)
+            nueva.update({k: _a_texto(v) for k, v in cambios.items() if k in TABLAS[tabla]["campos"]})
+            actualizadas.append(nueva)
+            return nueva
+
+        if objetivos:
+            self._reescribir(tabla, aplicar)
+        return actualizadas
+
+    def actualizar_por_valor(self, tabla: str, campo: str, cambios_por_valor: dict) -> int:
+        """
+        Aplica {valor: cambios} a todas las filas cuyo `campo` tiene ese valor,
+        en una sola reescritura. Devuelve el número de filas modificadas.
+        """
+        objetivos = {
+            _a_texto(v): {k: _a_texto(x) for k, x in c.items() if k in TABLAS[tabla]["campos"]}
+            for v, c in cambios_por_valor.items()
+        }
+
+        def aplicar(fila):
+            cambios = objetivos.get(fila.get(campo))
+            if not cambios or all(fila.get(k) == x for k, x in cambios.items()):
+                return fila
+            nueva = dict(fila)
+            nueva.update(cambios)
+            return nueva
+
+        return self._reescribir(tabla, aplicar) if objetivos else 0
+
+    def vaciar(self, tabla: str, conservar_vistas: bool = False):
+        """
+        Borra todas las filas. conservar_vistas=True deja las que
+        pertenecen a una vista de la tabla.
+        """
+        if es_vista(tabla):
+            self._reescribir(tabla, lambda fila: None)
+            return
+        if conservar_vistas and vistas_de(tabla):
+            self._reescribir(tabla, lambda fila: fila if en_alguna_vista(tabla, fila) else None)
+            return
+        with self._lock, bloqueo_fichero(self.rutas[tabla]):
+            with open(self.rutas[tabla], "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(TABLAS[tabla]["campos"])
+            for indice in self._indices[tabla].values():
+                indice.reemplazar([])
+
+    # ---------- estado derivado ----------
+    def leer_estado(self, espacio: str):
+        with self._lock:
+            valores = self._estado.get(espacio)
+            return None if valores is None else dict(valores)
+
+    def estado_inicializado(self, espacio: str) -> bool:
+        with self._lock:
+            return espacio in self._estado
+
+    def leer_estado_clave(self, espacio: str, clave: str):
+        with self._lock:
+            valores = self._estado.get(espacio)
+            return None if valores is None else valores.get(clave)
+
+    def modificar_estado(self, espacio: str, clave: str, modificar):
+        with self._lock:
+            valores = self._estado.get(espacio)
+            if valores is None:
+                return None
+            nuevo = modificar(valores.get(clave))
+            if nuevo is not None:
+                valores[clave] = nuevo
+            return nuevo
+
+    def reemplazar_estado(self, espacio: str, valores: dict):
+        with self._lock:
+            self._estado[espacio] = dict(valores)
+
+
+# ---------------------------
+# Backend SQLite (por defecto)
+# ---------------------------
+class SqliteBackend:
+    """
+    Backend SQLite embebido.
+
+    - Una conexión por hilo y proceso (gunicorn/threads), creada de forma
+      perezosa: un worker nunca usa la conexión heredada del proceso que
+      hizo fork() (p.ej. con --preload).
+    - WAL + synchronous=NORMAL: lectores no bloquean al escritor.
+    - Tabla `contadores` con el total de filas por tabla, actualizada en la
+      misma transacción que cada escritura (COUNT(*) sin recorrer la tabla).
+    - Tabla `valores` con los valores distintos (y su conteo) de los campos
+      "distintos" de cada tabla, mantenida igual: los desplegables de filtros
+      y los conteos por valor no recorren la tabla.
+    - En la primera inicialización importa los CSV existentes (una sola vez).
+    """
+
+    nombre = "sqlite"
+    actualiza_en_sitio = True
+
+    def __init__(self, db_path: str = STORAGE_DB, importar_csv: bool = True):
+        self.db_path = db_path
+        self.importar_csv = importar_csv
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._inicializado = False
+
+    # ---------- conexión ----------
+    def _conexion(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            nueva = not os.path.exists(self.db_path)
+            con = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            if nueva:
+                # La base de datos incluye login_attempts (contraseñas introducidas)
+                try:
+                    os.chmod(self.db_path, 0o600)
+                except Exception:
+                    pass
+            con.row_factory = sqlite3.Row
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("PRAGMA busy_timeout=30000")
+            self._local.con = con
+            self._local.pid = os.getpid()
+            self._inicializar(con)
+        return con
+
+    def _inicializar(self, con: sqlite3.Connection):
+        with self._init_lock:
+            if self._inicializado:
+                return
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                for tabla in TABLAS_FISICAS:
+                    cfg = TABLAS[tabla]
+                    columnas = ", ".join(
+                        f'"{c}" INTEGER' if c == "id_num" else f'"{c}" TEXT'
+                        for c in cfg["campos"]
+                    )
+                    con.execute(f'CREATE TABLE IF NOT EXISTS "{tabla}" ({columnas})')
+                    existentes = {f["name"] for f in con.execute(f'PRAGMA table_info("{tabla}")')}
+                    for c in cfg["campos"]:
+                        if c not in existentes:
+                            con.execute(f'ALTER TABLE "{tabla}" ADD COLUMN "{c}" TEXT')
+                    for cols in cfg["indices"]:
+                        nombre = f"idx_{tabla}_{'_'.join(cols)}"
+                        lista = ", ".join(f'"{c}"' for c in cols)
+                        con.execute(f'CREATE INDEX IF NOT EXISTS "{nombre}" ON "{tabla}" ({lista})')
+
+                con.execute("CREATE TABLE IF NOT EXISTS contadores (tabla TEXT PRIMARY KEY, n INTEGER NOT NULL)")
+                con.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS valores (tabla TEXT, campo TEXT, valor TEXT, "
+                    "n INTEGER NOT NULL, PRIMARY KEY (tabla, campo, valor))"
+                )
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS estado (espacio TEXT, clave TEXT, valor TEXT NOT NULL, "
+                    "PRIMARY KEY (espacio, clave))"
+                )
+                for tabla in TABLAS_FISICAS:
+                    con.execute("INSERT OR IGNORE INTO contadores (tabla, n) VALUES (?, 0)", (tabla,))
+
+                # Bases de datos anteriores a la tabla `valores`: reconstruir una vez
+                if not con.execute("SELECT valor FROM meta WHERE clave = 'valores'").fetchone():
+                    _reconstruir_valores(con)
+                    con.execute("INSERT INTO meta (clave, valor) VALUES ('valores', '1')")
+
+                importado = con.execute("SELECT valor FROM meta WHERE clave = 'csv_importado'").fetchone()
+                if self.importar_csv and not importado:
+                    for tabla in TABLAS_FISICAS:
+                        n = _importar_filas(con, tabla, _leer_csv(TABLAS[tabla]["csv"]))
+                        if n:
+                            print(f"[storage] Importadas {n} filas de {TABLAS[tabla]['csv']} a SQLite")
+
+                for vista, cfg in TABLAS.items():
+                    if es_vista(vista):
+                        _migrar_vista(con, vista, desde_csv=self.importar_csv and not importado)
+                        _crear_indices_vista(con, vista)
+                if self.importar_csv and not importado:
+                    _marcar_importado(con)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+
+            self.optimizar(con)
+            self._inicializado = True
+
+    def optimizar(self, con: sqlite3.Connection = None):
+        """
+        Actualiza estadísticas aproximadas para que el planificador elija el
+        índice más selectivo en filtros combinados (coste acotado por analysis_limit).
+        """
+        con = con or self._conexion()
+        con.execute("PRAGMA analysis_limit=1000")
+        con.execute("ANALYZE")
+
+    # ---------- escritura ----------
+    def append(self, tabla: str, fila: dict):
+        self.append_many(tabla, [fila])
+
+    def append_many(self, tabla: str, filas: list):
+        self.append_tablas({tabla: filas})
+
+    def append_tablas(self, filas_por_tabla: dict, durable: bool = False):
+        """
+        Añade {tabla: filas} en una sola transacción. durable=True la
+        confirma con synchronous=FULL (un fsync del WAL para todo el lote).
+        """
+        con = self._conexion()
+        if durable:
+            con.execute("PRAGMA synchronous=FULL")
+        try:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                for tabla, filas in filas_por_tabla.items():
+                    _importar_filas(con, tabla, filas)
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+        finally:
+            if durable:
+                con.execute("PRAGMA synchronous=NORMAL")
+
+    def _borrar_donde(self, tabla: str, where: str, valores: list) -> int:
+        tabla = tabla_fisica(tabla)  # `where` ya trae la condición de la vista
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            conteo = _contar_valores(con, tabla, where, valores)
+            n = con.execute(f'DELETE FROM "{tabla}"{where}', valores).rowcount
+            con.execute("UPDATE contadores SET n = n - ? WHERE tabla = ?", (n, tabla))
+            _aplicar_valores(con, tabla, {k: -v for k, v in conteo.items()})
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return n
+
+    def borrar(self, tabla: str, id_num, conservar_vistas: bool = False) -> int:
+        """
+        Borra la fila con ese id_num. conservar_vistas=True no borra las
+        filas que pertenecen a una vista de la tabla.
+        """
+        where, valores = self._where({"id_num": id_num}, tabla=tabla, conservar_vistas=conservar_vistas)
+        return self._borrar_donde(tabla, where, valores)
+
+    def borrar_anteriores(self, tabla: str, hasta: str) -> int:
+        """Borra las filas con timestamp anterior a `hasta` (archivado)."""
+        where, valores = self._where(None, hasta=hasta, tabla=tabla)
+        return self._borrar_donde(tabla, where, valores)
+
+    def actualizar(self, tabla: str, id_num, cambios: dict) -> int:
+        return len(self.actualizar_muchos(tabla, {id_num: cambios}))
+
+    def actualizar_muchos(self, tabla: str, cambios_por_id: dict) -> list:
+        """Aplica {id_num: cambios} en una transacción. Devuelve las filas actualizadas."""
+        fisica, de_vista = tabla_fisica(tabla), _y_vista(tabla)
+        con = self._conexion()
+        actualizadas = []
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            deltas = {}
+            for id_num, cambios in cambios_por_id.items():
+                campos = [c for c in cambios if c in TABLAS[tabla]["campos"] and c != "id_num"]
+                if not campos:
+                    continue
+                seguidos = [c for c in campos if c in _distintos(fisica)]
+                if seguidos:
+                    # Mover el conteo del valor anterior al nuevo
+                    lista = ", ".join(f'"{c}"' for c in seguidos)
+                    for fila in con.execute(f'SELECT {lista} FROM "{fisica}" WHERE id_num = ?{de_vista}', (id_num,)):
+                        for c in seguidos:
+                            for clave, d in (((c, fila[c] or ""), -1), ((c, _a_texto(cambios[c])), 1)):
+                                deltas[clave] = deltas.get(clave, 0) + d
+                asignaciones = ", ".join(f'"{c}" = ?' for c in campos)
+                valores = [_a_texto(cambios[c]) for c in campos] + [id_num]
+                con.execute(f'UPDATE "{fisica}" SET {asignaciones} WHERE id_num = ?{de_vista}', valores)
+                actualizadas.extend(
+                    dict(f) for f in con.execute(f'SELECT * FROM "{fisica}" WHERE id_num = ?{de_vista}', (id_num,))
+                )
+            _aplicar_valores(con, fisica, deltas)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return actualizadas
+
+    def actualizar_por_valor(self, tabla: str, campo: str, cambios_por_valor: dict) -> int:
+        """
+        Aplica {valor: cambios} a todas las filas cuyo `campo` tiene ese valor,
+        en una transacción (un UPDATE por valor, sobre el índice del campo).
+        Devuelve el número de filas modificadas.
+        """
+        fisica, de_vista = tabla_fisica(tabla), _y_vista(tabla)
+        con = self._conexion()
+        modificadas = 0
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            deltas = {}
+            for valor, cambios in cambios_por_valor.items():
+                campos = [c for c in cambios if c in TABLAS[tabla]["campos"] and c != "id_num"]
+                if not campos:
+                    continue
+                nuevos = [_a_texto(cambios[c]) for c in campos]
+                # Solo las filas que cambian (rowcount exacto y sin escrituras inútiles)
+                where = f'"{campo}" = ?{de_vista} AND (' + " OR ".join(f'"{c}" IS NOT ?' for c in campos) + ")"
+                valores_where = [_a_texto(valor)] + nuevos
+                for c in (c for c in campos if c in _distintos(fisica)):
+                    for anterior, n in con.execute(
+                        f'SELECT "{c}", COUNT(*) FROM "{fisica}" WHERE {where} GROUP BY "{c}"', valores_where
+                    ):
+                        for clave, d in (((c, anterior or ""), -n), ((c, _a_texto(cambios[c])), n)):
+                            deltas[clave] = deltas.get(clave, 0) + d
+                asignaciones = ", ".join(f'"{c}" = ?' for c in campos)
+                modificadas += con.execute(
+                    f'UPDATE "{fisica}" SET {asignaciones} WHERE {where}', nuevos + valores_where
+                ).rowcount
+            _aplicar_valores(con, fisica, deltas)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return modificadas
+
+    def vaciar(self, tabla: str, conservar_vistas: bool = False):
+        """
+        Borra todas las filas. conservar_vistas=True deja las que
+        pertenecen a una vista de la tabla.
+        """
+        if es_vista(tabla) or (conservar_vistas and vistas_de(tabla)):
+            self._borrar_donde(tabla, *self._where(None, tabla=tabla, conservar_vistas=conservar_vistas))
+            return
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            _vaciar(con, tabla)
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    # ---------- estado derivado ----------
+    def leer_estado(self, espacio: str):
+        """Devuelve {clave: dict} del espacio, o None si nunca se ha inicializado."""
+        con = self._conexion()
+        if not con.execute("SELECT 1 FROM meta WHERE clave = ?", (f"estado:{espacio}",)).fetchone():
+            return None
+        cursor = con.execute("SELECT clave, valor FROM estado WHERE espacio = ?", (espacio,))
+        return {f["clave"]: json.loads(f["valor"]) for f in cursor}
+
+    def estado_inicializado(self, espacio: str) -> bool:
+        """True si el espacio ya se ha creado con reemplazar_estado()."""
+        return self._conexion().execute(
+            "SELECT 1 FROM meta WHERE clave = ?", (f"estado:{espacio}",)
+        ).fetchone() is not None
+
+    def leer_estado_clave(self, espacio: str, clave: str):
+        """Valor de una clave del espacio (None si no existe)."""
+        fila = self._conexion().execute(
+            "SELECT valor FROM estado WHERE espacio = ? AND clave = ?", (espacio, clave)
+        ).fetchone()
+        return json.loads(fila["valor"]) if fila else None
+
+    def modificar_estado(self, espacio: str, clave: str, modificar):
+        """
+        Lee-modifica-escribe una clave de forma atómica (entre procesos):
+        modificar(valor_actual | None) -> nuevo valor (None: no escribir).
+        No hace nada (devuelve None) si el espacio no está inicializado.
+        """
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if not con.execute("SELECT 1 FROM meta WHERE clave = ?", (f"estado:{espacio}",)).fetchone():
+                con.execute("COMMIT")
+                return None
+            fila = con.execute("SELECT valor FROM estado WHERE espacio = ? AND clave = ?", (espacio, clave)).fetchone()
+            nuevo = modificar(json.loads(fila["valor"]) if fila else None)
+            if nuevo is not None:
+                con.execute(
+                    "INSERT OR REPLACE INTO estado (espacio, clave, valor) VALUES (?, ?, ?)",
+                    (espacio, clave, json.dumps(nuevo, ensure_ascii=False))
+                )
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+        return nuevo
+
+    def reemplazar_estado(self, espacio: str, valores: dict):
+        """Sustituye todo el espacio (reconstrucción) y lo marca como inicializado."""
+        con = self._conexion()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            con.execute("DELETE FROM estado WHERE espacio = ?", (espacio,))
+            con.executemany(
+                "INSERT INTO estado (espacio, clave, valor) VALUES (?, ?, ?)",
+                [(espacio, k, json.dumps(v, ensure_ascii=False)) for k, v in valores.items()]
+            )
+            con.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, '1')", (f"estado:{espacio}",))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+
+    # ---------- lectura ----------
+    @staticmethod
+    def _where(filtros: dict, desde: str = None, hasta: str = None, tabla: str = None,
+               conservar_vistas: bool = False):
+        condiciones, valores = [], []
+        if tabla and es_vista(tabla):
+            condiciones.append(_condicion_vista(tabla))
+        elif tabla and conservar_vistas:
+            condiciones.extend(_fuera_de_vista(v) for v in vistas_de(tabla))
+        for campo, valor in (filtros or {}).items():
+            if isinstance(valor, (list, tuple, set)):
+                # Filtro IN: lista de valores admitidos (vacía => sin resultados)
+                valor = list(valor)
+                if not valor:
+                    condiciones.append("0")
+                    continue
+                condiciones.append(f'"{campo}" IN ({", ".join("?" for _ in valor)})')
+                valores.extend(_a_texto(v) for v in valor)
+                continue
+            condiciones.append(f'"{campo}" = ?')
+            valores.append(valor if campo == "id_num" else _a_texto(valor))
+        if desde:
+            condiciones.append('"timestamp" >= ?')
+            valores.append(desde)
+        if hasta:
+            # Las filas sin timestamp nunca se consideran antiguas
+            condiciones.append('"timestamp" < ? AND "timestamp" != \'\'')
+            valores.append(hasta)
+        sql = (" WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        return sql, valores
+
+    def iterar(self, tabla: str, filtros: dict = None, desde: str = None,
+               hasta: str = None, columnas: list = None):
+        where, valores = self._where(filtros, desde, hasta, tabla)
+        seleccion = ", ".join(f'"{c}"' for c in columnas) if columnas else "*"
+        cursor = self._conexion().execute(
+            f'SELECT {seleccion} FROM "{tabla_fisica(tabla)}"{where} ORDER BY rowid', valores
+        )
+        for fila in cursor:
+            yield dict(fila)
+
+    def consultar(self, tabla: str, filtros: dict = None, limite: int = None,
+                  offset: int = 0, desc: bool = True, desde: str = None):
+        where, valores = self._where(filtros, desde, tabla=tabla)
+        orden = "DESC" if desc else "ASC"
+        sql = f'SELECT * FROM "{tabla_fisica(tabla)}"{where} ORDER BY "timestamp" {orden}, rowid {orden}'
+        if limite is not None:
+            sql += " LIMIT ? OFFSET ?"
+            valores = valores + [limite, offset]
+        con = self._conexion()
+        filas = [dict(f) for f in con.execute(sql, valores)]
+        total = self.contar(tabla, filtros, desde)
+        return filas, total
+
+    def paginar(self, tabla: str, filtros: dict = None, limite: int = 25,
+                antes: str = None, despues: str = None, ultima: bool = False):
+        """
+        Paginación por cursor (keyset) en orden timestamp descendente.
+
+        - sin cursor: página más reciente
+        - antes=cursor: filas más antiguas que el cursor (página siguiente)
+        - despues=cursor: filas más recientes que el cursor (página anterior)
+        - ultima=True: última página (las filas más antiguas); como las
+          páginas se cuentan desde la más reciente, tiene total % limite
+          filas (o limite si la división es exacta)
+
+        Recorre solo limite + 1 filas del índice (filtro, timestamp) + rowid,
+        sin OFFSET: el coste no depende de la página.
+        Devuelve (filas, cursor_antes, cursor_despues); un cursor es None
+        cuando no hay más filas en esa dirección.
+        """
+        where, valores = self._where(filtros, tabla=tabla)
+        c_antes, c_despues = _leer_cursor(antes), _leer_cursor(despues)
+        cursor = c_despues or c_antes
+        ascendente = bool(c_despues) or (ultima and not c_antes)
+        if ultima and not cursor:
+            limite = (self.contar(tabla, filtros) - 1) % limite + 1
+        if cursor:
+            operador = ">" if c_despues else "<"
+            where += (" AND " if where else " WHERE ") + f'("timestamp", rowid) {operador} (?, ?)'
+            valores = valores + list(cursor)
+
+        orden = "ASC" if ascendente else "DESC"
+        sql = (f'SELECT rowid AS _clave, * FROM "{tabla_fisica(tabla)}"{where} '
+               f'ORDER BY "timestamp" {orden}, rowid {orden} LIMIT ?')
+        filas = [dict(f) for f in self._conexion().execute(sql, valores + [limite + 1])]
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        if ascendente:
+            filas.reverse()
+
+        mas_antiguas = bool(c_despues) if ascendente else hay_mas
+        mas_recientes = hay_mas if ascendente else bool(c_antes)
+        claves = [(f.get("timestamp"), f.pop("_clave")) for f in filas]
+        cursor_antes = _cursor(*claves[-1]) if filas and mas_antiguas else None
+        cursor_despues = _cursor(*claves[0]) if filas and mas_recientes else None
+        return filas, cursor_antes, cursor_despues
+
+    def ultimas(self, tabla: str, n: int = 25) -> list:
+        """Últimas n filas escritas (la más reciente primero)."""
+        where, valores = self._where(None, tabla=tabla)
+        cursor = self._conexion().execute(
+            f'SELECT * FROM "{tabla_fisica(tabla)}"{where} ORDER BY rowid DESC LIMIT ?', valores + [n]
+        )
+        return [dict(f) for f in cursor]
+
+    def contar(self, tabla: str, filtros: dict = None, desde: str = None) -> int:
+        if es_vista(tabla):
+            if not filtros and not desde:
+                # Total de la vista: conteo de su marca en `valores`
+                return self.contar(*_filtros_vista(tabla))
+            where, valores = self._where(filtros, desde, tabla=tabla)
+            return self._conexion().execute(
+                f'SELECT COUNT(*) FROM "{tabla_fisica(tabla)}"{where}', valores
+            ).fetchone()[0]
+        con = self._conexion()
+        if not filtros and not desde:
+            fila = con.execute("SELECT n FROM contadores WHERE tabla = ?", (tabla,)).fetchone()
+            return fila["n"] if fila else 0
+        if filtros and len(filtros) == 1 and not desde:
+            (campo, valor), = filtros.items()
+            if campo in _distintos(tabla) and not isinstance(valor, (list, tuple, set)):
+                fila = con.execute(
+                    "SELECT n FROM valores WHERE tabla = ? AND campo = ? AND valor = ?",
+                    (tabla, campo, _a_texto(valor))
+                ).fetchone()
+                return fila["n"] if fila else 0
+        where, valores = self._where(filtros, desde)
+        return con.execute(f'SELECT COUNT(*) FROM "{tabla}"{where}', valores).fetchone()[0]
+
+    def contar_por(self, tabla: str, campo: str) -> dict:
+        con = self._conexion()
+        if campo in _distintos(tabla):
+            cursor = con.execute("SELECT valor, n FROM valores WHERE tabla = ? AND campo = ?", (tabla, campo))
+            return {f["valor"]: f["n"] for f in cursor}
+        where, valores = self._where(None, tabla=tabla)
+        conteo = _contar_valores(con, tabla_fisica(tabla), where, valores, [campo])
+        return {v: n for (_, v), n in conteo.items()}
+
+    def distintos(self, tabla: str, campo: str) -> list:
+        con = self._conexion()
+        if campo in _distintos(tabla):
+            cursor = con.execute(
+                "SELECT valor FROM valores WHERE tabla = ? AND campo = ? ORDER BY valor", (tabla, campo)
+            )
+            return [f[0] for f in cursor]
+        where, valores = self._where(None, tabla=tabla)
+        cursor = con.execute(
+            f'SELECT DISTINCT "{campo}" FROM "{tabla_fisica(tabla)}"{where} ORDER BY "{campo}"', valores
+        )
+        return [f[0] or "" for f in cursor]
+
+    def max_id(self, tabla: str) -> int:
+        # Solo IDs numéricos (las visitas a balizas admiten uuid heredados)
+        fila = self._conexion().execute(
+            f"SELECT MAX(id_num) FROM \"{tabla_fisica(tabla)}\" WHERE typeof(id_num) = 'integer'{_y_vista(tabla)}"
+        ).fetchone()
+        return int(fila[0] or 0)
+
+
+# ---------------------------
+# Importación / exportación CSV
+# ---------------------------
+def _leer_csv(ruta: str):
+    if not os.path.exists(ruta):
+        return
+    with open(ruta, newline="", encoding="utf-8") as f:
+        for fila in csv.DictReader(f):
+            yield fila
+
+
+def _marcar_importado(con: sqlite3.Connection):
+    con.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES ('csv_importado', '1')")
+
+
+def _importar_filas(con: sqlite3.Connection, tabla: str, filas, lote: int = 5000) -> int:
+    """Inserta filas en lotes dentro de la transacción abierta. Devuelve el total."""
+    tabla, filas = _marcar(tabla, filas)
+    campos = TABLAS[tabla]["campos"]
+    columnas = ", ".join(f'"{c}"' for c in campos)
+    marcas = ", ".join("?" for _ in campos)
+    sql = f'INSERT INTO "{tabla}" ({columnas}) VALUES ({marcas})'
+    distintos = _distintos(tabla)
+    conteo = {}
+
+    def valores(fila):
+        fila = _fila_normalizada(tabla, fila)
+        for c in distintos:
+            conteo[(c, fila[c])] = conteo.get((c, fila[c]), 0) + 1
+        id_num = fila["id_num"]
+        fila["id_num"] = int(id_num) if id_num.isdigit() else id_num
+        return [fila[c] for c in campos]
+
+    total = 0
+    buffer = []
+    for fila in filas:
+        buffer.append(valores(fila))
+        if len(buffer) >= lote:
+            con.executemany(sql, buffer)
+            total += len(buffer)
+            buffer = []
+    if buffer:
+        con.executemany(sql, buffer)
+        total += len(buffer)
+
+    if total:
+        con.execute("UPDATE contadores SET n = n + ? WHERE tabla = ?", (total, tabla))
+        _aplicar_valores(con, tabla, conteo)
+    return total
+
+
+# ---------------------------
+# Valores distintos (tabla `valores`)
+# ---------------------------
+def _distintos(tabla: str) -> tuple:
+    return TABLAS[tabla].get("distintos", ())
+
+
+def _contar_valores(con: sqlite3.Connection, tabla: str, where: str, valores: list,
+                    campos=None) -> dict:
+    """Conteo {(campo, valor): n} de las filas que cumplen `where`."""
+    conteo = {}
+    for campo in campos or _distintos(tabla):
+        cursor = con.execute(f'SELECT "{campo}", COUNT(*) FROM "{tabla}"{where} GROUP BY "{campo}"', valores)
+        for valor, n in cursor:
+            clave = (campo, valor or "")
+            conteo[clave] = conteo.get(clave, 0) + n
+    return conteo
+
+
+def _aplicar_valores(con: sqlite3.Connection, tabla: str, deltas: dict):
+    """Suma {(campo, valor): delta} a `valores`; elimina los valores que quedan a 0."""
+    filas = [(tabla, campo, valor, n) for (campo, valor), n in deltas.items() if n]
+    if not filas:
+        return
+    con.executemany(
+        "INSERT INTO valores (tabla, campo, valor, n) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (tabla, campo, valor) DO UPDATE SET n = n + excluded.n",
+        filas
+    )
+    con.executemany(
+        "DELETE FROM valores WHERE tabla = ? AND campo = ? AND valor = ? AND n <= 0",
+        [f[:3] for f in filas if f[3] < 0]
+    )
+
+
+def _reconstruir_valores(con: sqlite3.Connection):
+    con.execute("DELETE FROM valores")
+    for tabla in TABLAS_FISICAS:
+        _aplicar_valores(con, tabla, _contar_valores(con, tabla, "", []))
+
+
+def _vaciar(con: sqlite3.Connection, tabla: str):
+    """Vacía una tabla y sus contadores (dentro de la transacción abierta)."""
+    con.execute(f'DELETE FROM "{tabla}"')
+    con.execute("UPDATE contadores SET n = 0 WHERE tabla = ?", (tabla,))
+    con.execute("DELETE FROM valores WHERE tabla = ?", (tabla,))
+
+
+# ---------------------------
+# Vistas
+# ---------------------------
+def _condicion_vista(tabla: str) -> str:
+    """
+    Condición SQL de la marca de una vista ("" si es una tabla física).
+    Va como literal, no como parámetro: así el planificador puede usar los
+    índices parciales de la vista.
+    """
+    vista = TABLAS[tabla].get("vista")
+    if not vista:
+        return ""
+    valor = vista["valor"].replace("'", "''")
+    return f""""{vista['campo']}" = '{valor}'"""
+
+
+def _fuera_de_vista(vista: str) -> str:
+    """Condición SQL de las filas de la tabla física que no están en la vista."""
+    marca = TABLAS[vista]["vista"]
+    valor = marca["valor"].replace("'", "''")
+    return f""""{marca['campo']}" IS NOT '{valor}'"""
+
+
+def _y_vista(tabla: str) -> str:
+    condicion = _condicion_vista(tabla)
+    return f" AND {condicion}" if condicion else ""
+
+
+def _crear_indices_vista(con: sqlite3.Connection, vista: str):
+    """Los "indices" de una vista: índices parciales de su tabla física."""
+    fisica, condicion = tabla_fisica(vista), _condicion_vista(vista)
+    for cols in TABLAS[vista]["indices"]:
+        nombre = f"idx_{fisica}_{vista}_{'_'.join(cols)}"
+        lista = ", ".join(f'"{c}"' for c in cols)
+        con.execute(f'CREATE INDEX IF NOT EXISTS "{nombre}" ON "{fisica}" ({lista}) WHERE {condicion}')
+
+
+def _recontar(con: sqlite3.Connection, tabla: str):
+    """Recalcula contadores y `valores` de una tabla física."""
+    con.execute(f'UPDATE contadores SET n = (SELECT COUNT(*) FROM "{tabla}") WHERE tabla = ?', (tabla,))
+    con.execute("DELETE FROM valores WHERE tabla = ?", (tabla,))
+    _aplicar_valores(con, tabla, _contar_valores(con, tabla, "", []))
+
+
+def _fusionar_vista_sql(con: sqlite3.Connection, vista: str, origen: str) -> int:
+    """
+    Fusiona en la tabla física las filas de la tabla `origen` (copia
+    antigua de la vista): las que ya están (mismo id_num y timestamp) se
+    completan y marcan, el resto se insertan marcadas. Devuelve las filas
+    de `origen`.
+    """
+    cfg = TABLAS[vista]
+    fisica, marca = tabla_fisica(vista), cfg["vista"]
+    columnas = [f["name"] for f in con.execute(f'PRAGMA table_info("{origen}")')
+                if f["name"] in cfg["campos"] and f["name"] != marca["campo"]]
+    asignaciones = []
+    for c in columnas:
+        if c in ("id_num", "timestamp"):
+            continue
+        preferida, otra = f'"{fisica}"."{c}"', f'o."{c}"'
+        if c in cfg.get("fusion", ()):
+            preferida, otra = otra, preferida
+        asignaciones.append(f'"{c}" = COALESCE(NULLIF({preferida}, \'\'), {otra})')
+    asignaciones.append(f'"{marca["campo"]}" = ?')
+    con.execute(
+        f'UPDATE "{fisica}" SET {", ".join(asignaciones)} FROM "{origen}" AS o '
+        f'WHERE o.id_num = "{fisica}".id_num AND o."timestamp" = "{fisica}"."timestamp"',
+        (marca["valor"],)
+    )
+    lista = ", ".join(f'"{c}"' for c in columnas)
+    seleccion = ", ".join(f'COALESCE(o."{c}", \'\')' for c in columnas)
+    con.execute(
+        f'INSERT INTO "{fisica}" ({lista}, "{marca["campo"]}") SELECT {seleccion}, ? FROM "{origen}" AS o '
+        f'WHERE NOT EXISTS (SELECT 1 FROM "{fisica}" AS e '
+        f'WHERE e.id_num = o.id_num AND e."timestamp" = o."timestamp")',
+        (marca["valor"],)
+    )
+    _recontar(con, fisica)
+    return con.execute(f'SELECT COUNT(*) FROM "{origen}"').fetchone()[0]
+
+
+def _fusionar_csv_vista(con: sqlite3.Connection, vista: str, ruta: str) -> int:
+    """_fusionar_vista_sql() desde un CSV, a través de una tabla temporal."""
+    campos = TABLAS[vista]["campos"]
+    columnas = ", ".join(f'"{c}" INTEGER' if c == "id_num" else f'"{c}" TEXT' for c in campos)
+    con.execute("DROP TABLE IF EXISTS temp._vista_origen")
+    con.execute(f"CREATE TEMP TABLE _vista_origen ({columnas})")
+    try:
+        con.executemany(
+            f'INSERT INTO _vista_origen VALUES ({", ".join("?" for _ in campos)})',
+            ([_fila_normalizada(vista, f)[c] for c in campos] for f in _leer_csv(ruta))
+        )
+        return _fusionar_vista_sql(con, vista, "_vista_origen")
+    finally:
+        con.execute("DROP TABLE temp._vista_origen")
+
+
+def _migrar_vista(con: sqlite3.Connection, vista: str, desde_csv: bool):
+    """
+    Una vez por base de datos: fusiona la copia física anterior de la vista
+    (tabla propia o, en la primera importación, su CSV) en la tabla física
+    y elimina sus contadores.
+    """
+    clave = f"vista:{vista}"
+    if con.execute("SELECT 1 FROM meta WHERE clave = ?", (clave,)).fetchone():
+        return
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (vista,)).fetchone():
+        n = _fusionar_vista_sql(con, vista, vista)
+        con.execute(f'DROP TABLE "{vista}"')
+        print(f"[storage] Fusionadas {n} filas de la tabla {vista} en {tabla_fisica(vista)}")
+    elif desde_csv and os.path.exists(TABLAS[vista]["csv"]):
+        n = _fusionar_csv_vista(con, vista, TABLAS[vista]["csv"])
+        print(f"[storage] Fusionadas {n} filas de {TABLAS[vista]['csv']} en {tabla_fisica(vista)}")
+    con.execute("DELETE FROM contadores WHERE tabla = ?", (vista,))
+    con.execute("DELETE FROM valores WHERE tabla = ?", (vista,))
+    con.execute("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, '1')", (clave,))
+
+
+def importar_csv(backend: SqliteBackend, tabla: str, ruta: str = None, reemplazar: bool = False) -> int:
+    """
+    Importa un CSV completo a la tabla SQLite indicada. En una vista, las
+    filas que ya están en la tabla física (mismo id_num y timestamp) se
+    fusionan en vez de duplicarse.
+    """
+    ruta = ruta or TABLAS[tabla]["csv"]
+    if reemplazar and es_vista(tabla):
+        backend.vaciar(tabla)
+    con = backend._conexion()
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        if es_vista(tabla):
+            n = _fusionar_csv_vista(con, tabla, ruta)
+        else:
+            if reemplazar:
+                _vaciar(con, tabla)
+            n = _importar_filas(con, tabla, _leer_csv(ruta))
+        _marcar_importado(con)
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    backend.optimizar()
+    return n
+
+
+def exportar_csv(backend, tabla: str, ruta: str = None) -> int:
+    """Vuelca una tabla del backend a CSV (mismo formato que los ficheros originales)."""
+    ruta = ruta or TABLAS[tabla]["csv"]
+    campos = TABLAS[tabla]["campos"]
+    tmp = f"{ruta}.tmp"
+    n = 0
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=campos, extrasaction="ignore")
+        writer.writeheader()
+        for fila in backend.iterar(tabla):
+            writer.writerow(_fila_normalizada(tabla, fila))
+            n += 1
+    os.replace(tmp, ruta)
+    return n
+
+
+# ---------------------------
+# Backend activo
+# ---------------------------
+_BACKEND = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_backend():
+    """Devuelve el backend configurado (singleton por proceso)."""
+    global _BACKEND
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                if STORAGE_BACKEND == "csv":
+                    _BACKEND = CsvBackend()
+                else:
+                    _BACKEND = SqliteBackend()
+    return _BACKEND
+
+
+def set_backend(backend):
+    """Sustituye el backend activo (herramientas y benchmarks)."""
+    global _BACKEND
+    with _BACKEND_LOCK:
+        _BACKEND = backend
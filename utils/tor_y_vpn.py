@@ -1,14 +1,14 @@
-# routes/tor_y_vpn.py
+# utils/tor_y_vpn.py
+import os
+import socket
+import bisect
+import threading
 import requests
 import time
 import ipaddress
 
-TOR_CACHE = {
-    "ips": set(),
-    "ts": 0
-}
-TOR_TTL = 3600  # 1 hora
-TOR_EXIT_NODES = set()
+from . import TOR_EXITS_FILE, TOR_EXITS_URL, TOR_REFRESCO
+from .rangos_ip import clasificar_ip
 
 VPN_KEYWORDS = (
     "amazon", "aws", "google", "azure", "ovh",
@@ -27,29 +27,190 @@ def looks_like_vpn(isp: str) -> bool:
     return any(k in isp.lower() for k in VPN_KEYWORDS)
 
 
-def load_tor_exits():
-    print("*** LLEGO A load_tor_exits ***")
+# ---------------------------
+# Nodos de salida TOR
+# ---------------------------
+TOR_COMPROBACION = 60  # segundos entre comprobaciones del hilo de refresco
+
+
+def _empaquetar(ip: str):
+    """Dirección en bytes de red (4 o 16) o None si no es una IP."""
+    try:
+        return socket.inet_pton(socket.AF_INET, ip)
+    except OSError:
+        pass
+    try:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    except OSError:
+        return None
 
-    now = time.time()
-    if now - TOR_CACHE["ts"] < TOR_TTL:
-        return TOR_CACHE["ips"]
 
+def _parsear_salidas(texto: str) -> list:
+    """
+    IPs de salida de un exit-addresses de torproject ("ExitAddress ip fecha")
+    o de una lista con una IP por línea. Devuelve las direcciones empaquetadas,
+    ordenadas y sin duplicados.
+    """
     ips = set()
-    r = requests.get("https://check.torproject.org/exit-addresses", timeout=10)
-    for line in r.text.splitlines():
-        if line.startswith("ExitAddress"):
-            ips.add(line.split()[1])
+    for linea in texto.splitlines():
+        partes = linea.split()
+        if not partes or partes[0].startswith("#"):
+            continue
+        ip = partes[1] if partes[0] == "ExitAddress" and len(partes) > 1 else partes[0]
+        empaquetada = _empaquetar(ip)
+        if empaquetada is not None:
+            ips.add(empaquetada)
+    return sorted(ips)
+
+
+class ListaTor:
+    """
+    Conjunto de nodos de salida TOR para consultas por IP.
+
+    Las IPs se guardan empaquetadas en orden de red (bytes de 4 o 16: el
+    entero de la dirección), en una lista ordenada: pertenencia por búsqueda
+    binaria, sin objetos ipaddress ni un set de cadenas por worker.
+
+    Se carga desde la copia local (ruta) en la primera consulta. En cada
+    proceso (también en los workers creados por fork) un hilo en segundo
+    plano la recarga si otro proceso la actualiza y la descarga de `url`
+    cuando tiene más de `refresco` segundos. La lista nueva sustituye a la anterior de una sola
+    asignación, así que ninguna consulta espera a la red.
+    """
+
+    def __init__(self, ruta: str = TOR_EXITS_FILE, url: str = TOR_EXITS_URL,
+                 refresco: int = TOR_REFRESCO):
+        self.ruta = ruta
+        self.url = url
+        self.refresco = refresco
+        self._ips = []
+        self._firma = None  # st_mtime_ns de la copia cargada
+        self._lock = threading.Lock()
+        self._activa = False  # copia cargada e hilo de refresco en este proceso
+        self._siguiente_descarga = 0
+        # Los workers creados por fork heredan la lista pero no el hilo
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._tras_fork)
+
+    def _tras_fork(self):
+        self._lock = threading.Lock()
+        self._activa = False
+
+    def _arrancar(self):
+        with self._lock:
+            if self._activa:
+                return
+            self.cargar()
+            if self.refresco > 0:
+                threading.Thread(target=self._refrescar, name="lista-tor", daemon=True).start()
+            self._activa = True
+
+    def contiene(self, ip: str) -> bool:
+        # Camino caliente (cada hit de baliza): sin os.getpid() ni ipaddress
+        if not self._activa:
+            self._arrancar()
+        ips = self._ips  # la recarga sustituye la lista entera
+        try:
+            empaquetada = socket.inet_pton(socket.AF_INET, ip)
+        except OSError:
+            try:
+                empaquetada = socket.inet_pton(socket.AF_INET6, ip)
+            except OSError:
+                return False
+        i = bisect.bisect_left(ips, empaquetada)
+        return i < len(ips) and ips[i] == empaquetada
+
+    def cargar(self) -> bool:
+        """Carga la copia local si ha cambiado. True si se ha recargado."""
+        try:
+            firma = os.stat(self.ruta).st_mtime_ns
+        except OSError:
+            return False
+        if firma == self._firma:
+            return False
+        with open(self.ruta, "r", encoding="utf-8", errors="replace") as f:
+            ips = _parsear_salidas(f.read())
+        self._ips, self._firma = ips, firma
+        return True
+
+    def descargar(self, timeout: float = 10) -> int:
+        """Descarga la lista de `url`, la guarda como copia local y la carga."""
+        r = requests.get(self.url, timeout=timeout)
+        r.raise_for_status()
+        ips = _parsear_salidas(r.text)
+        if not ips:
+            raise ValueError("lista TOR vacía")
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        tmp = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(r.text)
+        os.replace(tmp, self.ruta)
+        self.cargar()
+        return len(ips)
+
+    def antiguedad(self) -> float:
+        """Segundos desde la última actualización de la copia local (inf si no hay)."""
+        try:
+            return time.time() - os.path.getmtime(self.ruta)
+        except OSError:
+            return float("inf")
 
-    TOR_CACHE["ips"] = ips
-    TOR_CACHE["ts"] = now
-    return ips
+    def _refrescar(self):
+        while True:
+            try:
+                self.cargar()  # otro worker ha podido descargarla ya
+                if self.url and self.antiguedad() >= self.refresco and time.time() >= self._siguiente_descarga:
+                    # Si falla, no se reintenta en cada comprobación
+                    self._siguiente_descarga = time.time() + min(self.refresco, 600)
+                    n = self.descargar()
+                    print(f"[tor] Lista de nodos de salida actualizada: {n} IPs")
+            except Exception as e:
+                print(f"[tor] Error actualizando la lista de nodos de salida: {e}")
+            time.sleep(min(TOR_COMPROBACION, self.refresco))
+
+    def ips(self) -> set:
+        """IPs de la lista actual como cadenas."""
+        return {socket.inet_ntop(socket.AF_INET if len(ip) == 4 else socket.AF_INET6, ip)
+                for ip in self._ips}
+
+    def __len__(self):
+        return len(self._ips)
+
+
+LISTA_TOR = ListaTor()
+
+
+def load_tor_exits():
+    """IPs de salida TOR conocidas (copia local, sin esperar a la descarga)."""
+    if not LISTA_TOR._activa:
+        LISTA_TOR._arrancar()
+    return LISTA_TOR.ips()
 
 
 def is_tor(ip: str) -> bool:
-    print("*** LLEGO A IS_TOR ***")
-    return ip in load_tor_exits()
+    return LISTA_TOR.contiene(ip)
+
+def isp_es_vpn(org: str) -> bool:
+    """True si la organización / ISP corresponde a VPN, hosting o cloud."""
+    org_upper = (org or "").upper()
+    return any(k in org_upper for k in VPN_ASN_KEYWORDS)
+
 
-def analyze_ip(ip: str) -> dict:
+def flags_ip(ip: str, isp: str = "") -> tuple:
+    """
+    (TOR, VPN) de una IP con los mismos criterios que analyze_ip(), sin
+    geolocalizar: `isp` es el ya conocido. Para recalcular eventos en bloque.
+    """
+    try:
+        ip_obj = ipaddress.ip_address(ip)
+    except ValueError:
+        return False, False
+    if ip_obj.is_private or ip_obj.is_loopback:
+        return False, False
+    return is_tor(ip), clasificar_ip(ip) is not None or isp_es_vpn(isp)
+
+
+def analyze_ip(ip: str, geo: dict = None) -> dict:
     print("*** LLEGO A ANALYZE_IP ***")
     print(ip)
     """
@@ -57,6 +218,13 @@ def analyze_ip(ip: str) -> dict:
     - TOR
     - VPN
     - ASN / Organización (si se dispone)
+
+    `geo` permite pasar una geolocalización ya conocida (p.ej. de caché)
+    y evita consultar geo_lookup(); con geo={} no se consulta nada y la
+    detección por ISP queda pendiente del enriquecimiento en segundo plano.
+
+    Las IPs de los rangos de data/rangos (cloud / hosting / VPN) se marcan
+    como VPN sin necesidad de geolocalización.
     """
 
     result = {
@@ -64,7 +232,9 @@ def analyze_ip(ip: str) -> dict:
         "TOR": False,
         "VPN": False,
         "asn": "",
-        "org": ""
+        "org": "",
+        "proveedor": "",
+        "categoria": ""
     }
 
 
@@ -81,18 +251,27 @@ def analyze_ip(ip: str) -> dict:
     # ---------------------------
     # Detección TOR (básica)
     # ---------------------------
-    if ip in TOR_EXIT_NODES:
+    if is_tor(ip):
         result["TOR"] = True
 
+    # ---------------------------
+    # Detección VPN / Hosting
+    # (por rangos de proveedores)
+    # ---------------------------
+    rango = clasificar_ip(ip)
+    if rango is not None:
+        result["VPN"] = True
+        result["proveedor"] = rango["proveedor"]
+        result["categoria"] = rango["categoria"]
+
     # ---------------------------
     # Detección VPN / Hosting
     # (por ASN / organización)
     # ---------------------------
-    # Si ya tienes geoip / ASN en otro módulo,
-    # aquí es donde debes integrarlo.
     try:
-        from utils.geoip import geo_lookup
-        geo = geo_lookup(ip)
+        if geo is None:
+            from utils.geoip import geo_lookup
+            geo = geo_lookup(ip)
 
         asn = geo.get("asn", "")
         org = geo.get("isp", "")
@@ -100,8 +279,7 @@ def analyze_ip(ip: str) -> dict:
         result["asn"] = asn
         result["org"] = org
 
-        org_upper = org.upper()
-        if any(k in org_upper for k in VPN_ASN_KEYWORDS):
+        if isp_es_vpn(org):
             result["VPN"] = True
 
     except Exception:
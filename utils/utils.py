@@ -1,11 +1,14 @@
 # utils/utils.py
 """
-Funciones de soporte para IPs, User-Agent, timestamps y colores.
+Funciones de soporte para IPs, User-Agent, timestamps, colores y paginación.
 """
 from datetime import datetime, timezone, timedelta
+from urllib.parse import urlencode
 from flask import request
 import re
-import socket
+
+from . import DNS_ESPERA
+from .dns_inverso import RESOLVEDOR_DNS
 
 
 def parse_user_agent(ua: str):
@@ -245,13 +248,53 @@ def calcular_texto(color_hex: str) -> str:
     return "#000000" if lum>0.6 else "#ffffff"
 
 
-def obtener_ip_hostname():
+def obtener_ip_hostname(espera: float = None):
     """
     Devuelve diccionario con IP y hostname del cliente.
+
+    El DNS inverso no bloquea la petición más de `espera` segundos
+    (FARO_DNS_ESPERA). Si no se ha resuelto, hostname_local queda vacío y
+    hostname_pendiente es True: el evento se completa después con
+    encolar_hostname().
     """
     ip = obtener_ip_real(request) or "Desconocida"
+    hostname, pendiente = RESOLVEDOR_DNS.hostname(ip, DNS_ESPERA if espera is None else espera)
+    return {"hostname_local": hostname, "ip_local": ip, "hostname_pendiente": pendiente}
+
+
+# ---------------------------
+# Paginación por cursor
+# ---------------------------
+def parametros_paginacion():
+    """
+    Lee de la petición los parámetros de paginación por cursor.
+    Devuelve (cursores, pagina): cursores para backend.paginar()
+    y el número de página (solo informativo).
+    """
+    cursores = {
+        "antes": request.args.get("antes") or None,
+        "despues": request.args.get("despues") or None,
+        "ultima": request.args.get("ultima") == "1",
+    }
     try:
-        hostname = socket.gethostbyaddr(ip)[0]
-    except Exception:
-        hostname = "No disponible"
-    return {"hostname_local": hostname, "ip_local": ip}
+        pagina = int(request.args.get("page", 1))
+    except ValueError:
+        pagina = 1
+    return cursores, pagina
+
+
+def enlaces_paginacion(args: dict, pagina: int, total_paginas: int,
+                       cursor_antes: str, cursor_despues: str) -> dict:
+    """
+    URLs de navegación (primera / anterior / siguiente / última) que
+    conservan los filtros actuales (`args`). None si el enlace no aplica.
+    """
+    def url(**extra):
+        return request.path + "?" + urlencode({**args, **extra})
+
+    return {
+        "primera": url() if cursor_despues else None,
+        "anterior": url(despues=cursor_despues, page=pagina - 1) if cursor_despues else None,
+        "siguiente": url(antes=cursor_antes, page=pagina + 1) if cursor_antes else None,
+        "ultima": url(ultima=1, page=total_paginas) if cursor_antes else None,
+    }
@@ -13,7 +13,7 @@ import json
 from datetime import datetime
 from flask import request, jsonify
 
-from utils.eventos import cargar_eventos, guardar_evento, siguiente_id
+from utils.eventos import guardar_evento, siguiente_id
 from utils.balizas import existe_baliza, guardar_evento_baliza
 from utils.utils import obtener_ip_hostname, obtener_ip_real, parse_user_agent
 from utils.geoip import geo_lookup
@@ -40,10 +40,7 @@ def procesar_webhook():
     """
     print("[DEBUG] procesar_webhook FUNCTION <-- llamada")  # <-- print inicial
 
-    # 1. Cargar eventos existentes
-    eventos = cargar_eventos()
-
-    # 2. Capturar datos del request
+    # 1. Capturar datos del request
     if request.method == "POST":
         data = request.get_json(silent=True) or request.form.to_dict()
     else:
@@ -79,7 +76,7 @@ def procesar_webhook():
 
     # 8. Construir evento normalizado
     nuevo_evento = {
-        "id_num": siguiente_id(eventos),
+        "id_num": siguiente_id(),
         "timestamp": datetime.utcnow().replace(microsecond=0).isoformat()+"Z",
         "ip": ip_real,
         "tipo": tipo_val,